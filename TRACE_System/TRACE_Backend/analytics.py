@@ -0,0 +1,166 @@
+import os
+import sys
+import datetime
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/trace_db")
+
+COUNTERS_ID = "analytics"
+COUNTER_FIELDS = ("totalUsers", "students", "clinicians", "admins", "totalAnalyses", "hairOnly", "flagged")
+CLINICIAN_ROLES = ["Doctor", "Clinician"]
+FLAGGED_RESULT = "Malignant (Cancerous)"
+HAIR_ONLY_STATUS = "hair_processed_only"
+
+
+def _count_if(expression):
+    return {"$sum": {"$cond": [expression, 1, 0]}}
+
+
+def _single_group(collection, group):
+    # One pass over the collection computes every count at once.
+    rows = list(collection.aggregate([{"$group": dict({"_id": None}, **group)}]))
+    return rows[0] if rows else {}
+
+
+def compute_analytics(db):
+    """Recompute all admin counters from scratch, one aggregation per collection."""
+    users = _single_group(db["users"], {
+        "totalUsers": {"$sum": 1},
+        "students": _count_if({"$eq": ["$role", "Student"]}),
+        "clinicians": _count_if({"$in": ["$role", CLINICIAN_ROLES]}),
+    })
+    admins = _single_group(db["admins"], {"admins": {"$sum": 1}})
+    analyses = _single_group(db["analyses"], {
+        "totalAnalyses": {"$sum": 1},
+        "hairOnly": _count_if({"$eq": ["$status", HAIR_ONLY_STATUS]}),
+        "flagged": _count_if({"$eq": ["$result", FLAGGED_RESULT]}),
+    })
+
+    merged = {}
+    for part in (users, admins, analyses):
+        merged.update(part)
+    return {field: int(merged.get(field, 0)) for field in COUNTER_FIELDS}
+
+
+def user_summary_pipeline(user_id, recent_limit, recent_projection=None):
+    """Aggregation computing per-user dashboard counts plus the most recent scans."""
+    recent_pipeline = [{"$sort": {"created_at": -1, "_id": -1}}, {"$limit": recent_limit}]
+    if recent_projection:
+        recent_pipeline.append({"$project": recent_projection})
+
+    return [
+        {"$match": {"user_id": user_id}},
+        {"$facet": {
+            "counts": [{"$group": {
+                "_id": None,
+                "totalScans": {"$sum": 1},
+                "preprocessed": _count_if({"$eq": ["$status", HAIR_ONLY_STATUS]}),
+                "flagged": _count_if({"$eq": ["$result", FLAGGED_RESULT]}),
+                "pending": _count_if({"$eq": ["$status", "pending"]}),
+            }}],
+            "recent": recent_pipeline,
+        }},
+    ]
+
+
+def user_summary_from_rows(rows):
+    facets = rows[0] if rows else {"counts": [], "recent": []}
+    counts = facets["counts"][0] if facets["counts"] else {}
+    summary = {field: int(counts.get(field, 0)) for field in ("totalScans", "preprocessed", "flagged", "pending")}
+    summary["recent"] = facets["recent"]
+    return summary
+
+
+def compute_user_summary(db, user_id, recent_limit, recent_projection=None):
+    """Per-user dashboard counts plus the most recent scans in a single aggregation."""
+    rows = list(db["analyses"].aggregate(user_summary_pipeline(user_id, recent_limit, recent_projection)))
+    return user_summary_from_rows(rows)
+
+
+def user_counter_deltas(role, sign=1):
+    return {
+        "totalUsers": sign,
+        "students": sign if role == "Student" else 0,
+        "clinicians": sign if role in CLINICIAN_ROLES else 0,
+    }
+
+
+def analysis_counter_deltas(status, result, sign=1):
+    return {
+        "totalAnalyses": sign,
+        "hairOnly": sign if status == HAIR_ONLY_STATUS else 0,
+        "flagged": sign if result == FLAGGED_RESULT else 0,
+    }
+
+
+def increment_counters(db, deltas):
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    db["counters"].update_one(
+        {"_id": COUNTERS_ID},
+        {"$inc": deltas, "$set": {"updated_at": datetime.datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def read_counters(db):
+    """Return the materialized counters, or None if they have never been reconciled."""
+    return counters_from_doc(db["counters"].find_one({"_id": COUNTERS_ID}))
+
+
+def counters_from_doc(doc):
+    if not doc or "reconciled_at" not in doc:
+        return None
+    return {field: int(doc.get(field, 0)) for field in COUNTER_FIELDS}
+
+
+def reconcile_counters(db):
+    """Overwrite the counters with freshly computed values; returns (counts, drift)."""
+    previous = db["counters"].find_one({"_id": COUNTERS_ID}) or {}
+    counts = compute_analytics(db)
+    now = datetime.datetime.utcnow()
+    db["counters"].update_one(
+        {"_id": COUNTERS_ID},
+        {"$set": dict(counts, updated_at=now, reconciled_at=now)},
+        upsert=True
+    )
+    drift = {
+        field: counts[field] - int(previous.get(field, 0))
+        for field in COUNTER_FIELDS
+        if counts[field] != int(previous.get(field, 0))
+    }
+    return counts, drift
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else "reconcile"
+    if command not in ("reconcile", "show"):
+        print("Usage: python analytics.py [reconcile|show]")
+        return 2
+
+    try:
+        client = MongoClient(MONGO_URI)
+        db = client.get_database()
+
+        if command == "show":
+            print(read_counters(db) or "Counters have not been reconciled yet.")
+            return 0
+
+        print("--- Reconciling Analytics Counters ---")
+        counts, drift = reconcile_counters(db)
+        for field in COUNTER_FIELDS:
+            note = f"  (drift {drift[field]:+d})" if field in drift else ""
+            print(f"{field}: {counts[field]}{note}")
+        print("Success: Counters reconciled.")
+        return 0
+    except Exception as e:
+        print(f"System Error: {str(e)}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
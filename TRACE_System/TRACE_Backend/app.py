@@ -1,39 +1,135 @@
 import os
 import random
-import smtplib
 import datetime
 import base64
+import hmac
+import hashlib
+import json
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import urlencode
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import bcrypt
 import jwt
 import cv2
 import numpy as np
-from email.mime.text import MIMEText
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
 from flask_cors import CORS
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
 from bson.objectid import ObjectId
 from email_validator import validate_email, EmailNotValidError
 from werkzeug.utils import secure_filename
 
-import torch
-import torch.nn as nn
-from torchvision import transforms
-from PIL import Image
+from micro_batcher import MicroBatcher
+from classifier import TorchClassifier, configure_torch_threads, preprocess_for_classifier
+from tiled_inpaint import TiledInpainter
+from batch_uploads import bounded_as_completed, detach_uploads, iter_upload_items
+from hair_backends import (
+    load_hair_backend, model_paths_from_env, resolve_backend_name, normalize_mask, preprocess_for_hair_model, prediction_to_mask
+)
+from inference_worker import (
+    DEFAULT_ADDRESS as DEFAULT_INFERENCE_ADDRESS, InferenceSupervisor, RemoteHairBackend, authkey_from_env,
+    worker_addresses
+)
+from synthetic_images import make_synthetic_dermoscopic_image
+from write_behind import WriteBehindBuffer
+from thumbnails import THUMBNAIL_MIME, ThumbnailCache, encode_thumbnail, fit_within, make_thumbnail, parse_thumbnail_sizes
+from job_queue import JobQueue, JobQueueFull
+from artifact_store import (
+    LocalArtifactStore, GridFSArtifactStore, is_valid_artifact_id, artifact_mime, iter_chunks
+)
+from db_indexes import OTP_TTL_SECONDS, ensure_indexes
+from email_outbox import EmailOutbox, SMTPSettings, send_message_now
+from analytics import (
+    compute_analytics, compute_user_summary, read_counters, reconcile_counters, increment_counters,
+    user_counter_deltas, analysis_counter_deltas
+)
+from metrics import MongoCommandTimer, PROMETHEUS_CONTENT_TYPE, Registry, StageTimings
+from output_formats import (
+    DEFAULT_OUTPUT_SPEC, OUTPUT_SPEC_ARGS, build_multipart, encode_color_image, encode_mask, is_image_mime, parse_output_spec
+)
+from pagination import InvalidCursor, fetch_page, parse_projection
+from result_cache import (
+    HairResultCache, LRUCacheTier, MongoCacheTier, DiskCacheTier, make_cache_key
+)
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor", "Link"])
 
 # Configuration
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/trace_db")
 SECRET_KEY = os.getenv("SECRET_KEY", "secret")
 SMTP_EMAIL = os.getenv("SMTP_EMAIL", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
-
-client = MongoClient(MONGO_URI)
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+# Queue mail in Mongo and send it from a background thread over a reused connection.
+EMAIL_OUTBOX = os.getenv("EMAIL_OUTBOX", "true").lower() == "true"
+# Prometheus text at /metrics (optionally behind METRICS_TOKEN) and Server-Timing headers.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() == "true"
+# Set by gunicorn.conf.py while its master imports this module: background
+# threads are then started per worker in post_fork instead of in the master.
+SERVER_PREFORK = os.getenv("SERVER_PREFORK", "false").lower() == "true"
+# Processes started by multiprocessing (job pool, managed inference workers)
+# re-import this module, as __mp_main__ under `python app.py`, before their
+# initializer runs; they only compute and never start background work.
+MULTIPROCESSING_CHILD = multiprocessing.parent_process() is not None
+# Mail, index builds and model loading at import time belong to the serving process.
+IMPORT_STARTS_BACKGROUND_WORK = not SERVER_PREFORK and not MULTIPROCESSING_CHILD
+
+# Metrics
+metrics_registry = Registry()
+http_request_seconds = metrics_registry.histogram(
+    "trace_http_request_duration_seconds", "HTTP request latency.", ("method", "endpoint", "status")
+)
+predict_stage_seconds = metrics_registry.histogram(
+    "trace_predict_stage_duration_seconds", "Time spent in each prediction stage.", ("stage", "hair_method")
+)
+predict_errors_total = metrics_registry.counter(
+    "trace_predict_errors_total", "Prediction requests that ended in an error response.", ("endpoint", "status")
+)
+hair_cache_requests_total = metrics_registry.counter(
+    "trace_hair_cache_requests_total", "Hair result cache lookups.", ("result",)
+)
+hair_fallbacks_total = metrics_registry.counter(
+    "trace_hair_fallbacks_total", "Hair removals served by the DullRazor fallback.", ("reason",)
+)
+mongo_command_seconds = metrics_registry.histogram(
+    "trace_mongo_command_duration_seconds", "MongoDB command latency.", ("command", "collection", "endpoint")
+)
+mongo_command_failures_total = metrics_registry.counter(
+    "trace_mongo_command_failures_total", "Failed MongoDB commands.", ("command", "collection")
+)
+
+
+def request_endpoint_label():
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def record_mongo_command(command, collection, seconds, failed):
+    in_request = has_request_context()
+    endpoint = request_endpoint_label() if in_request else "background"
+    mongo_command_seconds.observe(seconds, command=command, collection=collection, endpoint=endpoint)
+    if failed:
+        mongo_command_failures_total.inc(command=command, collection=collection)
+    if in_request and "mongo_seconds" in g:
+        g.mongo_seconds += seconds
+
+
+client = MongoClient(
+    MONGO_URI,
+    event_listeners=[MongoCommandTimer(record_mongo_command)] if METRICS_ENABLED else []
+)
 db = client.get_database()
 
 # Collections
@@ -41,7 +137,10 @@ users_collection = db["users"]
 admins_collection = db["admins"]
 pending_collection = db["pending_users"]
 reset_collection = db["password_resets"]
+outbox_collection = db["email_outbox"]
 analyses_collection = db["analyses"]
+jobs_collection = db["jobs"]
+hair_cache_collection = db["hair_result_cache"]
 def load_app_timezone():
     tz_name = os.getenv("APP_TIMEZONE", "Asia/Karachi")
     try:
@@ -53,25 +152,152 @@ def load_app_timezone():
 
 APP_TIMEZONE = load_app_timezone()
 
+smtp_settings = SMTPSettings(
+    SMTP_HOST, SMTP_PORT,
+    username=SMTP_EMAIL, password=SMTP_PASSWORD, sender=SMTP_EMAIL, starttls=SMTP_STARTTLS
+)
+email_outbox = EmailOutbox(outbox_collection, smtp_settings)
+if EMAIL_OUTBOX and IMPORT_STARTS_BACKGROUND_WORK:
+    # Drain anything left queued by a previous run.
+    email_outbox.start()
+
+
+def ensure_indexes_in_background():
+    # Runs off the import path so an unreachable MongoDB cannot stall startup.
+    def run():
+        try:
+            for failure in ensure_indexes(db):
+                print(f"Warning: could not create MongoDB index {failure}")
+        except Exception as e:
+            print(f"Warning: could not ensure MongoDB indexes: {e}")
+
+    threading.Thread(target=run, name="ensure-indexes", daemon=True).start()
+
 # AI Model Configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 MODEL_PATH = 'model/trace_model.pth'
 HAIR_MODEL_PATH = 'model/chimaera_v2_final.h5'
+# keras | onnx | tflite | tflite_int8 | auto (first available of onnx, tflite_int8, tflite, keras)
+HAIR_MODEL_BACKEND = os.getenv("HAIR_MODEL_BACKEND", "keras").lower()
+HAIR_MODEL_PATHS = model_paths_from_env(HAIR_MODEL_PATH)
+HAIR_INTRA_OP_THREADS = int(os.getenv("HAIR_INTRA_OP_THREADS", "0"))
+# inprocess (default) | managed: this process supervises its own inference
+# processes | external: shared pool from `python inference_worker.py serve`.
+HAIR_INFERENCE_MODE = os.getenv("HAIR_INFERENCE_MODE", "inprocess").lower()
+HAIR_INFERENCE_WORKERS = int(os.getenv("HAIR_INFERENCE_WORKERS", "1"))
+HAIR_INFERENCE_ADDRESS = os.getenv("HAIR_INFERENCE_ADDRESS", DEFAULT_INFERENCE_ADDRESS)
+HAIR_INFERENCE_TIMEOUT = float(os.getenv("HAIR_INFERENCE_TIMEOUT", "30"))
+# background: load + warm up in a thread (default); eager: block import; lazy: on first use.
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "background").lower()
+if MULTIPROCESSING_CHILD:
+    MODEL_LOAD_MODE = "lazy"
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+MODEL_READY_TIMEOUT = float(os.getenv("MODEL_READY_TIMEOUT", "60"))
 STRICT_IMAGE_VALIDATION = os.getenv("STRICT_IMAGE_VALIDATION", "false").lower() == "true"
 ALLOW_HAIR_FALLBACK = os.getenv("ALLOW_HAIR_FALLBACK", "false").lower() == "true"
+HAIR_BATCH_MAX_SIZE = int(os.getenv("HAIR_BATCH_MAX_SIZE", "8"))
+HAIR_BATCH_WINDOW_MS = float(os.getenv("HAIR_BATCH_WINDOW_MS", "10"))
+# Lesion classification on the hair-removed image (runs when MODEL_PATH loads).
+CLASSIFICATION_ENABLED = os.getenv("CLASSIFICATION_ENABLED", "true").lower() == "true"
+CLASSIFIER_OPTIMIZE = os.getenv("CLASSIFIER_OPTIMIZE", "torchscript").lower()  # none | torchscript | compile
+CLASSIFIER_THREADS = int(os.getenv("CLASSIFIER_THREADS", "0"))
+CLASSIFIER_INTEROP_THREADS = int(os.getenv("CLASSIFIER_INTEROP_THREADS", "0"))
+CLASSIFIER_BATCH_MAX_SIZE = int(os.getenv("CLASSIFIER_BATCH_MAX_SIZE", "8"))
+CLASSIFIER_BATCH_WINDOW_MS = float(os.getenv("CLASSIFIER_BATCH_WINDOW_MS", "5"))
+LESION_CONFIDENCE_THRESHOLD = float(os.getenv("LESION_CONFIDENCE_THRESHOLD", "0.45"))
+JOB_POOL_WORKERS = int(os.getenv("JOB_POOL_WORKERS", "2"))
+JOB_POOL_MAX_PENDING = int(os.getenv("JOB_POOL_MAX_PENDING", "16"))
+JOB_POOL_START_METHOD = os.getenv("JOB_POOL_START_METHOD", "spawn")
+# Uploads are decoded in memory; set AUDIT_UPLOADS=true to also keep a copy on disk.
+AUDIT_UPLOADS = os.getenv("AUDIT_UPLOADS", "false").lower() == "true"
+HAIR_MASK_THRESHOLD = int(os.getenv("HAIR_MASK_THRESHOLD", "128"))
+# DullRazor speed/quality: the hair mask and inpainting run at a reduced working
+# resolution (longest side in pixels) and are composited back onto the original.
+HAIR_REMOVAL_QUALITY_PRESETS = {"full": None, "balanced": 1024, "fast": 512}
+HAIR_REMOVAL_QUALITY = os.getenv("HAIR_REMOVAL_QUALITY", "full").lower()
+if HAIR_REMOVAL_QUALITY not in HAIR_REMOVAL_QUALITY_PRESETS:
+    print(f"Warning: unknown HAIR_REMOVAL_QUALITY '{HAIR_REMOVAL_QUALITY}'. Using 'full'.")
+    HAIR_REMOVAL_QUALITY = "full"
+DULLRAZOR_KERNEL_SIZE = 17
+# Large frames are inpainted as overlapping tiles across a thread pool (0 = one per core).
+INPAINT_TILE_SIZE = int(os.getenv("INPAINT_TILE_SIZE", "512"))
+INPAINT_TILE_OVERLAP = int(os.getenv("INPAINT_TILE_OVERLAP", "32"))
+INPAINT_THREADS = int(os.getenv("INPAINT_THREADS", "0"))
+INPAINT_TILED_MIN_PIXELS = int(os.getenv("INPAINT_TILED_MIN_PIXELS", "2000000"))
+# POST /predict/batch: images processed concurrently, analyses written per chunk.
+BATCH_PREDICT_WORKERS = int(os.getenv("BATCH_PREDICT_WORKERS", "4"))
+BATCH_PREDICT_CHUNK = int(os.getenv("BATCH_PREDICT_CHUNK", "32"))
+BATCH_PREDICT_MAX_FILES = int(os.getenv("BATCH_PREDICT_MAX_FILES", "500"))
+BATCH_PREDICT_MAX_IMAGE_MB = float(os.getenv("BATCH_PREDICT_MAX_IMAGE_MB", "25"))
+# /predict analyses are appended to a local spill file and inserted in batches by a
+# background thread, so they reach /api/history within about ANALYSIS_WRITE_DELAY_MS.
+ANALYSIS_WRITE_BEHIND = os.getenv("ANALYSIS_WRITE_BEHIND", "true").lower() == "true"
+ANALYSIS_WRITE_BATCH = int(os.getenv("ANALYSIS_WRITE_BATCH", "64"))
+ANALYSIS_WRITE_DELAY_MS = float(os.getenv("ANALYSIS_WRITE_DELAY_MS", "250"))
+ANALYSIS_SPILL_DIR = os.getenv("ANALYSIS_SPILL_DIR", os.path.join("cache", "analysis_spill"))
+ANALYSIS_SPILL_FSYNC = os.getenv("ANALYSIS_SPILL_FSYNC", "false").lower() == "true"
+HAIR_CACHE_ENABLED = os.getenv("HAIR_CACHE_ENABLED", "true").lower() == "true"
+HAIR_CACHE_MEMORY_MB = float(os.getenv("HAIR_CACHE_MEMORY_MB", "64"))
+HAIR_CACHE_PERSISTENT = os.getenv("HAIR_CACHE_PERSISTENT", "none").lower()  # none | mongo | disk
+HAIR_CACHE_PERSISTENT_MB = float(os.getenv("HAIR_CACHE_PERSISTENT_MB", "512"))
+HAIR_CACHE_DIR = os.getenv("HAIR_CACHE_DIR", os.path.join("cache", "hair_results"))
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "local").lower()  # local | gridfs | none
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+ARTIFACT_BASE_URL = os.getenv("ARTIFACT_BASE_URL", "")
+# Artifact and thumbnail URLs are signed with SECRET_KEY and expire after about this long.
+ARTIFACT_URL_TTL = int(os.getenv("ARTIFACT_URL_TTL", "21600"))
+IMAGE_DELIVERY = os.getenv("IMAGE_DELIVERY", "url").lower()  # url | data_url
+# Thumbnails for list views, rendered lazily from artifacts into a bounded disk cache.
+THUMBNAILS_ENABLED = os.getenv("THUMBNAILS_ENABLED", "true").lower() == "true"
+THUMBNAIL_SIZES = parse_thumbnail_sizes(os.getenv("THUMBNAIL_SIZES", "64,128,256")) or (128,)
+THUMBNAIL_LIST_SIZE = int(os.getenv("THUMBNAIL_LIST_SIZE", "128"))
+if THUMBNAIL_LIST_SIZE <= 0:
+    print(f"Warning: THUMBNAIL_LIST_SIZE must be positive, got {THUMBNAIL_LIST_SIZE}. Using 128.")
+    THUMBNAIL_LIST_SIZE = 128
+if THUMBNAIL_LIST_SIZE not in THUMBNAIL_SIZES:
+    # Listings link this size, so the thumbnail route has to accept it.
+    print(f"Warning: THUMBNAIL_LIST_SIZE {THUMBNAIL_LIST_SIZE} is not in THUMBNAIL_SIZES; allowing it.")
+    THUMBNAIL_SIZES = tuple(sorted(THUMBNAIL_SIZES + (THUMBNAIL_LIST_SIZE,)))
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", os.path.join("cache", "thumbnails"))
+THUMBNAIL_CACHE_MB = float(os.getenv("THUMBNAIL_CACHE_MB", "256"))
+HISTORY_PAGE_DEFAULT = int(os.getenv("HISTORY_PAGE_DEFAULT", "50"))
+HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", "200"))
+SUMMARY_RECENT_DEFAULT = 6
+SUMMARY_RECENT_MAX = 50
+ADMIN_ANALYSES_PAGE_DEFAULT = 100
+ADMIN_ANALYSES_PAGE_MAX = 500
+# Maintain a counters document with $inc so /api/admin/analytics is a single read.
+ANALYTICS_COUNTERS = os.getenv("ANALYTICS_COUNTERS", "true").lower() == "true"
+ENSURE_INDEXES_ON_STARTUP = os.getenv("ENSURE_INDEXES_ON_STARTUP", "true").lower() == "true"
+
+if ENSURE_INDEXES_ON_STARTUP and IMPORT_STARTS_BACKGROUND_WORK:
+    ensure_indexes_in_background()
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+if AUDIT_UPLOADS:
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # AI Model Setup
-print("Loading AI Model...")
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# torch/torchvision/TensorFlow are imported inside the loaders so importing this
+# module (tools, worker restarts) stays fast; see load_models().
+device = None
 model = None
+classifier = None
 hair_model = None
 hair_model_backend = "opencv_dullrazor"
 hair_model_error = None
 
+models_ready = threading.Event()
+model_load_lock = threading.Lock()
+model_load_state = {
+    "status": "not_started",
+    "started_at": None,
+    "finished_at": None,
+    "warmup_ms": None,
+    "error": None
+}
+
 CLASSES = ['BCC', 'BKL', 'MEL', 'NV']
 
 CLASS_INFO = {
@@ -81,100 +307,371 @@ CLASS_INFO = {
     'NV': {'name': 'Nevus (Mole)', 'type': 'Benign (Safe)', 'severity': 'Low'}
 }
 
-try:
-    if os.path.exists(MODEL_PATH):
-        loaded_obj = torch.load(MODEL_PATH, map_location=device)
-
-        # Accept only ready-to-run nn.Module objects.
-        if isinstance(loaded_obj, nn.Module):
-            model = loaded_obj.to(device)
-            model.eval()
-            print("Model Loaded Successfully")
-        elif isinstance(loaded_obj, dict) and isinstance(loaded_obj.get("model"), nn.Module):
-            model = loaded_obj["model"].to(device)
-            model.eval()
-            print("Model Loaded Successfully (from checkpoint['model'])")
+
+def load_classification_model():
+    global device, model, classifier
+    import torch
+    import torch.nn as nn
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    configure_torch_threads(CLASSIFIER_THREADS, CLASSIFIER_INTEROP_THREADS)
+
+    try:
+        if os.path.exists(MODEL_PATH):
+            # The file holds a pickled nn.Module, which torch>=2.6 refuses under weights_only.
+            loaded_obj = torch.load(MODEL_PATH, map_location=device, weights_only=False)
+
+            # Accept only ready-to-run nn.Module objects.
+            if isinstance(loaded_obj, nn.Module):
+                model = loaded_obj.to(device)
+                model.eval()
+                print("Model Loaded Successfully")
+            elif isinstance(loaded_obj, dict) and isinstance(loaded_obj.get("model"), nn.Module):
+                model = loaded_obj["model"].to(device)
+                model.eval()
+                print("Model Loaded Successfully (from checkpoint['model'])")
+            else:
+                model = None
+                print(
+                    "Invalid model format: expected torch.nn.Module "
+                    "or checkpoint with key 'model' as nn.Module"
+                )
+        else:
+            print(f"Warning: Model file not found at {MODEL_PATH}")
+            print("System running with prediction disabled until model is available")
+    except Exception as e:
+        model = None
+        print(f"Error Loading Model: {e}")
+
+    if model is not None and CLASSIFICATION_ENABLED:
+        classifier = TorchClassifier(model, device, optimize=CLASSIFIER_OPTIMIZE)
+        print(f"Classifier ready ({classifier.optimization}, {torch.get_num_threads()} intra-op threads)")
+
+
+def connect_hair_inference_workers():
+    """A RemoteHairBackend for HAIR_INFERENCE_MODE=managed or external."""
+    if HAIR_INFERENCE_MODE == "managed":
+        if resolve_backend_name(HAIR_MODEL_BACKEND, HAIR_MODEL_PATHS) is None:
+            # Don't start workers that could only crash-loop.
+            return load_hair_backend(HAIR_MODEL_BACKEND, HAIR_MODEL_PATHS)
+        supervisor = InferenceSupervisor.managed(
+            HAIR_INFERENCE_WORKERS, HAIR_MODEL_BACKEND, HAIR_MODEL_PATHS, HAIR_INTRA_OP_THREADS
+        )
+        supervisor.start()
+        try:
+            return RemoteHairBackend(supervisor.addresses, supervisor.authkey, supervisor, HAIR_INFERENCE_TIMEOUT)
+        except Exception:
+            supervisor.stop()
+            raise
+    if HAIR_INFERENCE_MODE == "external":
+        addresses = worker_addresses(HAIR_INFERENCE_ADDRESS, HAIR_INFERENCE_WORKERS)
+        return RemoteHairBackend(addresses, authkey_from_env(), timeout=HAIR_INFERENCE_TIMEOUT)
+    raise ValueError(f"Unknown HAIR_INFERENCE_MODE '{HAIR_INFERENCE_MODE}'. Choose from: inprocess, managed, external")
+
+
+def load_hair_model():
+    global hair_model, hair_model_backend, hair_model_error
+    try:
+        if HAIR_INFERENCE_MODE == "inprocess":
+            hair_model = load_hair_backend(HAIR_MODEL_BACKEND, HAIR_MODEL_PATHS, HAIR_INTRA_OP_THREADS)
         else:
-            model = None
-            print(
-                "Invalid model format: expected torch.nn.Module "
-                "or checkpoint with key 'model' as nn.Module"
+            hair_model = connect_hair_inference_workers()
+        # Keep every inference process busy: one concurrent batch per process.
+        hair_batcher.set_dispatchers(len(hair_model.addresses) if isinstance(hair_model, RemoteHairBackend) else 1)
+        hair_model_backend = hair_model.name
+        hair_model_error = None
+        print(f"Hair removal model loaded successfully ({hair_model_backend})")
+    except FileNotFoundError as e:
+        hair_model = None
+        print(f"{e}. Fallback enabled.")
+    except ValueError as e:
+        hair_model = None
+        hair_model_backend = "opencv_dullrazor"
+        hair_model_error = str(e)
+        print(f"Error preparing hair-removal model: {e}")
+    except Exception as runtime_error:
+        hair_model = None
+        hair_model_backend = "opencv_dullrazor_fallback"
+        if "No module named" in str(runtime_error):
+            hair_model_error = (
+                f"Runtime for hair model backend '{HAIR_MODEL_BACKEND}' is not installed in current "
+                f"backend environment ({runtime_error}). Using OpenCV fallback."
             )
-    else:
-        print(f"Warning: Model file not found at {MODEL_PATH}")
-        print("System running with prediction disabled until model is available")
-except Exception as e:
-    model = None
-    print(f"Error Loading Model: {e}")
-
-try:
-    if os.path.exists(HAIR_MODEL_PATH):
+        else:
+            hair_model_error = str(runtime_error)
+        print(f"Hair model not loaded via '{HAIR_MODEL_BACKEND}' backend. Fallback enabled: {runtime_error}")
+
+
+def warmup_models():
+    """Run one inference per loaded model so the first real request is not the slow one."""
+    synthetic = make_synthetic_dermoscopic_image(256)
+    if hair_model is not None:
+        run_hair_model_inference(synthetic)
+    elif ALLOW_HAIR_FALLBACK:
+        remove_hair_dullrazor(synthetic)
+
+    if classifier is not None:
+        # Also triggers torch.compile's lazy compilation when CLASSIFIER_OPTIMIZE=compile.
+        classify_image(synthetic)
+
+
+def load_models(include_hair=True):
+    """Load and warm up both models once; safe to call from several threads.
+
+    include_hair=False leaves the hair model to a later load_hair_model() call,
+    for pre-fork masters whose hair runtime is not fork-safe.
+    """
+    with model_load_lock:
+        if model_load_state["status"] in ("ready", "failed"):
+            return
+        model_load_state["status"] = "loading"
+        model_load_state["started_at"] = datetime.datetime.utcnow()
+        print("Loading AI Model...")
         try:
-            from tensorflow.keras.models import load_model  # type: ignore
-            hair_model = load_model(HAIR_MODEL_PATH, compile=False)
-            hair_model_backend = "keras_h5"
-            hair_model_error = None
-            print("Hair removal model loaded successfully")
-        except Exception as tf_error:
-            hair_model = None
-            hair_model_backend = "opencv_dullrazor_fallback"
-            if "No module named 'tensorflow'" in str(tf_error):
-                hair_model_error = (
-                    "TensorFlow is not installed in current backend environment. "
-                    "Using OpenCV fallback."
+            load_classification_model()
+            if include_hair:
+                load_hair_model()
+            if MODEL_WARMUP:
+                model_load_state["status"] = "warming_up"
+                warmup_started = datetime.datetime.utcnow()
+                warmup_models()
+                model_load_state["warmup_ms"] = round(
+                    (datetime.datetime.utcnow() - warmup_started).total_seconds() * 1000.0, 1
                 )
-            else:
-                hair_model_error = str(tf_error)
-            print(f"Hair model not loaded via TensorFlow/Keras. Fallback enabled: {tf_error}")
-    else:
-        print(f"Hair model not found at {HAIR_MODEL_PATH}. Fallback enabled.")
-except Exception as e:
-    hair_model = None
-    hair_model_backend = "opencv_dullrazor"
-    hair_model_error = str(e)
-    print(f"Error preparing hair-removal model: {e}")
+            model_load_state["status"] = "ready"
+        except Exception as e:
+            model_load_state["status"] = "failed"
+            model_load_state["error"] = str(e)
+            print(f"Error during model loading/warmup: {e}")
+        finally:
+            model_load_state["finished_at"] = datetime.datetime.utcnow()
+            models_ready.set()
+
+
+def start_model_loader():
+    threading.Thread(target=load_models, name="model-loader", daemon=True).start()
+
+
+def wait_for_models(timeout=MODEL_READY_TIMEOUT):
+    if MODEL_LOAD_MODE == "lazy" and not models_ready.is_set():
+        load_models()
+    return models_ready.wait(timeout)
+
+
+def is_serving_ready():
+    """Ready = loading finished and hair removal can actually run."""
+    return (
+        model_load_state["status"] == "ready"
+        and (hair_model is not None or ALLOW_HAIR_FALLBACK)
+    )
+
+
+def predict_hair_batch(batch):
+    # In-process models are entered by a single batcher thread; a RemoteHairBackend
+    # gets one dispatcher per inference process (see load_hair_model).
+    return hair_model.predict(batch)
+
+
+hair_batcher = MicroBatcher(
+    predict_hair_batch,
+    max_batch_size=HAIR_BATCH_MAX_SIZE,
+    window_ms=HAIR_BATCH_WINDOW_MS,
+    name="hair-model-batcher"
+)
+
+def predict_classifier_batch(batch):
+    return classifier.predict(batch)
+
+
+classifier_batcher = MicroBatcher(
+    predict_classifier_batch,
+    max_batch_size=CLASSIFIER_BATCH_MAX_SIZE,
+    window_ms=CLASSIFIER_BATCH_WINDOW_MS,
+    name="classifier-batcher"
+)
+
+inpainter = TiledInpainter(
+    tile_size=INPAINT_TILE_SIZE,
+    overlap=INPAINT_TILE_OVERLAP,
+    max_workers=INPAINT_THREADS or None,
+    min_pixels=INPAINT_TILED_MIN_PIXELS
+)
+
+batch_executor = None
+batch_executor_pid = None
+batch_executor_lock = threading.Lock()
+
+
+def get_batch_executor():
+    # Shared by all /predict/batch requests; rebuilt after fork like the other pools.
+    global batch_executor, batch_executor_pid
+    with batch_executor_lock:
+        if batch_executor is None or batch_executor_pid != os.getpid():
+            batch_executor = ThreadPoolExecutor(
+                max_workers=max(1, BATCH_PREDICT_WORKERS), thread_name_prefix="predict-batch"
+            )
+            batch_executor_pid = os.getpid()
+        return batch_executor
+
+
+job_queue = JobQueue(
+    jobs_collection,
+    max_workers=JOB_POOL_WORKERS,
+    max_pending=JOB_POOL_MAX_PENDING,
+    start_method=JOB_POOL_START_METHOD
+)
+
+
+def build_hair_cache():
+    if not HAIR_CACHE_ENABLED:
+        return HairResultCache()
+
+    memory_tier = LRUCacheTier(HAIR_CACHE_MEMORY_MB * 1024 * 1024) if HAIR_CACHE_MEMORY_MB > 0 else None
+    persistent_tier = None
+    persistent_bytes = HAIR_CACHE_PERSISTENT_MB * 1024 * 1024
+    try:
+        if HAIR_CACHE_PERSISTENT == "mongo":
+            persistent_tier = MongoCacheTier(hair_cache_collection, persistent_bytes)
+        elif HAIR_CACHE_PERSISTENT == "disk":
+            persistent_tier = DiskCacheTier(HAIR_CACHE_DIR, persistent_bytes)
+    except Exception as e:
+        print(f"Warning: persistent hair cache unavailable ({e}). Using in-process cache only.")
+    return HairResultCache(memory_tier, persistent_tier)
+
+
+hair_cache = build_hair_cache()
+
+
+def build_artifact_store():
+    try:
+        if ARTIFACT_STORE == "local":
+            return LocalArtifactStore(ARTIFACT_DIR)
+        if ARTIFACT_STORE == "gridfs":
+            return GridFSArtifactStore(db)
+    except Exception as e:
+        print(f"Warning: artifact store unavailable ({e}). Images will be returned as data URLs.")
+    return None
+
+
+artifact_store = build_artifact_store()
+
+
+def build_thumbnail_cache():
+    if not THUMBNAILS_ENABLED or artifact_store is None:
+        return None
+    try:
+        return ThumbnailCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MB * 1024 * 1024)
+    except Exception as e:
+        print(f"Warning: thumbnail cache unavailable ({e}). Thumbnails are disabled.")
+    return None
+
+
+thumbnail_cache = build_thumbnail_cache()
+
+def timed_stage(name):
+    """Time a block as a stage of the current request; a no-op outside requests."""
+    if METRICS_ENABLED and has_request_context() and "stage_timings" in g:
+        return g.stage_timings.stage(name)
+    return nullcontext()
 
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-])
+
+def hair_method_label(method):
+    # Runtime-fallback methods carry the error text; keep the metric label bounded.
+    return method.split(":", 1)[0]
+
+
+@app.before_request
+def start_request_metrics():
+    if METRICS_ENABLED:
+        g.stage_timings = StageTimings()
+        g.mongo_seconds = 0.0
+
+
+@app.after_request
+def finish_request_metrics(response):
+    if not METRICS_ENABLED or "stage_timings" not in g:
+        return response
+
+    timings = g.stage_timings
+    endpoint = request_endpoint_label()
+    elapsed = time.perf_counter() - timings.started
+    http_request_seconds.observe(elapsed, method=request.method, endpoint=endpoint, status=response.status_code)
+
+    stage_totals = timings.totals()
+    hair_method = g.get("hair_method", "none")
+    for stage, seconds in stage_totals.items():
+        predict_stage_seconds.observe(seconds, stage=stage, hair_method=hair_method)
+    if endpoint.startswith("/predict") and response.status_code >= 400:
+        predict_errors_total.inc(endpoint=endpoint, status=response.status_code)
+
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = timings.server_timing({"db": g.mongo_seconds})
+    return response
 
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def decode_auth_token_from_request():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '').strip()
+def bearer_token(authorization_header):
+    return (authorization_header or '').replace('Bearer ', '').strip()
+
+
+def decode_auth_token(token, admin=False):
+    """Return (claims, None) or (None, (error message, status)); shared with asgi.py."""
     if not token:
-        return None, (jsonify({"error": "No token provided"}), 401)
+        return None, ("No token provided", 401)
 
     try:
         decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        return decoded, None
     except jwt.ExpiredSignatureError:
-        return None, (jsonify({"error": "Token expired"}), 401)
+        return None, ("Token expired", 401)
     except jwt.InvalidTokenError:
-        return None, (jsonify({"error": "Invalid token"}), 401)
+        return None, ("Invalid token", 401)
+    if admin and decoded.get("role") != "Admin":
+        return None, ("Admin access required", 403)
+    return decoded, None
 
 
-def require_admin_from_request():
-    decoded, error = decode_auth_token_from_request()
+def decode_auth_token_from_request(admin=False):
+    decoded, error = decode_auth_token(bearer_token(request.headers.get('Authorization')), admin)
     if error:
-        return None, error
-    if decoded.get("role") != "Admin":
-        return None, (jsonify({"error": "Admin access required"}), 403)
+        message, status = error
+        return None, (jsonify({"error": message}), status)
     return decoded, None
 
 
-def validate_dermoscopic_image(filepath):
+def require_admin_from_request():
+    return decode_auth_token_from_request(admin=True)
+
+
+def decode_image_bytes(image_bytes):
+    return cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def read_upload(file_storage):
+    """Read an upload stream into memory and decode it once."""
+    with timed_stage("read_upload"):
+        image_bytes = file_storage.read()
+    with timed_stage("decode"):
+        return image_bytes, decode_image_bytes(image_bytes)
+
+
+def save_upload_for_audit(filename, image_bytes):
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    with open(filepath, 'wb') as fh:
+        fh.write(image_bytes)
+    return filepath
+
+
+def validate_dermoscopic_image(image):
     """Validate uploaded image quality.
+    Accepts an already-decoded BGR ndarray or a file path.
     Strict dermoscopic heuristics are optional and disabled by default because they can
     reject true dermoscopic images in real-world lighting conditions.
     """
     try:
-        img = cv2.imread(filepath)
+        img = cv2.imread(image) if isinstance(image, str) else image
         if img is None:
             return False, "Invalid image file"
 
@@ -214,66 +711,101 @@ def validate_dermoscopic_image(filepath):
         return False, f"Validation error: {str(e)}"
 
 
-def is_skin_lesion_prediction(probabilities, threshold=0.45):
-    top_confidence = float(torch.max(probabilities).item())
+def is_skin_lesion_prediction(probabilities, threshold=LESION_CONFIDENCE_THRESHOLD):
+    top_confidence = float(np.max(probabilities))
     return top_confidence >= threshold, top_confidence
 
 
-def remove_hair_dullrazor(image_bgr):
-    gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (17, 17))
-    blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, kernel)
-    _, hair_mask = cv2.threshold(blackhat, 10, 255, cv2.THRESH_BINARY)
-    hair_mask = cv2.dilate(hair_mask, np.ones((3, 3), np.uint8), iterations=1)
-    inpainted = cv2.inpaint(image_bgr, hair_mask, 3, cv2.INPAINT_TELEA)
-    return inpainted, hair_mask
-
-
-def normalize_mask(mask_float):
-    mask_float = np.nan_to_num(mask_float, nan=0.0, posinf=1.0, neginf=0.0)
-    min_val = float(mask_float.min())
-    max_val = float(mask_float.max())
-    if max_val - min_val < 1e-8:
-        return np.zeros_like(mask_float, dtype=np.uint8)
-    normalized = (mask_float - min_val) / (max_val - min_val)
-    return (normalized * 255).astype(np.uint8)
+def classify_image(image_bgr):
+    """Return (class probabilities, latency_ms) for one BGR image."""
+    started = time.perf_counter()
+    with timed_stage("classify_preprocess"):
+        x = preprocess_for_classifier(image_bgr, classifier.input_size)
+    # Concurrent requests share forward passes through classifier_batcher.
+    with timed_stage("classification"):
+        probabilities = np.asarray(classifier_batcher.submit(x), dtype=np.float32)
+    if probabilities.shape != (len(CLASSES),):
+        raise ValueError(f"Classifier returned {probabilities.shape[-1]} scores for {len(CLASSES)} classes")
+    return probabilities, round((time.perf_counter() - started) * 1000.0, 2)
+
+
+def summarize_classification(probabilities, latency_ms):
+    """Payload fields for a classification result."""
+    is_lesion, top_confidence = is_skin_lesion_prediction(probabilities)
+    label = CLASSES[int(np.argmax(probabilities))]
+    summary = {
+        "applied": True,
+        "label": label if is_lesion else None,
+        "latency_ms": latency_ms,
+        "optimization": classifier.optimization if classifier is not None else None,
+        "threshold": LESION_CONFIDENCE_THRESHOLD,
+        "confidence": f"{top_confidence * 100:.1f}%",
+        "raw_scores": {name: round(float(p), 4) for name, p in zip(CLASSES, probabilities)},
+    }
+    if is_lesion:
+        info = CLASS_INFO[label]
+        summary.update({"result": info["type"], "diagnosis": info["name"], "severity": info["severity"]})
+    return summary
+
+
+def dullrazor_working_size(image_shape, max_side=None):
+    """(w, h) DullRazor actually processes for an image of `image_shape`."""
+    if max_side is None:
+        max_side = HAIR_REMOVAL_QUALITY_PRESETS[HAIR_REMOVAL_QUALITY]
+    h, w = image_shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return w, h
+    scale = max_side / float(max(h, w))
+    return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+
+def remove_hair_dullrazor(image_bgr, max_side=None):
+    h, w = image_bgr.shape[:2]
+    work_w, work_h = dullrazor_working_size(image_bgr.shape, max_side)
+    scale = work_w / float(w)
+    working = image_bgr if (work_w, work_h) == (w, h) else cv2.resize(
+        image_bgr, (work_w, work_h), interpolation=cv2.INTER_AREA
+    )
+
+    # Keep the kernel covering the same physical hair width at the working scale.
+    kernel_size = max(3, int(round(DULLRAZOR_KERNEL_SIZE * scale)) | 1)
+    with timed_stage("dullrazor_mask"):
+        gray = cv2.cvtColor(working, cv2.COLOR_BGR2GRAY)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+        blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, kernel)
+        _, hair_mask = cv2.threshold(blackhat, 10, 255, cv2.THRESH_BINARY)
+        hair_mask = cv2.dilate(hair_mask, np.ones((3, 3), np.uint8), iterations=1)
+    with timed_stage("inpaint"):
+        inpainted = inpainter.inpaint(working, hair_mask, 3, cv2.INPAINT_TELEA)
+
+    if working is image_bgr:
+        return inpainted, hair_mask
+
+    # Upsample and replace only the hair pixels so the rest keeps full-resolution detail.
+    with timed_stage("dullrazor_composite"):
+        full_mask = cv2.resize(hair_mask, (w, h), interpolation=cv2.INTER_LINEAR)
+        full_mask = np.where(full_mask > 0, 255, 0).astype(np.uint8)
+        upsampled = cv2.resize(inpainted, (w, h), interpolation=cv2.INTER_CUBIC)
+        composited = image_bgr.copy()
+        hair_pixels = full_mask > 0
+        composited[hair_pixels] = upsampled[hair_pixels]
+    return composited, full_mask
 
 
 def run_hair_model_inference(image_bgr):
-    # Assumes hair_model is a loaded keras model.
-    input_shape = getattr(hair_model, "input_shape", None)
-    if not input_shape or len(input_shape) < 4:
-        raise ValueError("Unsupported hair model input shape")
-
-    target_h = int(input_shape[1] or 256)
-    target_w = int(input_shape[2] or 256)
-
-    rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
-    resized = cv2.resize(rgb, (target_w, target_h), interpolation=cv2.INTER_AREA)
-    x = resized.astype(np.float32) / 255.0
-    x = np.expand_dims(x, axis=0)
-
-    pred = hair_model.predict(x, verbose=0)
-    pred = np.array(pred)
-
-    if pred.ndim == 4:
-        pred = pred[0]
-    if pred.ndim == 3:
-        if pred.shape[-1] > 1:
-            pred = pred[..., 0]
-        else:
-            pred = pred[..., 0]
-    elif pred.ndim != 2:
-        raise ValueError(f"Unexpected model output dimensions: {pred.shape}")
+    # Assumes hair_model is a loaded backend from hair_backends.
+    with timed_stage("hair_preprocess"):
+        x = preprocess_for_hair_model(image_bgr, hair_model.input_size)
 
-    pred = cv2.resize(pred.astype(np.float32), (image_bgr.shape[1], image_bgr.shape[0]), interpolation=cv2.INTER_LINEAR)
-    mask_gray = normalize_mask(pred)
-    _, mask_bin = cv2.threshold(mask_gray, 128, 255, cv2.THRESH_BINARY)
-    mask_bin = cv2.medianBlur(mask_bin, 5)
-    mask_bin = cv2.dilate(mask_bin, np.ones((3, 3), np.uint8), iterations=1)
+    # Concurrent requests are stacked into one forward pass by hair_batcher.
+    with timed_stage("hair_inference"):
+        pred = hair_batcher.submit(x)
+    with timed_stage("mask_postprocess"):
+        mask_bin = prediction_to_mask(pred, image_bgr.shape[:2], HAIR_MASK_THRESHOLD)
 
-    inpainted = cv2.inpaint(image_bgr, mask_bin, 3, cv2.INPAINT_TELEA)
-    return inpainted, mask_bin, "keras_h5_mask_inpaint"
+    with timed_stage("inpaint"):
+        inpainted = inpainter.inpaint(image_bgr, mask_bin, 3, cv2.INPAINT_TELEA)
+    return inpainted, mask_bin, hair_model.method
 
 
 def get_hair_removed_image(image_bgr):
@@ -285,32 +817,99 @@ def get_hair_removed_image(image_bgr):
                 raise RuntimeError(
                     f"Hair model runtime failed and fallback is disabled: {model_runtime_error}"
                 )
+            hair_fallbacks_total.inc(reason="runtime_error")
             fallback_img, fallback_mask = remove_hair_dullrazor(image_bgr)
-            return fallback_img, fallback_mask, f"keras_runtime_fallback_dullrazor: {model_runtime_error}"
+            return fallback_img, fallback_mask, f"{hair_model_backend}_runtime_fallback_dullrazor: {model_runtime_error}"
 
     if not ALLOW_HAIR_FALLBACK:
         raise RuntimeError(
-            "Hair model is not loaded. Install TensorFlow-compatible environment or enable ALLOW_HAIR_FALLBACK=true."
+            "Hair model is not loaded. Install the runtime for HAIR_MODEL_BACKEND or enable ALLOW_HAIR_FALLBACK=true."
         )
 
+    hair_fallbacks_total.inc(reason="model_not_loaded")
     fallback_img, fallback_mask = remove_hair_dullrazor(image_bgr)
     return fallback_img, fallback_mask, "opencv_dullrazor"
 
 
-def encode_bgr_to_data_url(image_bgr):
-    ok, encoded = cv2.imencode('.jpg', image_bgr)
+def encode_image(image, ext):
+    ok, encoded = cv2.imencode(ext, image)
     if not ok:
         return None
-    b64 = base64.b64encode(encoded.tobytes()).decode('utf-8')
-    return f"data:image/jpeg;base64,{b64}"
+    return encoded.tobytes()
+
+
+def bytes_to_data_url(data, mime):
+    if data is None:
+        return None
+    b64 = base64.b64encode(data).decode('utf-8')
+    return f"data:{mime};base64,{b64}"
+
+
+def encode_bgr_to_data_url(image_bgr):
+    return bytes_to_data_url(encode_image(image_bgr, '.jpg'), 'image/jpeg')
 
 
 def encode_mask_to_data_url(mask_gray):
-    ok, encoded = cv2.imencode('.png', mask_gray)
-    if not ok:
+    return bytes_to_data_url(encode_image(mask_gray, '.png'), 'image/png')
+
+
+IMAGE_FIELDS = ("processed_image", "mask_image", "mask_overlay_image")
+# The upload itself is never stored; a preview at the largest thumbnail size is.
+ORIGINAL_PREVIEW_FIELD = "original_preview"
+# Thumbnail name -> artifact it is rendered from.
+THUMBNAIL_SOURCES = {
+    "original": ORIGINAL_PREVIEW_FIELD,
+    "processed": "processed_image",
+    "overlay": "mask_overlay_image",
+}
+
+
+def artifact_signature(artifact_id, expires):
+    message = f"artifact:{artifact_id}:{expires}".encode("utf-8")
+    return hmac.new(SECRET_KEY.encode("utf-8"), message, hashlib.sha256).hexdigest()[:32]
+
+
+def artifact_url_expiry():
+    # Rounded up to a quarter of the TTL so repeated listings reuse the same URLs
+    # (and the browser cache) for a while instead of minting new ones per request.
+    step = max(60, ARTIFACT_URL_TTL // 4)
+    return (int(time.time()) + ARTIFACT_URL_TTL) // step * step + step
+
+
+def artifact_url(artifact_id, host_url=None, thumb_size=None):
+    """Signed, expiring URL of a stored image (or of its thumbnail)."""
+    base = ARTIFACT_BASE_URL or host_url or request.host_url
+    expires = artifact_url_expiry()
+    path = f"/api/artifacts/{artifact_id}" + (f"/thumb/{thumb_size}" if thumb_size else "")
+    query = urlencode({"expires": expires, "sig": artifact_signature(artifact_id, expires)})
+    return f"{base.rstrip('/')}{path}?{query}"
+
+
+def check_artifact_link(artifact_id):
+    """Seconds the request's artifact link stays valid, or None if it is forged or expired."""
+    try:
+        expires = int(request.args.get("expires", ""))
+    except ValueError:
+        return None
+    expected = artifact_signature(artifact_id, expires)
+    if not hmac.compare_digest(expected, request.args.get("sig", "")):
         return None
-    b64 = base64.b64encode(encoded.tobytes()).decode('utf-8')
-    return f"data:image/png;base64,{b64}"
+    remaining = expires - int(time.time())
+    return remaining if remaining > 0 else None
+
+
+def attach_image_urls(record, host_url=None):
+    """Fill image fields from stored artifact ids; without host_url this needs a request context."""
+    artifacts = record.get("artifacts") or {}
+    for field in IMAGE_FIELDS:
+        if not record.get(field) and artifacts.get(field):
+            record[field] = artifact_url(artifacts[field], host_url)
+    if thumbnail_cache is not None and artifacts:
+        record["thumbnails"] = {
+            name: artifact_url(artifacts[field], host_url, THUMBNAIL_LIST_SIZE)
+            for name, field in THUMBNAIL_SOURCES.items() if artifacts.get(field)
+        }
+    return record
 
 
 def apply_mask_overlay(image_bgr, mask_gray):
@@ -319,18 +918,26 @@ def apply_mask_overlay(image_bgr, mask_gray):
     return blended
 
 
-def send_email(to_email, subject, body):
+def bump_counters(deltas):
+    if not ANALYTICS_COUNTERS:
+        return
     try:
-        msg = MIMEText(body)
-        msg['Subject'] = subject
-        msg['From'] = SMTP_EMAIL
-        msg['To'] = to_email
+        increment_counters(db, deltas)
+    except Exception as e:
+        # Drift is repaired by reconcile_counters(); never fail the request for it.
+        print(f"Analytics counter update failed: {e}")
+
 
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(SMTP_EMAIL, SMTP_PASSWORD)
-        server.sendmail(SMTP_EMAIL, to_email, msg.as_string())
-        server.quit()
+def send_email(to_email, subject, body, expires_at=None):
+    """Queue (or, with EMAIL_OUTBOX=false, synchronously send) one message.
+
+    A queued message is dropped instead of sent once `expires_at` passes.
+    """
+    try:
+        if EMAIL_OUTBOX:
+            email_outbox.enqueue(to_email, subject, body, expires_at)
+        else:
+            send_message_now(smtp_settings, to_email, subject, body)
         return True
     except Exception as e:
         print(f"Email Error: {e}")
@@ -366,19 +973,21 @@ def signup_step1():
         otp = str(random.randint(100000, 999999))
         hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
 
+        created_at = datetime.datetime.utcnow()
         pending_user = {
             "fullName": full_name,
             "email": email,
             "password": hashed_password,
             "role": role,
             "otp": otp,
-            "created_at": datetime.datetime.utcnow()
+            "created_at": created_at
         }
 
         pending_collection.delete_one({"email": email})
         pending_collection.insert_one(pending_user)
 
-        if send_email(email, "TRACE - Verify Account", f"Your OTP is: {otp}\n\nExpires in 5 minutes."):
+        expires_at = created_at + datetime.timedelta(seconds=OTP_TTL_SECONDS)
+        if send_email(email, "TRACE - Verify Account", f"Your OTP is: {otp}\n\nExpires in 5 minutes.", expires_at):
             return jsonify({"message": "OTP sent successfully"}), 200
         else:
             return jsonify({"error": "Failed to send email"}), 500
@@ -399,7 +1008,7 @@ def verify_otp():
         if not pending_user:
             return jsonify({"error": "User not found or Session Expired"}), 400
 
-        if (datetime.datetime.utcnow() - pending_user['created_at']).total_seconds() > 300:
+        if (datetime.datetime.utcnow() - pending_user['created_at']).total_seconds() > OTP_TTL_SECONDS:
             pending_collection.delete_one({"email": email})
             return jsonify({"error": "OTP Expired. Signup again."}), 400
 
@@ -416,6 +1025,7 @@ def verify_otp():
 
         users_collection.insert_one(new_user)
         pending_collection.delete_one({"email": email})
+        bump_counters(user_counter_deltas(new_user["role"]))
 
         return jsonify({"message": "Account Verified!"}), 201
 
@@ -423,6 +1033,25 @@ def verify_otp():
         return jsonify({"error": str(e)}), 500
 
 
+def build_login_payload(user, collection_type):
+    token = jwt.encode({
+        'user_id': str(user['_id']),
+        'role': user['role'],
+        'type': collection_type,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
+    }, SECRET_KEY, algorithm="HS256")
+
+    return {
+        'message': "Login Successful",
+        'token': token,
+        'user': {
+            "fullName": user['fullName'],
+            "email": user['email'],
+            "role": user['role']
+        }
+    }
+
+
 @app.route('/api/auth/login', methods=['POST'])
 def login():
     try:
@@ -441,22 +1070,7 @@ def login():
             return jsonify({"error": "User not found"}), 404
 
         if bcrypt.checkpw(password.encode('utf-8'), user['password']):
-            token = jwt.encode({
-                'user_id': str(user['_id']),
-                'role': user['role'],
-                'type': collection_type,
-                'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-            }, SECRET_KEY, algorithm="HS256")
-
-            return jsonify({
-                'message': "Login Successful",
-                'token': token,
-                'user': {
-                    "fullName": user['fullName'],
-                    "email": user['email'],
-                    "role": user['role']
-                }
-            }), 200
+            return jsonify(build_login_payload(user, collection_type)), 200
         else:
             return jsonify({"error": "Invalid Password"}), 401
     except Exception as e:
@@ -474,14 +1088,16 @@ def forgot_password():
             return jsonify({"error": "No account found"}), 404
 
         otp = str(random.randint(100000, 999999))
+        created_at = datetime.datetime.utcnow()
         reset_collection.delete_one({"email": email})
         reset_collection.insert_one({
             "email": email,
             "otp": otp,
-            "created_at": datetime.datetime.utcnow()
+            "created_at": created_at
         })
 
-        if send_email(email, "TRACE - Reset Password", f"Reset Code: {otp}\n\nExpires in 5 minutes."):
+        expires_at = created_at + datetime.timedelta(seconds=OTP_TTL_SECONDS)
+        if send_email(email, "TRACE - Reset Password", f"Reset Code: {otp}\n\nExpires in 5 minutes.", expires_at):
             return jsonify({"message": "Code sent"}), 200
         return jsonify({"error": "Email failed"}), 500
     except Exception as e:
@@ -497,7 +1113,7 @@ def reset_password():
         new_password = data.get('newPassword')
 
         record = reset_collection.find_one({"email": email})
-        if not record or (datetime.datetime.utcnow() - record['created_at']).total_seconds() > 300:
+        if not record or (datetime.datetime.utcnow() - record['created_at']).total_seconds() > OTP_TTL_SECONDS:
             return jsonify({"error": "Expired"}), 400
 
         if record['otp'] != otp:
@@ -536,7 +1152,9 @@ def delete_user(user_id):
         _admin, error = require_admin_from_request()
         if error:
             return error
-        users_collection.delete_one({"_id": ObjectId(user_id)})
+        deleted = users_collection.find_one_and_delete({"_id": ObjectId(user_id)}, projection={"role": 1})
+        if deleted:
+            bump_counters(user_counter_deltas(deleted.get("role"), sign=-1))
         return jsonify({"message": "Deleted"}), 200
     except:
         return jsonify({"error": "Failed"}), 500
@@ -548,48 +1166,36 @@ def get_analytics():
         _admin, error = require_admin_from_request()
         if error:
             return error
-        total_users = users_collection.count_documents({})
-        students = users_collection.count_documents({"role": "Student"})
-        clinicians = users_collection.count_documents({"role": {"$in": ["Doctor", "Clinician"]}})
-        admins = admins_collection.count_documents({})
-        total_analyses = analyses_collection.count_documents({})
-        hair_only = analyses_collection.count_documents({"status": "hair_processed_only"})
-        flagged = analyses_collection.count_documents({"result": "Malignant (Cancerous)"})
-        return jsonify({
-            "totalUsers": total_users,
-            "students": students,
-            "clinicians": clinicians,
-            "admins": admins,
-            "totalAnalyses": total_analyses,
-            "hairOnly": hair_only,
-            "flagged": flagged
-        }), 200
+        if not ANALYTICS_COUNTERS:
+            return jsonify(compute_analytics(db)), 200
+
+        counts = read_counters(db)
+        if counts is None:
+            counts, _drift = reconcile_counters(db)
+        return jsonify(counts), 200
     except:
         return jsonify({}), 500
 
 
+@app.route('/api/admin/analytics/reconcile', methods=['POST'])
+def reconcile_analytics():
+    try:
+        _admin, error = require_admin_from_request()
+        if error:
+            return error
+        counts, drift = reconcile_counters(db)
+        return jsonify({"counts": counts, "drift": drift}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/admin/analyses', methods=['GET'])
 def get_all_analyses_admin():
     try:
         _admin, error = require_admin_from_request()
         if error:
             return error
-
-        limit = request.args.get("limit", default=100, type=int)
-        limit = max(1, min(limit, 500))
-        records = list(analyses_collection.find({}).sort("created_at", -1).limit(limit))
-        for rec in records:
-            rec['_id'] = str(rec['_id'])
-            created_at = rec.get('created_at')
-            if isinstance(created_at, datetime.datetime):
-                if created_at.tzinfo is None:
-                    created_at = created_at.replace(tzinfo=datetime.timezone.utc)
-                rec['created_at_iso'] = created_at.isoformat()
-                rec['date'] = created_at.astimezone(APP_TIMEZONE).strftime('%Y-%m-%d %H:%M')
-            else:
-                rec['created_at_iso'] = None
-                rec['date'] = '-'
-        return jsonify(records), 200
+        return analyses_page_response({}, ADMIN_ANALYSES_PAGE_DEFAULT, ADMIN_ANALYSES_PAGE_MAX)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -601,9 +1207,13 @@ def delete_analysis_admin(analysis_id):
         if error:
             return error
 
-        result = analyses_collection.delete_one({"_id": ObjectId(analysis_id)})
-        if result.deleted_count == 0:
+        deleted = analyses_collection.find_one_and_delete(
+            {"_id": ObjectId(analysis_id)}, projection={"status": 1, "result": 1}
+        )
+        if not deleted:
             return jsonify({"error": "Analysis record not found"}), 404
+        bump_counters(analysis_counter_deltas(deleted.get("status"), deleted.get("result"), sign=-1))
+        # Artifacts can be shared with other analyses; artifact_gc.py deletes them once unreferenced.
         return jsonify({"message": "Analysis record deleted"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -620,10 +1230,24 @@ def admin_system_status():
             "timezone": str(os.getenv("APP_TIMEZONE", "Asia/Karachi")),
             "strictValidation": STRICT_IMAGE_VALIDATION,
             "allowHairFallback": ALLOW_HAIR_FALLBACK,
+            "hairRemovalQuality": HAIR_REMOVAL_QUALITY,
+            "modelLoadStatus": model_load_state["status"],
+            "modelWarmupMs": model_load_state["warmup_ms"],
             "classificationModelLoaded": model is not None,
+            "classificationOptimization": classifier.optimization if classifier is not None else None,
+            "classificationOptimizationError": classifier.optimization_error if classifier is not None else None,
+            "classifierBatching": classifier_batcher.stats(),
             "hairModelLoaded": hair_model is not None,
             "hairModelBackend": hair_model_backend,
-            "hairModelError": hair_model_error
+            "hairModelBackendRequested": HAIR_MODEL_BACKEND,
+            "hairModelError": hair_model_error,
+            "hairBatching": hair_batcher.stats(),
+            "hairInferenceMode": HAIR_INFERENCE_MODE,
+            "hairInference": hair_model.stats() if isinstance(hair_model, RemoteHairBackend) else None,
+            "hairCache": hair_cache.stats(),
+            "thumbnailCache": thumbnail_cache.stats() if thumbnail_cache is not None else None,
+            "inpainting": inpainter.stats(),
+            "analysisWriteBehind": analysis_writer.stats() if ANALYSIS_WRITE_BEHIND else None
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -631,38 +1255,378 @@ def admin_system_status():
 
 # History Route
 
+ANALYSIS_FIELDS = (
+    "user_id", "result", "diagnosis", "confidence", "severity", "status",
+    "raw_scores", "artifacts", "filename", "created_at"
+)
+
+
+def serialize_analysis(analysis, host_url=None):
+    analysis['_id'] = str(analysis['_id'])
+    created_at = analysis.get('created_at')
+    if isinstance(created_at, datetime.datetime):
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=datetime.timezone.utc)
+        local_dt = created_at.astimezone(APP_TIMEZONE)
+        analysis['created_at_iso'] = created_at.isoformat()
+        analysis['created_at_epoch'] = int(created_at.timestamp())
+        analysis['date'] = local_dt.strftime('%Y-%m-%d %H:%M')
+    else:
+        analysis['created_at_iso'] = None
+        analysis['created_at_epoch'] = 0
+        analysis['date'] = '-'
+    attach_image_urls(analysis, host_url)
+    return analysis
+
+
+SUMMARY_RECENT_PROJECTION = {field: 1 for field in ANALYSIS_FIELDS if field not in ("user_id", "raw_scores")}
+
+
+def analyses_page_response(query, default_limit, max_limit):
+    """One keyset page of analyses as a JSON list.
+
+    Query params: limit (capped at max_limit), cursor (from the previous page's
+    X-Next-Cursor header) and fields (comma-separated projection).
+    """
+    limit = request.args.get("limit", default=default_limit, type=int)
+    limit = max(1, min(limit, max_limit))
+    cursor = request.args.get("cursor") or None
+
+    try:
+        projection = parse_projection(request.args.get("fields"), ANALYSIS_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        records, next_cursor = fetch_page(analyses_collection, query, limit, cursor, projection)
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
+
+    headers = {}
+    if next_cursor:
+        args = request.args.to_dict()
+        args["cursor"] = next_cursor
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return jsonify([serialize_analysis(rec) for rec in records]), 200, headers
+
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
     try:
         decoded, error = decode_auth_token_from_request()
         if error:
             return error
-        user_id = decoded['user_id']
-
-        analyses = list(analyses_collection.find({"user_id": user_id}).sort("created_at", -1))
-
-        for analysis in analyses:
-            analysis['_id'] = str(analysis['_id'])
-            created_at = analysis.get('created_at')
-            if isinstance(created_at, datetime.datetime):
-                if created_at.tzinfo is None:
-                    created_at = created_at.replace(tzinfo=datetime.timezone.utc)
-                local_dt = created_at.astimezone(APP_TIMEZONE)
-                analysis['created_at_iso'] = created_at.isoformat()
-                analysis['created_at_epoch'] = int(created_at.timestamp())
-                analysis['date'] = local_dt.strftime('%Y-%m-%d %H:%M')
-            else:
-                analysis['created_at_iso'] = None
-                analysis['created_at_epoch'] = 0
-                analysis['date'] = '-'
+        return analyses_page_response({"user_id": decoded['user_id']}, HISTORY_PAGE_DEFAULT, HISTORY_PAGE_MAX)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/history/summary', methods=['GET'])
+def get_history_summary():
+    try:
+        decoded, error = decode_auth_token_from_request()
+        if error:
+            return error
+
+        recent = request.args.get("recent", default=SUMMARY_RECENT_DEFAULT, type=int)
+        recent = max(1, min(recent, SUMMARY_RECENT_MAX))
 
-        return jsonify(analyses), 200
+        summary = compute_user_summary(db, decoded['user_id'], recent, SUMMARY_RECENT_PROJECTION)
+        summary["recent"] = [serialize_analysis(rec) for rec in summary["recent"]]
+        return jsonify(summary), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 # Prediction Route
 
+def classifier_fingerprint():
+    if classifier is None:
+        return "none"
+    try:
+        mtime = os.path.getmtime(MODEL_PATH)
+    except OSError:
+        mtime = 0
+    return f"{MODEL_PATH}:{mtime}:{LESION_CONFIDENCE_THRESHOLD}"
+
+
+def hair_model_fingerprint():
+    # Path, mtime and size of the file the hair backend loaded (in a worker process when remote).
+    return getattr(hair_model, "fingerprint", "none")
+
+
+def hair_cache_key(image_bytes, spec=DEFAULT_OUTPUT_SPEC):
+    return make_cache_key(
+        image_bytes, hair_model_backend, hair_model_fingerprint(), HAIR_MASK_THRESHOLD, ALLOW_HAIR_FALLBACK,
+        HAIR_REMOVAL_QUALITY, classifier_fingerprint(), spec.cache_token()
+    )
+
+
+def compute_hair_outputs(original_bgr, spec=DEFAULT_OUTPUT_SPEC):
+    """Run hair removal and encode only the outputs `spec` asks for."""
+    hair_removed_bgr, hair_mask, hair_method = get_hair_removed_image(original_bgr)
+
+    classification = {"applied": False, "error": None}
+    if classifier is not None:
+        try:
+            classification = summarize_classification(*classify_image(hair_removed_bgr))
+        except Exception as e:
+            classification = {"applied": False, "error": str(e)}
+
+    mask_coverage = round(float((hair_mask > 0).sum()) * 100.0 / float(hair_mask.size), 2)
+    if "dullrazor" in hair_method:
+        work_w, work_h = dullrazor_working_size(original_bgr.shape)
+    else:
+        work_h, work_w = original_bgr.shape[:2]
+    images = {}
+    with timed_stage("encode"):
+        if spec.wants("processed"):
+            images["processed_image"] = encode_color_image(hair_removed_bgr, spec)
+        if spec.wants("mask"):
+            images["mask_image"] = encode_mask(hair_mask, spec)
+    if spec.wants("overlay"):
+        with timed_stage("overlay"):
+            overlay_bgr = apply_mask_overlay(original_bgr, hair_mask)
+        with timed_stage("encode"):
+            images["mask_overlay_image"] = encode_color_image(overlay_bgr, spec)
+    return {
+        "method": hair_method,
+        "mask_coverage_percent": mask_coverage,
+        "working_resolution": f"{work_w}x{work_h}",
+        "classification": classification,
+        "images": images
+    }
+
+
+def get_hair_outputs(original_bgr, image_bytes=None, spec=DEFAULT_OUTPUT_SPEC):
+    """Return (outputs, cache_hit); identical uploads are served from hair_cache."""
+    if image_bytes is None or not hair_cache.enabled:
+        return compute_hair_outputs(original_bgr, spec), False
+
+    cache_key = hair_cache_key(image_bytes, spec)
+    with timed_stage("cache_lookup"):
+        cached = hair_cache.get(cache_key)
+    if cached is not None:
+        hair_cache_requests_total.inc(result="hit")
+        return cached, True
+    hair_cache_requests_total.inc(result="miss")
+
+    outputs = compute_hair_outputs(original_bgr, spec)
+    # Fallback results depend on a runtime failure, not on the inputs; don't pin them.
+    if "fallback" not in outputs["method"] and not outputs["classification"].get("error"):
+        with timed_stage("cache_store"):
+            hair_cache.put(cache_key, outputs)
+    return outputs, False
+
+
+def store_hair_artifacts(images):
+    if artifact_store is None:
+        return {}
+    try:
+        return {
+            field: artifact_store.put(image["data"], image["mime"])
+            for field, image in images.items() if image.get("data") and is_image_mime(image["mime"])
+        }
+    except Exception as e:
+        print(f"Artifact store write failed: {e}")
+        return {}
+
+
+def store_original_preview(original_bgr):
+    """Store a small JPEG of the upload so list views can show the original."""
+    if thumbnail_cache is None:
+        return None
+    try:
+        preview = encode_thumbnail(fit_within(original_bgr, THUMBNAIL_SIZES[-1]))
+        return artifact_store.put(preview, THUMBNAIL_MIME)
+    except Exception as e:
+        print(f"Original preview write failed: {e}")
+        return None
+
+
+def build_hair_removal_result(original_bgr, image_bytes=None, spec=DEFAULT_OUTPUT_SPEC, inline_images=True):
+    """Return (payload, images). With inline_images=False (multipart responses) image
+    fields are left to artifact URLs and the caller ships `images` as binary parts."""
+    outputs, cache_hit = get_hair_outputs(original_bgr, image_bytes, spec)
+    if has_request_context():
+        g.hair_method = hair_method_label(outputs["method"])
+    images = outputs["images"]
+    with timed_stage("artifact_store"):
+        artifacts = store_hair_artifacts(images)
+        if artifacts:
+            preview_id = store_original_preview(original_bgr)
+            if preview_id:
+                artifacts[ORIGINAL_PREVIEW_FIELD] = preview_id
+
+    payload = {
+        "analysis_available": False,
+        "message": "Hair removal completed successfully.",
+        "result": "Hair Removal Completed",
+        "diagnosis": "Preprocessing complete",
+        "confidence": "N/A",
+        "severity": "N/A",
+        "status": "hair_processed_only",
+        "hair_removal": {
+            "applied": True,
+            "method": outputs["method"],
+            "model_backend": hair_model_backend,
+            "model_error": hair_model_error,
+            "mask_coverage_percent": outputs["mask_coverage_percent"],
+            "validation_mode": "strict" if STRICT_IMAGE_VALIDATION else "non_strict",
+            "quality": HAIR_REMOVAL_QUALITY,
+            "working_resolution": outputs.get("working_resolution"),
+            "cache_hit": cache_hit
+        },
+        "artifacts": artifacts,
+        "raw_scores": {}
+    }
+
+    classification = outputs.get("classification") or {"applied": False, "error": None}
+    payload["classification"] = {
+        "applied": classification.get("applied", False),
+        "error": classification.get("error"),
+        "label": classification.get("label"),
+        "latency_ms": classification.get("latency_ms"),
+        "optimization": classification.get("optimization"),
+        "cached": cache_hit
+    }
+    if classification.get("applied"):
+        payload["confidence"] = classification["confidence"]
+        payload["raw_scores"] = classification["raw_scores"]
+        if classification.get("result"):
+            payload.update({
+                "analysis_available": True,
+                "message": "Analysis completed successfully.",
+                "result": classification["result"],
+                "diagnosis": classification["diagnosis"],
+                "severity": classification["severity"],
+                "status": "completed"
+            })
+        else:
+            payload.update({
+                "message": "Hair removal completed; the classifier did not recognize a skin lesion with enough confidence.",
+                "result": "Inconclusive",
+                "diagnosis": "No confident lesion match",
+                "status": "inconclusive"
+            })
+
+    payload["outputs"] = spec.describe()
+    mask = images.get("mask_image")
+    if mask is not None and not is_image_mime(mask["mime"]):
+        payload["mask"] = {"format": spec.mask_format, "size": mask["size"]}
+        if not inline_images:
+            payload["mask"]["part"] = "mask_image"
+        elif spec.mask_format == "rle":
+            payload["mask"]["counts"] = json.loads(mask["data"])["counts"]
+        else:
+            payload["mask"]["bit_order"] = "msb_first"
+            payload["mask"]["data"] = base64.b64encode(mask["data"]).decode('utf-8')
+
+    # URL delivery is resolved per request by attach_image_urls(); fall back to
+    # inline data URLs when there is no store or a write failed.
+    with timed_stage("base64"):
+        for field in IMAGE_FIELDS:
+            image = images.get(field)
+            skip = not inline_images or (IMAGE_DELIVERY == "url" and field in artifacts)
+            if image is None or not is_image_mime(image["mime"]) or skip:
+                payload[field] = None
+            else:
+                payload[field] = bytes_to_data_url(image["data"], image["mime"])
+    return payload, images
+
+
+def build_hair_removal_payload(original_bgr, image_bytes=None, spec=DEFAULT_OUTPUT_SPEC):
+    return build_hair_removal_result(original_bgr, image_bytes, spec)[0]
+
+
+def build_analysis_record(user_id, response_payload, filename, created_at):
+    return {
+        "user_id": user_id,
+        "result": response_payload["result"],
+        "diagnosis": response_payload["diagnosis"],
+        "confidence": response_payload["confidence"],
+        "severity": response_payload["severity"],
+        "status": response_payload["status"],
+        "raw_scores": response_payload["raw_scores"],
+        "artifacts": response_payload.get("artifacts", {}),
+        "filename": filename,
+        "created_at": created_at
+    }
+
+
+def bump_analysis_counters(records):
+    deltas = {}
+    for record in records:
+        for field, value in analysis_counter_deltas(record.get("status"), record.get("result")).items():
+            deltas[field] = deltas.get(field, 0) + value
+    bump_counters(deltas)
+
+
+analysis_writer = WriteBehindBuffer(
+    analyses_collection, ANALYSIS_SPILL_DIR, max_batch=ANALYSIS_WRITE_BATCH,
+    max_delay_ms=ANALYSIS_WRITE_DELAY_MS, fsync=ANALYSIS_SPILL_FSYNC,
+    on_insert=bump_analysis_counters, name="analysis-writer"
+)
+
+
+def start_server_workers():
+    """Per-process background work of a serving process.
+
+    Called by the server entry points (python app.py, gunicorn post_fork, the
+    ASGI startup hook) rather than at import, so tools, benchmarks and job-pool
+    children that import this module never start it.
+    """
+    if ANALYSIS_WRITE_BEHIND:
+        # Also writes analyses left in spill files by a previous run.
+        analysis_writer.start()
+
+    def fail_orphaned_jobs():
+        # Off the startup path, like the index build: MongoDB may be unreachable.
+        try:
+            failed = job_queue.fail_orphaned_jobs()
+            if failed:
+                print(f"Marked {failed} jobs of exited server processes as failed")
+        except Exception as e:
+            print(f"Orphaned job check failed: {e}")
+
+    threading.Thread(target=fail_orphaned_jobs, name="orphaned-jobs", daemon=True).start()
+
+
+def record_analysis(record, write_behind=ANALYSIS_WRITE_BEHIND):
+    """Store one analysis; with write-behind the insert happens after the response."""
+    # Processes that never called start_server_workers() write synchronously.
+    if write_behind and analysis_writer.is_running():
+        with timed_stage("db_enqueue"):
+            analysis_writer.add(record)
+        return
+    with timed_stage("db_insert"):
+        analyses_collection.insert_one(record)
+    bump_analysis_counters([record])
+
+
+def process_hair_job(image_bytes, output_args=None):
+    """Job-pool entry point: runs in a worker process, so it only returns data."""
+    if not wait_for_models():
+        raise RuntimeError("Models are still loading in the job worker")
+    original_bgr = decode_image_bytes(image_bytes)
+    if original_bgr is None:
+        raise ValueError("Failed to decode uploaded image")
+    return build_hair_removal_payload(original_bgr, image_bytes, parse_output_spec(output_args or {}))
+
+
+def submit_hair_job(user_id, filename, image_bytes, output_args=None):
+    def on_complete(_job_id, response_payload):
+        # Written synchronously: a poll that reports "done" must find the analysis in history.
+        record_analysis(
+            build_analysis_record(user_id, response_payload, filename, datetime.datetime.utcnow()),
+            write_behind=False
+        )
+        return response_payload
+
+    return job_queue.submit(process_hair_job, (image_bytes, output_args), user_id, on_complete=on_complete)
+
+
 @app.route('/predict', methods=['POST'])
 def predict():
     decoded, error = decode_auth_token_from_request()
@@ -676,77 +1640,349 @@ def predict():
     if not file or not allowed_file(file.filename):
         return jsonify({"error": "Invalid file type"}), 400
 
+    async_mode = request.args.get("mode", "sync").lower() == "async"
+    # Clients pick outputs/formats via query args and may ask for a binary multipart body.
+    output_args = {key: request.args[key] for key in OUTPUT_SPEC_ARGS if key in request.args}
+    try:
+        spec = parse_output_spec(output_args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    multipart = not async_mode and (
+        request.args.get("response", "").lower() == "multipart"
+        or request.accept_mimetypes.best_match(["application/json", "multipart/mixed"]) == "multipart/mixed"
+    )
+
+    if not async_mode:
+        with timed_stage("model_wait"):
+            models_loaded = wait_for_models()
+        if not models_loaded:
+            return jsonify({"error": "Models are still loading, try again shortly"}), 503, {"Retry-After": "5"}
+
     base_name = secure_filename(file.filename)
     filename = f"{int(datetime.datetime.utcnow().timestamp() * 1000)}_{base_name}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+
+    image_bytes, original_bgr = read_upload(file)
+    if AUDIT_UPLOADS:
+        try:
+            with timed_stage("audit_save"):
+                save_upload_for_audit(filename, image_bytes)
+        except OSError as e:
+            print(f"Upload audit write failed for {filename}: {e}")
+
+    if original_bgr is None:
+        return jsonify({"error": "Invalid image: Invalid image file"}), 400
 
     # Validate dermoscopic image
-    is_valid, reason = validate_dermoscopic_image(filepath)
+    with timed_stage("validate"):
+        is_valid, reason = validate_dermoscopic_image(original_bgr)
     if not is_valid:
-        if os.path.exists(filepath):
-            os.remove(filepath)
         return jsonify({"error": f"Invalid image: {reason}"}), 400
 
-    # Hair-removal mode (classification will be integrated later)
+    if async_mode:
+        try:
+            # Ship the compressed bytes, not the decoded pixels: far cheaper to pickle.
+            job_id = submit_hair_job(decoded["user_id"], filename, image_bytes, output_args)
+            return jsonify({
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/api/jobs/{job_id}"
+            }), 202, {"Location": f"/api/jobs/{job_id}"}
+        except JobQueueFull as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "2"}
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    # Hair removal, then classification when the model is loaded
     try:
-        original_bgr = cv2.imread(filepath)
-        if original_bgr is None:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            return jsonify({"error": "Failed to decode uploaded image"}), 400
+        response_payload, images = build_hair_removal_result(
+            original_bgr, image_bytes, spec, inline_images=not multipart
+        )
+        record_analysis(
+            build_analysis_record(decoded["user_id"], response_payload, filename, datetime.datetime.utcnow())
+        )
+        attach_image_urls(response_payload)
+        if multipart:
+            body, content_type = build_multipart(response_payload, images)
+            return Response(body, status=200, content_type=content_type)
+        return jsonify(response_payload), 200
 
-        hair_removed_bgr, hair_mask, hair_method = get_hair_removed_image(original_bgr)
-        processed_image_data_url = encode_bgr_to_data_url(hair_removed_bgr)
-        mask_image_data_url = encode_mask_to_data_url(hair_mask)
-        overlay_data_url = encode_bgr_to_data_url(apply_mask_overlay(original_bgr, hair_mask))
-        mask_coverage = round(float((hair_mask > 0).sum()) * 100.0 / float(hair_mask.size), 2)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        created_at = datetime.datetime.utcnow()
-        response_payload = {
-            "analysis_available": False,
-            "message": "Hair removal completed successfully.",
-            "result": "Hair Removal Completed",
-            "diagnosis": "Preprocessing complete",
-            "confidence": "N/A",
-            "severity": "N/A",
-            "status": "hair_processed_only",
-            "hair_removal": {
-                "applied": True,
-                "method": hair_method,
-                "model_backend": hair_model_backend,
-                "model_error": hair_model_error,
-                "mask_coverage_percent": mask_coverage,
-                "validation_mode": "strict" if STRICT_IMAGE_VALIDATION else "non_strict"
-            },
-            "mask_image": mask_image_data_url,
-            "mask_overlay_image": overlay_data_url,
-            "processed_image": processed_image_data_url,
-            "raw_scores": {}
+
+def process_batch_item(user_id, item, spec=DEFAULT_OUTPUT_SPEC):
+    """Hair-remove one batch image; returns (ndjson_line, analysis_record or None)."""
+    line = {"index": item.index, "filename": item.name}
+    if item.error:
+        line.update({"status": "error", "error": item.error})
+        return line, None
+
+    original_bgr = decode_image_bytes(item.data)
+    if original_bgr is None:
+        line.update({"status": "error", "error": "Invalid image: Invalid image file"})
+        return line, None
+
+    is_valid, reason = validate_dermoscopic_image(original_bgr)
+    if not is_valid:
+        line.update({"status": "error", "error": f"Invalid image: {reason}"})
+        return line, None
+
+    try:
+        payload = build_hair_removal_payload(original_bgr, item.data, spec)
+    except Exception as e:
+        line.update({"status": "error", "error": str(e)})
+        return line, None
+
+    base_name = secure_filename(os.path.basename(item.name)) or f"image_{item.index}"
+    filename = f"{int(datetime.datetime.utcnow().timestamp() * 1000)}_{base_name}"
+    record = build_analysis_record(user_id, payload, filename, datetime.datetime.utcnow())
+    # Client-side id so the line can reference the analysis before the chunk is written.
+    record["_id"] = ObjectId()
+    line.update({"status": "ok", "analysis_id": str(record["_id"]), "result": payload})
+    return line, record
+
+
+def record_analyses(records):
+    """Write a chunk of analyses in one round trip; returns how many were stored."""
+    if not records:
+        return 0
+    try:
+        stored = len(analyses_collection.insert_many(records, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        # Counters are left for reconcile_counters() since we can't tell which records landed.
+        print(f"Batch analysis insert partially failed: {len(e.details.get('writeErrors', []))} errors")
+        return e.details.get("nInserted", 0)
+    except Exception as e:
+        print(f"Batch analysis insert failed: {e}")
+        return 0
+
+    bump_analysis_counters(records)
+    return stored
+
+
+def stream_batch_results(user_id, items, spec=DEFAULT_OUTPUT_SPEC):
+    counts = {"total": 0, "succeeded": 0, "failed": 0, "stored": 0}
+    pending_records = []
+    completed = bounded_as_completed(
+        get_batch_executor(),
+        lambda item: process_batch_item(user_id, item, spec),
+        items,
+        max_in_flight=max(1, BATCH_PREDICT_WORKERS) * 2
+    )
+    for item, future in completed:
+        try:
+            line, record = future.result()
+        except Exception as e:
+            line, record = {"index": item.index, "filename": item.name, "status": "error", "error": str(e)}, None
+        # Only the bytes still queued are kept; drop them once processed.
+        item.data = None
+
+        counts["total"] += 1
+        if record is None:
+            counts["failed"] += 1
+        else:
+            counts["succeeded"] += 1
+            attach_image_urls(line["result"])
+            pending_records.append(record)
+            if len(pending_records) >= BATCH_PREDICT_CHUNK:
+                counts["stored"] += record_analyses(pending_records)
+                pending_records = []
+        yield json.dumps(line) + "\n"
+
+    counts["stored"] += record_analyses(pending_records)
+    yield json.dumps({"summary": counts}) + "\n"
+
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Hair-remove many images (repeated `files` parts and/or zip archives) and
+    stream one NDJSON line per image as it completes, then a summary line."""
+    decoded, error = decode_auth_token_from_request()
+    if error:
+        return error
+
+    uploads = request.files.getlist('files') + request.files.getlist('archive')
+    if not uploads:
+        return jsonify({"error": "No files uploaded"}), 400
+
+    try:
+        spec = parse_output_spec({key: request.args[key] for key in OUTPUT_SPEC_ARGS if key in request.args})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not wait_for_models():
+        return jsonify({"error": "Models are still loading, try again shortly"}), 503, {"Retry-After": "5"}
+
+    user_id = decoded["user_id"]
+    uploads = detach_uploads(uploads)
+    items = iter_upload_items(
+        uploads, allowed_file, BATCH_PREDICT_MAX_FILES, int(BATCH_PREDICT_MAX_IMAGE_MB * 1024 * 1024)
+    )
+
+    def generate():
+        try:
+            yield from stream_batch_results(user_id, items, spec)
+        finally:
+            for upload in uploads:
+                upload.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        decoded, error = decode_auth_token_from_request()
+        if error:
+            return error
+
+        job = job_queue.get(job_id, decoded["user_id"])
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+
+        body = {
+            "job_id": str(job["_id"]),
+            "status": job["status"],
+            "created_at_iso": job["created_at"].replace(tzinfo=datetime.timezone.utc).isoformat(),
+            "started_at_iso": (
+                job["started_at"].replace(tzinfo=datetime.timezone.utc).isoformat()
+                if job.get("started_at") else None
+            ),
+            "finished_at_iso": (
+                job["finished_at"].replace(tzinfo=datetime.timezone.utc).isoformat()
+                if job.get("finished_at") else None
+            )
         }
+        if job["status"] == "done":
+            body["result"] = attach_image_urls(job["result"])
+        elif job["status"] == "failed":
+            body["error"] = job["error"]
+        return jsonify(body), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        analyses_collection.insert_one({
-            "user_id": decoded["user_id"],
-            "result": response_payload["result"],
-            "diagnosis": response_payload["diagnosis"],
-            "confidence": response_payload["confidence"],
-            "severity": response_payload["severity"],
-            "status": response_payload["status"],
-            "raw_scores": response_payload["raw_scores"],
-            "filename": filename,
-            "created_at": created_at
-        })
 
-        if os.path.exists(filepath):
-            os.remove(filepath)
+# Health Routes
 
-        return jsonify(response_payload), 200
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    if METRICS_TOKEN and request.headers.get("Authorization", "") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(metrics_registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    ready = is_serving_ready()
+    return jsonify({
+        "ready": ready,
+        "modelLoadStatus": model_load_state["status"],
+        "modelLoadError": model_load_state["error"],
+        "warmupMs": model_load_state["warmup_ms"],
+        "classificationModelLoaded": model is not None,
+        "hairModelLoaded": hair_model is not None,
+        "hairModelBackend": hair_model_backend,
+        "hairModelError": hair_model_error
+    }), 200 if ready else 503
+
+
+# Artifact Route
+
+@app.route('/api/artifacts/<artifact_id>', methods=['GET'])
+def get_artifact(artifact_id):
+    """Stream a stored image. Ids are content hashes, so responses never change.
 
+    Only signed links minted by attach_image_urls() are honoured.
+    """
+    if artifact_store is None or not is_valid_artifact_id(artifact_id):
+        return jsonify({"error": "Artifact not found"}), 404
+    valid_for = check_artifact_link(artifact_id)
+    if valid_for is None:
+        return jsonify({"error": "Invalid or expired artifact link"}), 403
+
+    etag = artifact_id.split('.', 1)[0]
+    headers = {
+        "ETag": f'"{etag}"',
+        # Cached no longer than the link itself is valid.
+        "Cache-Control": f"private, max-age={valid_for}, immutable"
+    }
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    try:
+        opened = artifact_store.open(artifact_id)
     except Exception as e:
-        if os.path.exists(filepath):
-            os.remove(filepath)
         return jsonify({"error": str(e)}), 500
+    if opened is None:
+        return jsonify({"error": "Artifact not found"}), 404
+
+    stream, length = opened
+    headers["Content-Length"] = str(length)
+    return Response(
+        iter_chunks(stream),
+        mimetype=artifact_mime(artifact_id),
+        headers=headers,
+        direct_passthrough=True
+    )
+
+
+@app.route('/api/artifacts/<artifact_id>/thumb/<int:size>', methods=['GET'])
+def get_artifact_thumbnail(artifact_id, size):
+    """A JPEG thumbnail of a stored image, no larger than `size` on its long side."""
+    if thumbnail_cache is None or not is_valid_artifact_id(artifact_id):
+        return jsonify({"error": "Artifact not found"}), 404
+    valid_for = check_artifact_link(artifact_id)
+    if valid_for is None:
+        return jsonify({"error": "Invalid or expired artifact link"}), 403
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({"error": f"Unsupported thumbnail size. Choose from: {', '.join(map(str, THUMBNAIL_SIZES))}"}), 400
+
+    key = f"{artifact_id.split('.', 1)[0]}_{size}"
+    headers = {
+        "ETag": f'"{key}"',
+        "Cache-Control": f"private, max-age={valid_for}, immutable"
+    }
+    if key in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    opened = thumbnail_cache.open(key)
+    if opened is None:
+        try:
+            data = artifact_store.read(artifact_id)
+            thumbnail = make_thumbnail(data, size) if data is not None else None
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        if thumbnail is None:
+            return jsonify({"error": "Artifact not found"}), 404
+        try:
+            thumbnail_cache.put(key, thumbnail)
+        except Exception as e:
+            print(f"Thumbnail cache write failed: {e}")
+        headers["Content-Length"] = str(len(thumbnail))
+        return Response(thumbnail, mimetype=THUMBNAIL_MIME, headers=headers)
+
+    stream, length = opened
+    headers["Content-Length"] = str(length)
+    return Response(iter_chunks(stream), mimetype=THUMBNAIL_MIME, headers=headers, direct_passthrough=True)
+
+
+if MODEL_LOAD_MODE == "eager":
+    load_models()
+elif MODEL_LOAD_MODE == "background":
+    start_model_loader()
 
 
 if __name__ == '__main__':
+    start_server_workers()
     app.run(debug=True, port=5000)
@@ -0,0 +1,107 @@
+"""Delete stored artifacts that no analysis record references any more.
+
+Usage (from TRACE_Backend):
+    python artifact_gc.py                      # report what would be deleted
+    python artifact_gc.py --delete             # delete it
+    python artifact_gc.py --delete --grace-hours 48
+
+Artifacts are content-addressed and shared between analyses of identical
+images, so deleting an analysis cannot remove its images directly. This sweep
+counts references across every analysis record and deletes artifacts (and
+their cached thumbnails) that have none. Artifacts stored within the grace
+period are kept, because a /predict response may have stored its images but
+not yet written its record (write-behind, async jobs). Run it from cron; it
+reads the same ARTIFACT_* and THUMBNAIL_* settings as app.py.
+"""
+import os
+import sys
+import time
+import argparse
+
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from artifact_store import GridFSArtifactStore, LocalArtifactStore
+from thumbnails import ThumbnailCache
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/trace_db")
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "local").lower()
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+THUMBNAILS_ENABLED = os.getenv("THUMBNAILS_ENABLED", "true").lower() == "true"
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", os.path.join("cache", "thumbnails"))
+THUMBNAIL_CACHE_MB = float(os.getenv("THUMBNAIL_CACHE_MB", "256"))
+DEFAULT_GRACE_HOURS = 24
+
+
+def referenced_artifacts(db):
+    referenced = set()
+    for record in db["analyses"].find({"artifacts": {"$type": "object"}}, {"artifacts": 1}):
+        referenced.update(value for value in record["artifacts"].values() if isinstance(value, str))
+    return referenced
+
+
+def unreferenced_artifacts(store, referenced, grace_seconds, now=None):
+    """Artifact ids with no reference that were last stored before the grace period."""
+    cutoff = (now or time.time()) - grace_seconds
+    return [
+        artifact_id for artifact_id, stored_at in store.list()
+        if artifact_id not in referenced and stored_at < cutoff
+    ]
+
+
+def collect(db, store, thumbnail_cache, grace_seconds, delete=False):
+    """Return (artifacts found unreferenced, artifacts deleted, thumbnails deleted)."""
+    # References are read before listing, so a record written meanwhile points at
+    # an artifact that is then inside the grace period.
+    referenced = referenced_artifacts(db)
+    garbage = unreferenced_artifacts(store, referenced, grace_seconds)
+    if not delete:
+        return len(garbage), 0, 0
+
+    deleted = [artifact_id for artifact_id in garbage if store.delete(artifact_id)]
+    thumbnails = 0
+    if thumbnail_cache is not None and deleted:
+        # Thumbnail keys are "<artifact sha256>_<size>".
+        digests = {artifact_id.split(".", 1)[0] for artifact_id in deleted}
+        thumbnails = thumbnail_cache.remove_matching(lambda key: key.split("_", 1)[0] in digests)
+    return len(garbage), len(deleted), thumbnails
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Delete artifacts no analysis references.")
+    parser.add_argument("--delete", action="store_true", help="delete (default: only report)")
+    parser.add_argument("--grace-hours", type=float, default=DEFAULT_GRACE_HOURS,
+                        help=f"keep artifacts stored more recently than this (default {DEFAULT_GRACE_HOURS})")
+    args = parser.parse_args(argv[1:])
+
+    try:
+        client = MongoClient(MONGO_URI)
+        db = client.get_database()
+        if ARTIFACT_STORE == "local":
+            store = LocalArtifactStore(ARTIFACT_DIR)
+        elif ARTIFACT_STORE == "gridfs":
+            store = GridFSArtifactStore(db)
+        else:
+            print(f"Nothing to collect with ARTIFACT_STORE={ARTIFACT_STORE}")
+            return 0
+        thumbnail_cache = None
+        if THUMBNAILS_ENABLED and os.path.isdir(THUMBNAIL_CACHE_DIR):
+            thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MB * 1024 * 1024)
+
+        found, deleted, thumbnails = collect(
+            db, store, thumbnail_cache, args.grace_hours * 3600, delete=args.delete
+        )
+        if args.delete:
+            print(f"Deleted {deleted} unreferenced artifacts and {thumbnails} cached thumbnails.")
+        else:
+            print(f"{found} unreferenced artifacts older than {args.grace_hours:g}h; run with --delete to remove them.")
+        return 0
+    except Exception as e:
+        print(f"System Error: {str(e)}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
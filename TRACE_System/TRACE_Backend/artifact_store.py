@@ -0,0 +1,167 @@
+import os
+import re
+import hashlib
+import datetime
+import threading
+
+MIME_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+EXTENSION_MIMES = {ext: mime for mime, ext in MIME_EXTENSIONS.items()}
+
+# Artifact ids are "<sha256 hex>.<ext>", so they double as unguessable URLs.
+ARTIFACT_ID_PATTERN = re.compile(r"^[0-9a-f]{64}\.(jpg|png|webp)$")
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_artifact_id(data, mime):
+    ext = MIME_EXTENSIONS.get(mime)
+    if ext is None:
+        raise ValueError(f"Unsupported artifact type: {mime}")
+    return f"{hashlib.sha256(data).hexdigest()}.{ext}"
+
+
+def is_valid_artifact_id(artifact_id):
+    return bool(ARTIFACT_ID_PATTERN.match(artifact_id or ""))
+
+
+def artifact_mime(artifact_id):
+    return EXTENSION_MIMES[artifact_id.rsplit(".", 1)[1]]
+
+
+def iter_chunks(stream):
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        stream.close()
+
+
+class LocalArtifactStore:
+    """Content-addressed files under `root/<first two hex chars>/<artifact id>`."""
+
+    backend = "local"
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, artifact_id):
+        return os.path.join(self.root, artifact_id[:2], artifact_id)
+
+    def put(self, data, mime):
+        artifact_id = make_artifact_id(data, mime)
+        path = self._path(artifact_id)
+        if os.path.exists(path):
+            # A new reference to old content restarts artifact_gc.py's grace period.
+            try:
+                os.utime(path, None)
+                return artifact_id
+            except FileNotFoundError:
+                pass  # collected just now; write it again
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+        return artifact_id
+
+    def open(self, artifact_id):
+        """Return (binary stream, length) or None when the artifact is unknown."""
+        path = self._path(artifact_id)
+        try:
+            return open(path, "rb"), os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+
+    def read(self, artifact_id):
+        opened = self.open(artifact_id)
+        if opened is None:
+            return None
+        stream, _length = opened
+        with stream:
+            return stream.read()
+
+    def exists(self, artifact_id):
+        return os.path.exists(self._path(artifact_id))
+
+    def list(self):
+        """Yield (artifact id, seconds since epoch it was last stored) for every artifact."""
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if is_valid_artifact_id(entry.name):
+                    yield entry.name, entry.stat().st_mtime
+
+    def delete(self, artifact_id):
+        try:
+            os.remove(self._path(artifact_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+
+class GridFSArtifactStore:
+    """Content-addressed files in a GridFS bucket, using the artifact id as filename."""
+
+    backend = "gridfs"
+
+    def __init__(self, database, bucket_name="artifacts"):
+        import gridfs
+
+        self.bucket = gridfs.GridFSBucket(database, bucket_name=bucket_name)
+        self.files = database[f"{bucket_name}.files"]
+        self._no_file = gridfs.errors.NoFile
+
+    def put(self, data, mime):
+        artifact_id = make_artifact_id(data, mime)
+        now = datetime.datetime.utcnow()
+        # A new reference to old content restarts artifact_gc.py's grace period.
+        touched = self.files.update_one({"filename": artifact_id}, {"$set": {"metadata.storedAt": now}})
+        if touched.matched_count == 0:
+            self.bucket.upload_from_stream(artifact_id, data, metadata={"contentType": mime, "storedAt": now})
+        return artifact_id
+
+    def open(self, artifact_id):
+        try:
+            grid_out = self.bucket.open_download_stream_by_name(artifact_id)
+        except self._no_file:
+            return None
+        return grid_out, grid_out.length
+
+    def read(self, artifact_id):
+        opened = self.open(artifact_id)
+        if opened is None:
+            return None
+        stream, _length = opened
+        with stream:
+            return stream.read()
+
+    def exists(self, artifact_id):
+        return self.files.find_one({"filename": artifact_id}, {"_id": 1}) is not None
+
+    def list(self):
+        """Yield (artifact id, seconds since epoch it was last stored) for every artifact."""
+        for doc in self.files.find({}, {"filename": 1, "uploadDate": 1, "metadata.storedAt": 1}):
+            if not is_valid_artifact_id(doc.get("filename")):
+                continue
+            stored_at = (doc.get("metadata") or {}).get("storedAt") or doc["uploadDate"]
+            yield doc["filename"], stored_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+    def delete(self, artifact_id):
+        deleted = False
+        for doc in self.files.find({"filename": artifact_id}, {"_id": 1}):
+            try:
+                self.bucket.delete(doc["_id"])
+                deleted = True
+            except self._no_file:
+                pass
+        return deleted
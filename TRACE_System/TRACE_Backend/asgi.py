@@ -0,0 +1,297 @@
+"""ASGI entry point for the TRACE backend.
+
+Usage (from TRACE_Backend):
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+    python asgi.py
+
+Login, history and the admin read endpoints run natively on the event loop
+against pymongo's AsyncMongoClient, so thousands of concurrent requests waiting
+on MongoDB cost coroutines rather than OS threads. Every other route (signup,
+/predict, artifacts, jobs, metrics, ...) is served by the unchanged Flask app
+through a bounded thread pool, which also keeps CPU-bound hair removal and
+classification off the event loop. `python app.py` keeps working as before.
+"""
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+import bcrypt
+from a2wsgi import WSGIMiddleware
+from pymongo import AsyncMongoClient
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import app as trace_app
+from analytics import (
+    COUNTERS_ID, compute_analytics, counters_from_doc, reconcile_counters, user_summary_from_rows,
+    user_summary_pipeline
+)
+from metrics import MongoCommandTimer, StageTimings
+from pagination import InvalidCursor, fetch_page_async, parse_projection
+
+# Threads serving the mounted Flask app; bounds concurrent /predict work per process.
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "16"))
+ASGI_MONGO_MAX_POOL_SIZE = int(os.getenv("ASGI_MONGO_MAX_POOL_SIZE", "100"))
+ASGI_HOST = os.getenv("ASGI_HOST", "127.0.0.1")
+ASGI_PORT = int(os.getenv("ASGI_PORT", "5000"))
+
+# Endpoint and MongoDB time of the native request running in this task (Flask keeps them in g).
+native_request = ContextVar("native_request", default=None)
+
+
+class TraceJSONResponse(JSONResponse):
+    """Serialize with Flask's JSON provider so both entry points return identical bodies."""
+
+    def render(self, content):
+        return (trace_app.app.json.dumps(content, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def error_response(message, status):
+    return TraceJSONResponse({"error": message}, status_code=status)
+
+
+def authorize(request, admin=False):
+    return trace_app.decode_auth_token(trace_app.bearer_token(request.headers.get("authorization")), admin)
+
+
+def query_int(request, name, default):
+    # Same leniency as Flask's request.args.get(..., type=int).
+    try:
+        return int(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class RequestMetricsMiddleware:
+    """Records a native route in the same metrics as app.finish_request_metrics().
+
+    Native routes bypass Flask's before_request/after_request, so the request
+    histogram and the Server-Timing header are produced here instead.
+    """
+
+    def __init__(self, app, endpoint):
+        self.app = app
+        self.endpoint = endpoint
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not trace_app.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = StageTimings()
+        state = {"endpoint": self.endpoint, "mongo_seconds": 0.0}
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - timings.started
+                trace_app.http_request_seconds.observe(
+                    elapsed, method=scope["method"], endpoint=self.endpoint, status=message["status"]
+                )
+                if trace_app.SERVER_TIMING:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", timings.server_timing({"db": state["mongo_seconds"]})
+                    )
+            await send(message)
+
+        token = native_request.set(state)
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            native_request.reset(token)
+
+
+def record_mongo_command(command, collection, seconds, failed):
+    # Async commands report on the task that awaited them, so the context var
+    # names the native request they belong to.
+    state = native_request.get()
+    endpoint = state["endpoint"] if state is not None else "background"
+    trace_app.mongo_command_seconds.observe(seconds, command=command, collection=collection, endpoint=endpoint)
+    if failed:
+        trace_app.mongo_command_failures_total.inc(command=command, collection=collection)
+    if state is not None:
+        state["mongo_seconds"] += seconds
+
+
+@asynccontextmanager
+async def lifespan(application):
+    # The async client binds to the running event loop, so it is created here
+    # rather than at import time.
+    mongo = AsyncMongoClient(
+        trace_app.MONGO_URI,
+        maxPoolSize=ASGI_MONGO_MAX_POOL_SIZE,
+        event_listeners=[MongoCommandTimer(record_mongo_command)] if trace_app.METRICS_ENABLED else []
+    )
+    application.state.db = mongo.get_database()
+    trace_app.start_server_workers()
+    try:
+        yield
+    finally:
+        await run_in_threadpool(trace_app.analysis_writer.close)
+        await mongo.close()
+
+
+# Authentication Routes
+
+async def login(request):
+    try:
+        data = await request.json()
+        email = (data.get('email') or '').lower().strip()
+        password = data.get('password')
+        db = request.app.state.db
+
+        user = await db["users"].find_one({"email": email})
+        collection_type = "user"
+
+        if not user:
+            user = await db["admins"].find_one({"email": email})
+            collection_type = "admin"
+
+        if not user:
+            return error_response("User not found", 404)
+
+        # bcrypt is deliberately slow; keep it off the event loop.
+        if await run_in_threadpool(bcrypt.checkpw, password.encode('utf-8'), user['password']):
+            return TraceJSONResponse(trace_app.build_login_payload(user, collection_type))
+        return error_response("Invalid Password", 401)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+# History Routes
+
+async def analyses_page_response(request, query, default_limit, max_limit):
+    """Async twin of app.analyses_page_response(), with the same parameters and headers."""
+    limit = max(1, min(query_int(request, "limit", default_limit), max_limit))
+    cursor = request.query_params.get("cursor") or None
+
+    try:
+        projection = parse_projection(request.query_params.get("fields"), trace_app.ANALYSIS_FIELDS)
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    try:
+        records, next_cursor = await fetch_page_async(
+            request.app.state.db["analyses"], query, limit, cursor, projection
+        )
+    except InvalidCursor as e:
+        return error_response(str(e), 400)
+
+    headers = {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    host_url = str(request.base_url)
+    return TraceJSONResponse([trace_app.serialize_analysis(rec, host_url) for rec in records], headers=headers)
+
+
+async def get_history(request):
+    try:
+        decoded, error = authorize(request)
+        if error:
+            return error_response(*error)
+        return await analyses_page_response(
+            request, {"user_id": decoded['user_id']}, trace_app.HISTORY_PAGE_DEFAULT, trace_app.HISTORY_PAGE_MAX
+        )
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+async def get_history_summary(request):
+    try:
+        decoded, error = authorize(request)
+        if error:
+            return error_response(*error)
+
+        recent = query_int(request, "recent", trace_app.SUMMARY_RECENT_DEFAULT)
+        recent = max(1, min(recent, trace_app.SUMMARY_RECENT_MAX))
+        pipeline = user_summary_pipeline(decoded['user_id'], recent, trace_app.SUMMARY_RECENT_PROJECTION)
+
+        cursor = await request.app.state.db["analyses"].aggregate(pipeline)
+        summary = user_summary_from_rows(await cursor.to_list(None))
+        host_url = str(request.base_url)
+        summary["recent"] = [trace_app.serialize_analysis(rec, host_url) for rec in summary["recent"]]
+        return TraceJSONResponse(summary)
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+# Admin Routes
+
+async def get_all_users(request):
+    try:
+        _admin, error = authorize(request, admin=True)
+        if error:
+            return error_response(*error)
+        users = await request.app.state.db["users"].find({}, {"password": 0}).to_list(None)
+        for user in users:
+            user['_id'] = str(user['_id'])
+        return TraceJSONResponse(users)
+    except Exception:
+        return TraceJSONResponse([], status_code=500)
+
+
+async def get_analytics(request):
+    try:
+        _admin, error = authorize(request, admin=True)
+        if error:
+            return error_response(*error)
+        # The rare full recompute goes through the sync helpers on a worker thread.
+        if not trace_app.ANALYTICS_COUNTERS:
+            return TraceJSONResponse(await run_in_threadpool(compute_analytics, trace_app.db))
+
+        counts = counters_from_doc(await request.app.state.db["counters"].find_one({"_id": COUNTERS_ID}))
+        if counts is None:
+            counts, _drift = await run_in_threadpool(reconcile_counters, trace_app.db)
+        return TraceJSONResponse(counts)
+    except Exception:
+        return TraceJSONResponse({}, status_code=500)
+
+
+async def get_all_analyses_admin(request):
+    try:
+        _admin, error = authorize(request, admin=True)
+        if error:
+            return error_response(*error)
+        return await analyses_page_response(
+            request, {}, trace_app.ADMIN_ANALYSES_PAGE_DEFAULT, trace_app.ADMIN_ANALYSES_PAGE_MAX
+        )
+    except Exception as e:
+        return error_response(str(e), 500)
+
+
+# CORS preflights don't match these method lists, so they fall through to the
+# Flask app and flask-cors answers them exactly as before.
+NATIVE_MIDDLEWARE = [
+    Middleware(CORSMiddleware, allow_origins=["*"], expose_headers=["X-Next-Cursor", "Link"])
+]
+
+
+def native_route(path, endpoint, methods):
+    # Outermost, so the recorded duration includes CORS handling like Flask's does.
+    middleware = [Middleware(RequestMetricsMiddleware, endpoint=path)] + NATIVE_MIDDLEWARE
+    return Route(path, endpoint, methods=methods, middleware=middleware)
+
+
+routes = [
+    native_route('/api/auth/login', login, ['POST']),
+    native_route('/api/history', get_history, ['GET']),
+    native_route('/api/history/summary', get_history_summary, ['GET']),
+    native_route('/api/admin/users', get_all_users, ['GET']),
+    native_route('/api/admin/analytics', get_analytics, ['GET']),
+    native_route('/api/admin/analyses', get_all_analyses_admin, ['GET']),
+    Mount('/', app=WSGIMiddleware(trace_app.app, workers=ASGI_WSGI_THREADS)),
+]
+
+application = Starlette(routes=routes, lifespan=lifespan)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(application, host=ASGI_HOST, port=ASGI_PORT)
@@ -0,0 +1,241 @@
+"""Run hair removal over a directory tree of images without going through HTTP.
+
+Usage:
+    python batch_hair_removal.py INPUT_DIR OUTPUT_DIR [--workers N] [--no-masks] [--no-resume] [--limit N]
+
+Outputs mirror the input tree: `<name>.<ext>` is the hair-removed image and
+`<name>_mask.png` the hair mask. Images that fail validation are listed in
+`OUTPUT_DIR/rejected.txt`. Images with output, or listed there, are skipped,
+so an interrupted run continues where it stopped; --no-resume redoes both.
+"""
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+STAGES = ("read", "decode", "validate", "hair_removal", "write")
+# "<relative path>\t<reason>" per image that failed validation.
+REJECTED_MANIFEST = "rejected.txt"
+
+# Set in each worker process by init_worker().
+trace_app = None
+write_masks = True
+
+
+def output_paths(output_dir, rel_path):
+    stem, ext = os.path.splitext(rel_path)
+    return os.path.join(output_dir, rel_path), os.path.join(output_dir, f"{stem}_mask.png")
+
+
+def is_done(output_dir, rel_path, masks):
+    image_path, mask_path = output_paths(output_dir, rel_path)
+    return os.path.exists(image_path) and (not masks or os.path.exists(mask_path))
+
+
+def read_rejected(output_dir):
+    try:
+        with open(os.path.join(output_dir, REJECTED_MANIFEST), "r", encoding="utf-8") as fh:
+            return {line.split("\t", 1)[0] for line in fh if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def open_rejected_manifest(output_dir, resume):
+    os.makedirs(output_dir, exist_ok=True)
+    return open(os.path.join(output_dir, REJECTED_MANIFEST), "a" if resume else "w", encoding="utf-8")
+
+
+def find_images(input_dir):
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return found
+
+
+def write_atomic(path, image):
+    import cv2
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    ext = os.path.splitext(path)[1]
+    ok, encoded = cv2.imencode(ext, image)
+    if not ok:
+        raise RuntimeError(f"Failed to encode {path}")
+    # Write-then-rename so a crash never leaves a truncated file that resume would trust.
+    tmp_path = f"{path}.tmp"
+    encoded.tofile(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def init_worker(masks, single_threaded):
+    """Import the backend once per process and load only the hair model."""
+    global trace_app, write_masks
+
+    # No web-serving side effects in batch workers.
+    os.environ["MODEL_LOAD_MODE"] = "lazy"
+    os.environ["ENSURE_INDEXES_ON_STARTUP"] = "false"
+    os.environ["EMAIL_OUTBOX"] = "false"
+    os.environ["ANALYSIS_WRITE_BEHIND"] = "false"
+    os.environ["HAIR_CACHE_ENABLED"] = "false"
+    os.environ["ARTIFACT_STORE"] = "none"
+    os.environ["AUDIT_UPLOADS"] = "false"
+    # One image at a time per process: batching would only add its wait window,
+    # and the pool already spreads work across cores.
+    os.environ.setdefault("HAIR_BATCH_MAX_SIZE", "1")
+    if single_threaded:
+        os.environ.setdefault("INPAINT_THREADS", "1")
+        os.environ.setdefault("HAIR_INTRA_OP_THREADS", "1")
+
+    import cv2
+    if single_threaded:
+        cv2.setNumThreads(1)
+
+    import app
+    app.load_hair_model()
+    trace_app = app
+    write_masks = masks
+
+
+def process_image(job):
+    input_dir, output_dir, rel_path = job
+    timings = {}
+
+    def timed(stage, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[stage] = time.perf_counter() - started
+
+    try:
+        image_bytes = timed("read", lambda: np.fromfile(os.path.join(input_dir, rel_path), dtype=np.uint8).tobytes())
+        image = timed("decode", trace_app.decode_image_bytes, image_bytes)
+        if image is None:
+            return rel_path, "failed", timings, "Invalid image file"
+
+        is_valid, reason = timed("validate", trace_app.validate_dermoscopic_image, image)
+        if not is_valid:
+            return rel_path, "rejected", timings, reason
+
+        processed, mask, method = timed("hair_removal", trace_app.get_hair_removed_image, image)
+
+        image_path, mask_path = output_paths(output_dir, rel_path)
+
+        def write_outputs():
+            # The processed image is written last: it marks the file as done.
+            if write_masks:
+                write_atomic(mask_path, mask)
+            write_atomic(image_path, processed)
+
+        timed("write", write_outputs)
+        return rel_path, "done", timings, method
+    except Exception as e:
+        return rel_path, "failed", timings, str(e)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return float(np.percentile(np.array(values), pct))
+
+
+def print_report(results, elapsed, skipped):
+    counts = {"done": 0, "rejected": 0, "failed": 0}
+    stage_times = {stage: [] for stage in STAGES}
+    methods = {}
+    problems = []
+    for rel_path, status, timings, detail in results:
+        counts[status] += 1
+        for stage, seconds in timings.items():
+            stage_times[stage].append(seconds)
+        if status == "done":
+            methods[detail] = methods.get(detail, 0) + 1
+        else:
+            problems.append((rel_path, status, detail))
+
+    processed = len(results)
+    print("--- Batch Hair Removal Report ---")
+    print(f"Processed: {processed}  done: {counts['done']}  rejected: {counts['rejected']}  "
+          f"failed: {counts['failed']}  skipped (resume): {skipped}")
+    print(f"Wall time: {elapsed:.1f}s  throughput: {processed / elapsed if elapsed > 0 else 0.0:.2f} images/s")
+    print(f"{'stage':<14}{'total s':>10}{'mean ms':>10}{'p95 ms':>10}")
+    for stage in STAGES:
+        values = stage_times[stage]
+        if not values:
+            continue
+        print(f"{stage:<14}{sum(values):>10.1f}{np.mean(values) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}")
+    for method, count in sorted(methods.items(), key=lambda item: -item[1]):
+        print(f"Method {method}: {count}")
+    for rel_path, status, detail in problems[:20]:
+        print(f"  {status.upper()} {rel_path}: {detail}")
+    if len(problems) > 20:
+        print(f"  ... and {len(problems) - 20} more")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Batch hair removal over an image directory.")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-masks", action="store_true", help="only write the hair-removed images")
+    parser.add_argument("--no-resume", action="store_true", help="reprocess images that already have outputs")
+    parser.add_argument("--limit", type=int, default=0, help="stop after N images (0 = all)")
+    parser.add_argument("--chunksize", type=int, default=4)
+    args = parser.parse_args(argv[1:])
+
+    if not os.path.isdir(args.input_dir):
+        print(f"Error: '{args.input_dir}' is not a directory.")
+        return 2
+
+    masks = not args.no_masks
+    resume = not args.no_resume
+    images = find_images(args.input_dir)
+    rejected = read_rejected(args.output_dir) if resume else set()
+    pending = images if not resume else [
+        rel_path for rel_path in images
+        if rel_path not in rejected and not is_done(args.output_dir, rel_path, masks)
+    ]
+    skipped = len(images) - len(pending)
+    if args.limit:
+        pending = pending[:args.limit]
+
+    print(f"--- Found {len(images)} images, {skipped} already processed or rejected, {len(pending)} to go ---")
+    if not pending:
+        return 0
+
+    workers = max(1, min(args.workers, len(pending)))
+    jobs = [(args.input_dir, args.output_dir, rel_path) for rel_path in pending]
+    results = []
+    started = time.perf_counter()
+    try:
+        # spawn: the model runtimes are not fork-safe once initialized.
+        context = multiprocessing.get_context("spawn")
+        with open_rejected_manifest(args.output_dir, resume) as manifest, \
+                context.Pool(workers, initializer=init_worker, initargs=(masks, workers > 1)) as pool:
+            for result in pool.imap_unordered(process_image, jobs, chunksize=max(1, args.chunksize)):
+                results.append(result)
+                rel_path, status, _timings, detail = result
+                if status == "rejected":
+                    manifest.write(f"{rel_path}\t{detail}\n")
+                    manifest.flush()
+                if len(results) % 100 == 0:
+                    rate = len(results) / (time.perf_counter() - started)
+                    print(f"{len(results)}/{len(jobs)} ({rate:.2f} images/s)")
+    except KeyboardInterrupt:
+        print("Interrupted; finished images are kept and will be skipped on the next run.")
+    except Exception as e:
+        print(f"System Error: {str(e)}")
+        return 1
+
+    print_report(results, time.perf_counter() - started, skipped)
+    return 0 if all(status != "failed" for _path, status, _timings, _detail in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,138 @@
+import os
+import shutil
+import zipfile
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+ZIP_MIME_TYPES = {"application/zip", "application/x-zip-compressed"}
+SPOOL_MAX_BYTES = 1024 * 1024
+
+
+class UploadItem:
+    """One image of a batch upload: its bytes, or the reason it could not be read."""
+
+    def __init__(self, index, name, data=None, error=None):
+        self.index = index
+        self.name = name
+        self.data = data
+        self.error = error
+
+
+class DetachedUpload:
+    """Copy of an uploaded part that outlives the request.
+
+    Flask closes request.files when the view returns, which is before a
+    streamed response body runs. Parts are copied into spooled temporary
+    files (memory up to SPOOL_MAX_BYTES, then disk) that the caller closes.
+    """
+
+    def __init__(self, file_storage):
+        self.filename = file_storage.filename
+        self.mimetype = file_storage.mimetype
+        self.stream = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        shutil.copyfileobj(file_storage.stream, self.stream)
+        self.stream.seek(0)
+
+    def close(self):
+        self.stream.close()
+
+
+def detach_uploads(file_storages):
+    return [DetachedUpload(file_storage) for file_storage in file_storages]
+
+
+def is_zip_upload(file_storage):
+    name = (file_storage.filename or "").lower()
+    return name.endswith(".zip") or file_storage.mimetype in ZIP_MIME_TYPES
+
+
+def _read_capped(stream, max_bytes):
+    data = stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        return None
+    return data
+
+
+def _iter_zip(file_storage, allowed, max_bytes):
+    # The part is a seekable (spooled) file, so ZipFile reads the central
+    # directory and inflates members one at a time instead of all at once.
+    try:
+        archive = zipfile.ZipFile(file_storage.stream)
+    except zipfile.BadZipFile:
+        yield file_storage.filename, None, "Invalid zip archive"
+        return
+
+    with archive:
+        for info in archive.infolist():
+            name = info.filename
+            base = os.path.basename(name)
+            if info.is_dir() or not base or base.startswith('.') or name.startswith("__MACOSX/"):
+                continue
+            if not allowed(base):
+                yield name, None, "Invalid file type"
+                continue
+            if info.file_size > max_bytes:
+                yield name, None, "File too large"
+                continue
+            try:
+                with archive.open(info) as member:
+                    data = _read_capped(member, max_bytes)
+            except (zipfile.BadZipFile, RuntimeError, OSError) as e:
+                yield name, None, f"Unreadable archive member: {e}"
+                continue
+            if data is None:
+                yield name, None, "File too large"
+                continue
+            yield name, data, None
+
+
+def iter_upload_items(file_storages, allowed, max_files, max_bytes):
+    """Yield UploadItems from plain image parts and zip archives, lazily and in order.
+
+    `file_storages` may be werkzeug FileStorage objects or DetachedUploads.
+
+    At most `max_files` items are produced; an extra item carrying an error is
+    yielded when the limit cuts the upload short.
+    """
+    index = 0
+
+    def sources():
+        for file_storage in file_storages:
+            if is_zip_upload(file_storage):
+                yield from _iter_zip(file_storage, allowed, max_bytes)
+            elif not allowed(file_storage.filename or ""):
+                yield file_storage.filename, None, "Invalid file type"
+            else:
+                data = _read_capped(file_storage.stream, max_bytes)
+                yield file_storage.filename, data, None if data is not None else "File too large"
+
+    for name, data, error in sources():
+        if index >= max_files:
+            yield UploadItem(index, name, error=f"Batch limit of {max_files} images reached; remaining files skipped")
+            return
+        yield UploadItem(index, name, data, error)
+        index += 1
+
+
+def bounded_as_completed(executor, fn, items, max_in_flight):
+    """Like executor.map, but yields (item, future) as they finish and never
+    holds more than `max_in_flight` submitted items, so a long input iterator
+    is consumed only as fast as the pool drains it.
+    """
+    pending = {}
+    items = iter(items)
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < max_in_flight:
+            try:
+                item = next(items)
+            except StopIteration:
+                exhausted = True
+                break
+            pending[executor.submit(fn, item)] = item
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
@@ -0,0 +1,210 @@
+"""Micro-benchmarks for the image-processing hot path.
+
+Usage (from TRACE_Backend):
+    python benchmarks/run_benchmarks.py                   # run and compare with the baseline
+    python benchmarks/run_benchmarks.py --save-baseline   # record this machine's baseline
+    python benchmarks/run_benchmarks.py --sizes 512,4000x3000 --repeat 10 --only dullrazor
+
+Images are deterministic synthetic dermoscopic frames with hair strands and
+the hair model is a tiny stand-in, so no real model files are needed. Each
+case reports median/min wall time and the peak traced allocation (numpy
+buffers; OpenCV-internal scratch memory is not visible to tracemalloc).
+Exits 1 when a median is slower than the baseline by more than --threshold.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+# Import the backend as a library: no model loading, Mongo index builds or mail threads.
+os.environ["MODEL_LOAD_MODE"] = "lazy"
+os.environ["ENSURE_INDEXES_ON_STARTUP"] = "false"
+os.environ["EMAIL_OUTBOX"] = "false"
+os.environ["ANALYSIS_WRITE_BEHIND"] = "false"
+os.environ["HAIR_CACHE_ENABLED"] = "false"
+os.environ["ARTIFACT_STORE"] = "none"
+os.environ.setdefault("HAIR_BATCH_MAX_SIZE", "1")
+
+import numpy as np  # noqa: E402
+
+from synthetic_images import make_synthetic_dermoscopic_image  # noqa: E402
+from standin_models import load_standin_backend  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_SIZES = "512,1024x768,2048x1536"
+
+
+def parse_sizes(text):
+    """'512,1024x768' -> [(512, 512), (768, 1024)] as (height, width)."""
+    sizes = []
+    for part in text.split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        if "x" in part:
+            width, height = part.split("x", 1)
+            sizes.append((int(height), int(width)))
+        else:
+            sizes.append((int(part), int(part)))
+    return sizes
+
+
+def build_cases(trace_app):
+    """name -> fn(image, mask) for every function under test."""
+    return {
+        "validate_dermoscopic_image": lambda image, mask: trace_app.validate_dermoscopic_image(image),
+        "remove_hair_dullrazor[full]": lambda image, mask: trace_app.remove_hair_dullrazor(image, max_side=0),
+        "remove_hair_dullrazor[512]": lambda image, mask: trace_app.remove_hair_dullrazor(image, max_side=512),
+        "run_hair_model_inference": lambda image, mask: trace_app.run_hair_model_inference(image),
+        "normalize_mask": lambda image, mask: trace_app.normalize_mask(mask),
+        "apply_mask_overlay": lambda image, mask: trace_app.apply_mask_overlay(image, mask),
+        "encode_bgr_to_data_url": lambda image, mask: trace_app.encode_bgr_to_data_url(image),
+        "encode_mask_to_data_url": lambda image, mask: trace_app.encode_mask_to_data_url(mask),
+    }
+
+
+def measure(fn, repeat, warmup):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000.0)
+
+    # Separate traced run: tracemalloc slows allocation-heavy code and would skew timings.
+    tracemalloc.start()
+    try:
+        fn()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_ms": round(float(np.median(timings)), 3),
+        "min_ms": round(float(np.min(timings)), 3),
+        "peak_mb": round(peak / (1024.0 * 1024.0), 2),
+    }
+
+
+def run(trace_app, sizes, repeat, warmup, only):
+    cases = build_cases(trace_app)
+    if only:
+        cases = {name: fn for name, fn in cases.items() if any(token in name for token in only)}
+
+    results = {}
+    for height, width in sizes:
+        image = make_synthetic_dermoscopic_image(height, width, seed=height * 7 + width)
+        # A float "model output" for normalize_mask and a binary mask for the rest.
+        _, hair_mask = trace_app.remove_hair_dullrazor(image, max_side=0)
+        float_mask = hair_mask.astype(np.float32) / 255.0
+        for name, fn in cases.items():
+            mask = float_mask if name == "normalize_mask" else hair_mask
+            key = f"{name}@{width}x{height}"
+            results[key] = measure(lambda: fn(image, mask), repeat, warmup)
+            stats = results[key]
+            print(f"{key:<48}{stats['median_ms']:>10.2f} ms{stats['min_ms']:>10.2f} ms{stats['peak_mb']:>9.1f} MB")
+    return results
+
+
+def machine_info(backend_description):
+    import cv2
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "hair_standin": backend_description,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regression messages; cases missing from either side are ignored."""
+    regressions = []
+    for key, stats in results.items():
+        previous = baseline.get("results", {}).get(key)
+        if not previous:
+            continue
+        limit = previous["median_ms"] * (1.0 + threshold)
+        change = (stats["median_ms"] / previous["median_ms"] - 1.0) * 100.0 if previous["median_ms"] else 0.0
+        if stats["median_ms"] > limit:
+            regressions.append(
+                f"{key}: {stats['median_ms']:.2f} ms vs baseline {previous['median_ms']:.2f} ms ({change:+.0f}%)"
+            )
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the image-processing hot path.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma list of N or WxH (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", default="", help="comma list of substrings selecting cases")
+    parser.add_argument("--hair-backend", choices=["auto", "onnx", "numpy"], default="auto")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown fraction (default 0.25)")
+    parser.add_argument("--output", default=None, help="also write this run's results as JSON")
+    args = parser.parse_args(argv[1:])
+    args.baseline = os.path.abspath(args.baseline)
+
+    # Checked before the run: without a baseline there is nothing to gate on, and a
+    # green exit would let CI pass every regression.
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        print(f"FAIL: no baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 2
+
+    os.chdir(BACKEND_DIR)
+    import app as trace_app
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        backend, description = load_standin_backend(args.hair_backend, work_dir)
+        trace_app.hair_model = backend
+        trace_app.hair_model_backend = backend.name
+
+        print(f"--- Hot-path benchmarks ({description}, repeat={args.repeat}) ---")
+        print(f"{'case':<48}{'median':>13}{'min':>13}{'peak':>12}")
+        results = run(
+            trace_app, parse_sizes(args.sizes), max(1, args.repeat), max(0, args.warmup),
+            [token.strip() for token in args.only.split(",") if token.strip()]
+        )
+
+    report = {"machine": machine_info(description), "results": results}
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+        print(f"Success: baseline written to {args.baseline}")
+        return 0
+
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)
+    if baseline.get("machine", {}).get("cpus") != os.cpu_count():
+        print("Warning: baseline was recorded on a machine with a different CPU count.")
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"FAIL: {len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}:")
+        for message in regressions:
+            print(f"  - {message}")
+        return 1
+    print(f"PASS: no case slower than baseline by more than {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
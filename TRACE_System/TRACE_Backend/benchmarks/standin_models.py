@@ -0,0 +1,59 @@
+"""Tiny stand-ins for the hair-segmentation model so benchmarks run without model files.
+
+Both predict "hair probability" as the inverted channel mean of the input, which
+is cheap but produces a realistic mask for the synthetic images, so the
+post-processing and inpainting cost downstream of the model is representative.
+"""
+import os
+
+import numpy as np
+
+from hair_backends import OnnxHairBackend
+
+STANDIN_INPUT_SIZE = 256
+
+
+class NumpyHairBackend:
+    name = "numpy_standin"
+    method = "numpy_standin_mask_inpaint"
+    input_size = (STANDIN_INPUT_SIZE, STANDIN_INPUT_SIZE)
+
+    def predict(self, batch):
+        return 1.0 - batch.mean(axis=-1, keepdims=True)
+
+
+def build_onnx_standin(path, input_size=STANDIN_INPUT_SIZE):
+    """Write an NHWC float32 ONNX graph computing 1 - mean(rgb). Needs the `onnx` package."""
+    import onnx  # type: ignore
+    from onnx import TensorProto, helper  # type: ignore
+
+    graph = helper.make_graph(
+        [
+            helper.make_node("ReduceMean", ["input"], ["mean"], axes=[3], keepdims=1),
+            helper.make_node("Sub", ["one", "mean"], ["output"]),
+        ],
+        "hair_standin",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", input_size, input_size, 3])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["batch", input_size, input_size, 1])],
+        initializer=[helper.make_tensor("one", TensorProto.FLOAT, [], [1.0])],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    # Newer onnx releases default to an IR version older runtimes refuse; 8 matches opset 13.
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+    return path
+
+
+def load_standin_backend(kind, work_dir):
+    """Return (backend, description); kind is "onnx", "numpy" or "auto"."""
+    if kind in ("onnx", "auto"):
+        try:
+            path = build_onnx_standin(os.path.join(work_dir, "hair_standin.onnx"))
+            return OnnxHairBackend(path), "onnx stand-in via onnxruntime"
+        except Exception as e:
+            if kind == "onnx":
+                raise
+            print(f"ONNX stand-in unavailable ({e}); using the numpy stand-in.")
+    return NumpyHairBackend(), "numpy stand-in"
+
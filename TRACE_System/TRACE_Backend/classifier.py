@@ -0,0 +1,91 @@
+import cv2
+import numpy as np
+
+
+CLASSIFIER_INPUT_SIZE = 224
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def preprocess_for_classifier(image_bgr, input_size=CLASSIFIER_INPUT_SIZE):
+    """BGR uint8 image -> normalized float32 CHW array, without a batch axis.
+
+    Equivalent to the torchvision Resize/ToTensor/Normalize pipeline on a PIL
+    image, computed straight from the OpenCV array; INTER_AREA stands in for
+    PIL's antialiased bilinear downscale, so values differ by interpolation
+    noise only.
+    """
+    rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+    interpolation = cv2.INTER_AREA if min(rgb.shape[:2]) > input_size else cv2.INTER_LINEAR
+    resized = cv2.resize(rgb, (input_size, input_size), interpolation=interpolation)
+    normalized = (resized.astype(np.float32) / 255.0 - IMAGENET_MEAN) / IMAGENET_STD
+    return np.ascontiguousarray(normalized.transpose(2, 0, 1))
+
+
+def configure_torch_threads(intra_op_threads=0, inter_op_threads=0):
+    import torch
+
+    if intra_op_threads:
+        torch.set_num_threads(int(intra_op_threads))
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(int(inter_op_threads))
+        except RuntimeError as e:
+            # Only allowed before torch starts any parallel work.
+            print(f"Warning: could not set torch inter-op threads: {e}")
+
+
+class TorchClassifier:
+    """CPU/GPU inference wrapper for the TRACE lesion classifier.
+
+    `optimize` is "none", "torchscript" (trace + freeze, the default) or
+    "compile" (torch.compile). Optimization failures fall back to the eager
+    model rather than taking classification down.
+    """
+
+    def __init__(self, module, device, optimize="torchscript", input_size=CLASSIFIER_INPUT_SIZE):
+        import torch
+
+        self.device = device
+        self.input_size = input_size
+        self.eager = module.eval()
+        self.model = self.eager
+        self.optimization = "none"
+        self.optimization_error = None
+
+        example = torch.zeros((1, 3, input_size, input_size), device=device)
+        try:
+            if optimize == "torchscript":
+                with torch.no_grad():
+                    traced = torch.jit.trace(self.eager, example, check_trace=False)
+                self.model = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+                self.optimization = "torchscript"
+            elif optimize == "compile":
+                self.model = torch.compile(self.eager, dynamic=True)
+                self.optimization = "compile"
+        except Exception as e:
+            self.model = self.eager
+            self.optimization_error = str(e)
+            print(f"Classifier optimization '{optimize}' failed, using eager model: {e}")
+
+    def predict(self, batch):
+        """(N, 3, H, W) float32 array -> (N, num_classes) softmax probabilities."""
+        import torch
+
+        x = torch.from_numpy(np.ascontiguousarray(batch, dtype=np.float32)).to(self.device)
+        with torch.inference_mode():
+            try:
+                logits = self.model(x)
+            except Exception as e:
+                if self.model is self.eager:
+                    raise
+                # torch.compile fails lazily (e.g. no C++ toolchain); don't retry every call.
+                print(f"Optimized classifier failed at runtime, using eager model: {e}")
+                self.model = self.eager
+                self.optimization_error = str(e)
+                self.optimization = "none"
+                logits = self.model(x)
+            if isinstance(logits, (tuple, list)):
+                logits = logits[0]
+            probabilities = torch.softmax(logits.float(), dim=1)
+        return probabilities.cpu().numpy()
@@ -0,0 +1,176 @@
+"""Export the Keras hair-segmentation model to ONNX / TFLite and check parity.
+
+Usage:
+    python convert_hair_model.py onnx
+    python convert_hair_model.py tflite
+    python convert_hair_model.py tflite_int8 [--calibration-dir DIR]
+    python convert_hair_model.py parity BACKEND [--images DIR] [--min-iou 0.95]
+"""
+import os
+import sys
+import argparse
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+from hair_backends import default_model_paths, load_hair_backend, preprocess_for_hair_model, prediction_to_mask
+from synthetic_images import make_synthetic_dermoscopic_image
+
+load_dotenv()
+
+HAIR_MODEL_PATH = 'model/chimaera_v2_final.h5'
+HAIR_MASK_THRESHOLD = int(os.getenv("HAIR_MASK_THRESHOLD", "128"))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def iter_images(directory, limit):
+    """Yield BGR images from `directory`, or deterministic synthetic ones if it is not given."""
+    if not directory:
+        for seed in range(limit):
+            yield f"synthetic_{seed}", make_synthetic_dermoscopic_image(512, 512, seed=seed)
+        return
+
+    count = 0
+    for root, _dirs, files in os.walk(directory):
+        for name in sorted(files):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(root, name))
+            if image is None:
+                continue
+            yield name, image
+            count += 1
+            if count >= limit:
+                return
+
+
+def load_keras_model(path):
+    from tensorflow.keras.models import load_model  # type: ignore
+    return load_model(path, compile=False)
+
+
+def export_onnx(keras_path, output_path, opset):
+    import tensorflow as tf  # type: ignore
+    import tf2onnx  # type: ignore
+
+    model = load_keras_model(keras_path)
+    input_shape = list(model.input_shape)
+    input_shape[0] = None
+    spec = (tf.TensorSpec(input_shape, tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=output_path)
+
+
+def export_tflite(keras_path, output_path, int8=False, calibration_dir=None, calibration_count=64):
+    import tensorflow as tf  # type: ignore
+
+    model = load_keras_model(keras_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if int8:
+        input_size = (int(model.input_shape[1] or 256), int(model.input_shape[2] or 256))
+
+        def representative_dataset():
+            for _name, image in iter_images(calibration_dir, calibration_count):
+                yield [np.expand_dims(preprocess_for_hair_model(image, input_size), axis=0)]
+
+        # Full-integer weights and activations; float32 I/O keeps the serving code unchanged.
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    with open(output_path, "wb") as fh:
+        fh.write(converter.convert())
+
+
+def mask_iou(a, b):
+    a = a > 0
+    b = b > 0
+    union = np.logical_or(a, b).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(a, b).sum()) / float(union)
+
+
+def parity_check(backend_name, model_paths, images_dir, limit, min_iou):
+    reference = load_hair_backend("keras", model_paths)
+    candidate = load_hair_backend(backend_name, model_paths)
+
+    ious = []
+    max_abs = 0.0
+    for name, image in iter_images(images_dir, limit):
+        ref_pred = np.asarray(reference.predict(np.expand_dims(
+            preprocess_for_hair_model(image, reference.input_size), axis=0)))[0]
+        cand_pred = np.asarray(candidate.predict(np.expand_dims(
+            preprocess_for_hair_model(image, candidate.input_size), axis=0)))[0]
+
+        if ref_pred.shape == cand_pred.shape:
+            max_abs = max(max_abs, float(np.max(np.abs(ref_pred.astype(np.float32) - cand_pred.astype(np.float32)))))
+
+        iou = mask_iou(
+            prediction_to_mask(ref_pred, image.shape[:2], HAIR_MASK_THRESHOLD),
+            prediction_to_mask(cand_pred, image.shape[:2], HAIR_MASK_THRESHOLD)
+        )
+        ious.append(iou)
+        print(f"{name}: mask IoU {iou:.4f}")
+
+    if not ious:
+        print("Error: no images to compare.")
+        return 1
+
+    mean_iou = float(np.mean(ious))
+    print(f"--- {candidate.name} vs {reference.name} ---")
+    print(f"Images: {len(ious)}  mean IoU: {mean_iou:.4f}  min IoU: {min(ious):.4f}  max |prob diff|: {max_abs:.4f}")
+    if min(ious) < min_iou:
+        print(f"FAIL: min IoU below {min_iou}")
+        return 1
+    print("PASS")
+    return 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Convert and verify hair-segmentation model exports.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("onnx", "tflite", "tflite_int8"):
+        cmd = sub.add_parser(name, help=f"export the Keras model to {name}")
+        cmd.add_argument("--keras", default=HAIR_MODEL_PATH)
+        cmd.add_argument("--output", default=None)
+        if name == "onnx":
+            cmd.add_argument("--opset", type=int, default=13)
+        if name == "tflite_int8":
+            cmd.add_argument("--calibration-dir", default=None, help="real images for calibration (default: synthetic)")
+            cmd.add_argument("--calibration-count", type=int, default=64)
+
+    parity = sub.add_parser("parity", help="compare a converted backend's masks against Keras")
+    parity.add_argument("backend", choices=["onnx", "tflite", "tflite_int8"])
+    parity.add_argument("--keras", default=HAIR_MODEL_PATH)
+    parity.add_argument("--images", default=None, help="directory of test images (default: synthetic)")
+    parity.add_argument("--limit", type=int, default=16)
+    parity.add_argument("--min-iou", type=float, default=0.95)
+
+    args = parser.parse_args(argv[1:])
+    model_paths = default_model_paths(args.keras)
+
+    try:
+        if args.command == "parity":
+            return parity_check(args.backend, model_paths, args.images, args.limit, args.min_iou)
+
+        output = args.output or model_paths[args.command]
+        print(f"--- Exporting {args.keras} -> {output} ---")
+        if args.command == "onnx":
+            export_onnx(args.keras, output, args.opset)
+        elif args.command == "tflite":
+            export_tflite(args.keras, output)
+        else:
+            export_tflite(args.keras, output, int8=True,
+                          calibration_dir=args.calibration_dir, calibration_count=args.calibration_count)
+        print(f"Success: wrote {output}. Run 'python convert_hair_model.py parity {args.command}' to verify.")
+        return 0
+    except Exception as e:
+        print(f"System Error: {str(e)}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -3,6 +3,7 @@ import datetime
 import bcrypt
 from pymongo import MongoClient
 from dotenv import load_dotenv
+from analytics import increment_counters
 
 load_dotenv()
 
@@ -42,6 +43,7 @@ def create_admin_user():
         }
 
         admins_collection.insert_one(admin_data)
+        increment_counters(db, {"admins": 1})
         print("Success: Admin account created in 'admins' collection.")
         
     except Exception as e:
@@ -0,0 +1,157 @@
+import os
+import sys
+from pymongo import MongoClient, ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/trace_db")
+
+# OTP and reset codes are valid for 5 minutes; the TTL monitor runs about once a
+# minute, so the routes keep their own expiry checks and TTL only does cleanup.
+OTP_TTL_SECONDS = 300
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(24 * 3600)))
+SENT_EMAIL_TTL_SECONDS = int(os.getenv("SENT_EMAIL_TTL_SECONDS", str(7 * 24 * 3600)))
+
+INDEX_SPECS = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("role", ASCENDING)], name="role"),
+    ],
+    "admins": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "pending_users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=OTP_TTL_SECONDS),
+    ],
+    "password_resets": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=OTP_TTL_SECONDS),
+    ],
+    "analyses": [
+        # /api/history: find({"user_id"}) sorted newest first, with _id as tie-breaker.
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_created"
+        ),
+        # /api/admin/analyses: all records newest first.
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created"),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("result", ASCENDING)], name="result"),
+    ],
+    "jobs": [
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=JOB_TTL_SECONDS),
+    ],
+    "email_outbox": [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+        # Only sent messages carry sent_at, so queued mail is never expired.
+        IndexModel([("sent_at", ASCENDING)], name="sent_at_ttl", expireAfterSeconds=SENT_EMAIL_TTL_SECONDS),
+    ],
+    "hair_result_cache": [
+        IndexModel([("last_access", ASCENDING)], name="last_access"),
+    ],
+}
+
+
+def _expected_options(model):
+    doc = model.document
+    return {
+        "key": list(doc["key"].items()),
+        "unique": bool(doc.get("unique", False)),
+        "expireAfterSeconds": doc.get("expireAfterSeconds"),
+    }
+
+
+def _actual_options(info):
+    return {
+        "key": [(field, int(direction)) for field, direction in info["key"]],
+        "unique": bool(info.get("unique", False)),
+        "expireAfterSeconds": info.get("expireAfterSeconds"),
+    }
+
+
+def ensure_indexes(db, verbose=False):
+    """Create every declared index; TTL changes on existing indexes are applied via collMod.
+
+    An index MongoDB refuses (for example a unique index over duplicate
+    values) does not stop the others from being built. Returns a list of
+    "collection.index: error" strings, empty when every index was applied.
+    """
+    failures = []
+    for collection_name, models in INDEX_SPECS.items():
+        collection = db[collection_name]
+        for model in models:
+            name = model.document["name"]
+            try:
+                _apply_index(db, collection, model, verbose)
+            except OperationFailure as e:
+                failures.append(f"{collection_name}.{name}: {e}")
+                if verbose:
+                    print(f"FAILED  {collection_name}.{name}: {e}")
+    return failures
+
+
+def _apply_index(db, collection, model, verbose):
+    name = model.document["name"]
+    try:
+        collection.create_indexes([model])
+        if verbose:
+            print(f"OK      {collection.name}.{name}")
+    except OperationFailure as e:
+        ttl = model.document.get("expireAfterSeconds")
+        if ttl is None or e.code not in (85, 86):
+            raise
+        db.command("collMod", collection.name, index={"name": name, "expireAfterSeconds": ttl})
+        if verbose:
+            print(f"UPDATED {collection.name}.{name} (expireAfterSeconds={ttl})")
+
+
+def verify_indexes(db):
+    """Return a list of human-readable problems; empty when everything matches."""
+    problems = []
+    for collection_name, models in INDEX_SPECS.items():
+        existing = db[collection_name].index_information()
+        for model in models:
+            name = model.document["name"]
+            if name not in existing:
+                problems.append(f"{collection_name}.{name}: missing")
+                continue
+            expected = _expected_options(model)
+            actual = _actual_options(existing[name])
+            if expected != actual:
+                problems.append(f"{collection_name}.{name}: expected {expected}, found {actual}")
+    return problems
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else "apply"
+    if command not in ("apply", "verify"):
+        print("Usage: python db_indexes.py [apply|verify]")
+        return 2
+
+    try:
+        client = MongoClient(MONGO_URI)
+        db = client.get_database()
+
+        if command == "apply":
+            print("--- Applying MongoDB Indexes ---")
+            ensure_indexes(db, verbose=True)
+
+        problems = verify_indexes(db)
+        if problems:
+            print("Index verification failed:")
+            for problem in problems:
+                print(f"  - {problem}")
+            return 1
+        print("Success: All indexes are in place.")
+        return 0
+    except Exception as e:
+        print(f"System Error: {str(e)}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
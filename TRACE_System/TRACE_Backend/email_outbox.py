@@ -0,0 +1,221 @@
+import os
+import time
+import smtplib
+import datetime
+import threading
+from email.mime.text import MIMEText
+
+from pymongo import ReturnDocument
+
+
+class SMTPSettings:
+    def __init__(self, host, port, username="", password="", sender="", starttls=True, timeout=30):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def is_configured(self):
+        return bool(self.host and self.sender)
+
+
+def build_message(settings, to_email, subject, body):
+    msg = MIMEText(body)
+    msg['Subject'] = subject
+    msg['From'] = settings.sender
+    msg['To'] = to_email
+    return msg
+
+
+def open_smtp_connection(settings):
+    server = smtplib.SMTP(settings.host, settings.port, timeout=settings.timeout)
+    if settings.starttls:
+        server.starttls()
+    if settings.username and settings.password:
+        server.login(settings.username, settings.password)
+    return server
+
+
+def send_message_now(settings, to_email, subject, body):
+    """One-shot synchronous send on a fresh connection."""
+    server = open_smtp_connection(settings)
+    try:
+        server.sendmail(settings.sender, to_email, build_message(settings, to_email, subject, body).as_string())
+    finally:
+        server.quit()
+
+
+class EmailOutbox:
+    """Mongo-backed outbox drained by a background sender thread.
+
+    Messages survive restarts because they are persisted before the request
+    returns. The sender keeps one authenticated SMTP connection open between
+    batches, claims messages atomically (so several processes can share the
+    outbox) and retries failures with exponential backoff. A message with an
+    `expires_at` (an OTP or reset code) is never sent or retried after it,
+    and is marked "expired" instead.
+    """
+
+    def __init__(self, collection, settings, batch_size=20, poll_interval=5.0,
+                 max_attempts=6, backoff_base=10.0, backoff_max=1800.0,
+                 idle_timeout=60.0, stale_after=300.0):
+        self.collection = collection
+        self.settings = settings
+        self.batch_size = max(1, int(batch_size))
+        self.poll_interval = poll_interval
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.idle_timeout = idle_timeout
+        self.stale_after = stale_after
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._owner_pid = None
+        self._smtp = None
+        self._smtp_last_used = 0.0
+
+    def enqueue(self, to_email, subject, body, expires_at=None):
+        if not self.settings.is_configured():
+            raise RuntimeError("SMTP is not configured (set SMTP_HOST and SMTP_EMAIL)")
+        now = datetime.datetime.utcnow()
+        self.collection.insert_one({
+            "to": to_email,
+            "subject": subject,
+            "body": body,
+            "status": "pending",
+            "attempts": 0,
+            "last_error": None,
+            "created_at": now,
+            "expires_at": expires_at,
+            "next_attempt_at": now
+        })
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        # Threads do not survive fork(), so each worker process runs its own sender.
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._owner_pid == pid:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._owner_pid == pid:
+                return
+            self._owner_pid = pid
+            self._smtp = None
+            self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                sent_any = self.drain_once()
+            except Exception as e:
+                print(f"Email Outbox Error: {e}")
+                sent_any = False
+
+            if not sent_any:
+                self._close_if_idle()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self):
+        now = datetime.datetime.utcnow()
+        stale_before = now - datetime.timedelta(seconds=self.stale_after)
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                # Messages left in "sending" by a crashed process.
+                {"status": "sending", "claimed_at": {"$lte": stale_before}},
+            ]},
+            {"$set": {"status": "sending", "claimed_at": now}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def drain_once(self):
+        """Send up to one batch of due messages; returns True if anything was claimed."""
+        batch = []
+        while len(batch) < self.batch_size:
+            message = self._claim()
+            if message is None:
+                break
+            batch.append(message)
+        if not batch:
+            return False
+
+        for message in batch:
+            self._deliver(message)
+        return True
+
+    def _connection(self):
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._drop_connection()
+        self._smtp = open_smtp_connection(self.settings)
+        return self._smtp
+
+    def _drop_connection(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+        self._smtp = None
+
+    def _close_if_idle(self):
+        if self._smtp is not None and time.monotonic() - self._smtp_last_used > self.idle_timeout:
+            self._drop_connection()
+
+    def _expire(self, message, reason, attempts):
+        self.collection.update_one(
+            {"_id": message["_id"]},
+            {"$set": {"status": "expired", "attempts": attempts, "last_error": reason}}
+        )
+        print(f"Email to {message['to']} expired unsent: {reason}")
+
+    def _deliver(self, message):
+        expires_at = message.get("expires_at")
+        if expires_at is not None and datetime.datetime.utcnow() >= expires_at:
+            # The code in it is no longer accepted; delivering it would only confuse.
+            self._expire(message, message.get("last_error") or "expired before delivery", message.get("attempts", 0))
+            return
+        try:
+            server = self._connection()
+            msg = build_message(self.settings, message["to"], message["subject"], message["body"])
+            server.sendmail(self.settings.sender, message["to"], msg.as_string())
+            self._smtp_last_used = time.monotonic()
+            self.collection.update_one(
+                {"_id": message["_id"]},
+                {"$set": {"status": "sent", "sent_at": datetime.datetime.utcnow(), "last_error": None},
+                 "$inc": {"attempts": 1}}
+            )
+        except Exception as e:
+            # A broken connection must not poison the rest of the batch.
+            self._drop_connection()
+            attempts = message.get("attempts", 0) + 1
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+            next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+            if expires_at is not None and next_attempt_at >= expires_at:
+                self._expire(message, str(e), attempts)
+                return
+            status = "failed" if attempts >= self.max_attempts else "pending"
+            self.collection.update_one(
+                {"_id": message["_id"]},
+                {"$set": {
+                    "status": status,
+                    "attempts": attempts,
+                    "last_error": str(e),
+                    "next_attempt_at": next_attempt_at
+                }}
+            )
+            print(f"Email Error: {e} (attempt {attempts}/{self.max_attempts}, status {status})")
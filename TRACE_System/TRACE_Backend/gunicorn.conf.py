@@ -0,0 +1,113 @@
+"""Pre-fork production server for the TRACE backend.
+
+Usage (from TRACE_Backend):
+    gunicorn -c gunicorn.conf.py app:app
+    python memory_report.py            # per-worker unique memory of the running server
+
+The master imports app.py and loads and warms both models before forking, so
+every worker shares the weight pages copy-on-write instead of loading its own
+copy. The master keeps torch, onnxruntime and OpenCV single-threaded: thread
+pools started before fork() do not exist in the child and can deadlock it.
+Each worker then gets WORKER_COMPUTE_THREADS threads (default: cores / workers)
+in post_fork. A Keras (TensorFlow) hair model is not fork-safe and is loaded
+per worker instead; convert it to ONNX or TFLite to share it. With
+HAIR_INFERENCE_MODE=managed each worker starts its own inference processes
+after fork; use HAIR_INFERENCE_MODE=external to share one pool between them.
+"""
+import os
+import sys
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+CORES = available_cores()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+# One process per core: the inference runtimes are the bottleneck, not request I/O.
+workers = int(os.getenv("GUNICORN_WORKERS", "0")) or CORES
+# Request threads per worker; compute parallelism is capped separately below.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+preload_app = True
+pidfile = os.getenv("GUNICORN_PIDFILE", "gunicorn.pid")
+
+WORKER_COMPUTE_THREADS = int(os.getenv("WORKER_COMPUTE_THREADS", "0")) or max(1, CORES // workers)
+_RUN_INDEX_BUILD = os.getenv("ENSURE_INDEXES_ON_STARTUP", "true").lower() == "true"
+
+# Read by app.py when the master imports it (preload), so these must be set here.
+os.environ["SERVER_PREFORK"] = "true"
+os.environ["MODEL_LOAD_MODE"] = "lazy"  # loaded in on_starting, after app.py is imported
+os.environ["CLASSIFIER_THREADS"] = "1"
+os.environ["CLASSIFIER_INTEROP_THREADS"] = "1"
+os.environ["HAIR_INTRA_OP_THREADS"] = "1"
+os.environ.setdefault("INPAINT_THREADS", str(WORKER_COMPUTE_THREADS))
+for _name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+              "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"):
+    os.environ.setdefault(_name, str(WORKER_COMPUTE_THREADS))
+
+preload_hair_model = True
+
+
+def hair_model_is_fork_safe(trace_app):
+    """False when the hair model would load TensorFlow (Keras) or start its own
+    inference processes, neither of which should happen before fork()."""
+    from hair_backends import resolve_backend_name
+
+    if trace_app.HAIR_INFERENCE_MODE == "managed":
+        return False
+    return resolve_backend_name(trace_app.HAIR_MODEL_BACKEND, trace_app.HAIR_MODEL_PATHS) != "keras"
+
+
+def on_starting(server):
+    global preload_hair_model
+    import cv2
+    import app as trace_app
+
+    cv2.setNumThreads(1)
+    preload_hair_model = hair_model_is_fork_safe(trace_app)
+    if not preload_hair_model:
+        server.log.info("Hair model is not fork-safe; each worker will load its own.")
+    trace_app.load_models(include_hair=preload_hair_model)
+    # Drop the master's connections and monitor threads so no worker inherits
+    # them mid-use; each worker reopens the client on first use (pymongo still
+    # logs its generic "opened before fork" warning once per worker).
+    trace_app.client.close()
+    server.log.info(
+        f"Models loaded in master ({trace_app.model_load_state['status']}); "
+        f"{workers} workers x {WORKER_COMPUTE_THREADS} compute threads on {CORES} cores"
+    )
+
+
+def post_fork(server, worker):
+    import cv2
+    import app as trace_app
+
+    cv2.setNumThreads(WORKER_COMPUTE_THREADS)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(WORKER_COMPUTE_THREADS)
+
+    if not preload_hair_model:
+        trace_app.load_hair_model()
+        if trace_app.MODEL_WARMUP:
+            trace_app.warmup_models()
+
+    if trace_app.EMAIL_OUTBOX:
+        trace_app.email_outbox.start()
+    trace_app.start_server_workers()
+    # Only the first worker of a fresh master builds indexes.
+    if _RUN_INDEX_BUILD and worker.age == 1:
+        trace_app.ensure_indexes_in_background()
+
+
+def worker_exit(server, worker):
+    import app as trace_app
+
+    # Write buffered analyses before the worker goes; leftovers stay in the spill files.
+    trace_app.analysis_writer.close()
@@ -0,0 +1,208 @@
+import os
+
+import cv2
+import numpy as np
+
+
+DEFAULT_INPUT_SIZE = 256
+
+
+def normalize_mask(mask_float):
+    mask_float = np.nan_to_num(mask_float, nan=0.0, posinf=1.0, neginf=0.0)
+    min_val = float(mask_float.min())
+    max_val = float(mask_float.max())
+    if max_val - min_val < 1e-8:
+        return np.zeros_like(mask_float, dtype=np.uint8)
+    normalized = (mask_float - min_val) / (max_val - min_val)
+    return (normalized * 255).astype(np.uint8)
+
+
+def preprocess_for_hair_model(image_bgr, input_size):
+    """BGR uint8 image -> float32 RGB in [0, 1] at the model's (h, w), without a batch axis."""
+    target_h, target_w = input_size
+    rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+    resized = cv2.resize(rgb, (target_w, target_h), interpolation=cv2.INTER_AREA)
+    return resized.astype(np.float32) / 255.0
+
+
+def prediction_to_mask(pred, output_shape, threshold=128):
+    """Single-sample model output -> cleaned binary uint8 mask at `output_shape` (h, w)."""
+    pred = np.asarray(pred)
+    if pred.ndim == 3:
+        pred = pred[..., 0]
+    elif pred.ndim != 2:
+        raise ValueError(f"Unexpected model output dimensions: {pred.shape}")
+
+    pred = cv2.resize(pred.astype(np.float32), (output_shape[1], output_shape[0]), interpolation=cv2.INTER_LINEAR)
+    mask_gray = normalize_mask(pred)
+    _, mask_bin = cv2.threshold(mask_gray, threshold, 255, cv2.THRESH_BINARY)
+    mask_bin = cv2.medianBlur(mask_bin, 5)
+    mask_bin = cv2.dilate(mask_bin, np.ones((3, 3), np.uint8), iterations=1)
+    return mask_bin
+
+
+def _size_from_shape(shape):
+    """(h, w) from an NHWC shape whose dims may be None or symbolic."""
+    if not shape or len(shape) < 4:
+        raise ValueError("Unsupported hair model input shape")
+    dims = []
+    for dim in shape[1:3]:
+        dims.append(int(dim) if isinstance(dim, (int, np.integer)) and dim > 0 else DEFAULT_INPUT_SIZE)
+    return tuple(dims)
+
+
+class KerasHairBackend:
+    name = "keras_h5"
+    method = "keras_h5_mask_inpaint"
+
+    def __init__(self, path):
+        from tensorflow.keras.models import load_model  # type: ignore
+
+        self.model = load_model(path, compile=False)
+        self.input_size = _size_from_shape(getattr(self.model, "input_shape", None))
+
+    def predict(self, batch):
+        return self.model.predict(batch, verbose=0)
+
+
+class OnnxHairBackend:
+    name = "onnx"
+    method = "onnx_mask_inpaint"
+
+    def __init__(self, path, intra_op_threads=0):
+        import onnxruntime as ort  # type: ignore
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = int(intra_op_threads)
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_size = _size_from_shape(model_input.shape)
+
+    def predict(self, batch):
+        return self.session.run(None, {self.input_name: batch.astype(np.float32, copy=False)})[0]
+
+
+class TFLiteHairBackend:
+    """TFLite interpreter; handles both float and fully int8-quantized exports.
+
+    Interpreters are not thread-safe, which is fine here because the hair
+    batcher only ever calls predict() from its single worker thread.
+    """
+
+    def __init__(self, path, name="tflite", intra_op_threads=0):
+        try:
+            from tflite_runtime.interpreter import Interpreter  # type: ignore
+        except ImportError:
+            from tensorflow.lite import Interpreter  # type: ignore
+
+        self.name = name
+        self.method = f"{name}_mask_inpaint"
+        self.interpreter = Interpreter(model_path=path, num_threads=int(intra_op_threads) or None)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self.input_size = _size_from_shape(list(self.input_detail["shape"]))
+        self._batch_size = int(self.input_detail["shape"][0])
+
+    def _resize(self, batch_size):
+        if batch_size == self._batch_size:
+            return
+        shape = list(self.input_detail["shape"])
+        shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self.input_detail["index"], shape)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def predict(self, batch):
+        self._resize(batch.shape[0])
+        x = batch
+        scale, zero_point = self.input_detail.get("quantization", (0.0, 0))
+        if np.issubdtype(self.input_detail["dtype"], np.integer) and scale:
+            x = np.round(batch / scale + zero_point)
+        self.interpreter.set_tensor(self.input_detail["index"], x.astype(self.input_detail["dtype"]))
+        self.interpreter.invoke()
+
+        out = self.interpreter.get_tensor(self.output_detail["index"])
+        scale, zero_point = self.output_detail.get("quantization", (0.0, 0))
+        if np.issubdtype(out.dtype, np.integer) and scale:
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out
+
+
+def default_model_paths(h5_path):
+    stem = os.path.splitext(h5_path)[0]
+    return {
+        "keras": h5_path,
+        "onnx": f"{stem}.onnx",
+        "tflite": f"{stem}.tflite",
+        "tflite_int8": f"{stem}_int8.tflite",
+    }
+
+
+def model_paths_from_env(h5_path):
+    """default_model_paths() with the HAIR_*_PATH environment overrides applied."""
+    paths = default_model_paths(h5_path)
+    paths["onnx"] = os.getenv("HAIR_ONNX_PATH", paths["onnx"])
+    paths["tflite"] = os.getenv("HAIR_TFLITE_PATH", paths["tflite"])
+    paths["tflite_int8"] = os.getenv("HAIR_TFLITE_INT8_PATH", paths["tflite_int8"])
+    return paths
+
+
+BACKEND_FACTORIES = {
+    "keras": lambda path, threads: KerasHairBackend(path),
+    "onnx": lambda path, threads: OnnxHairBackend(path, intra_op_threads=threads),
+    "tflite": lambda path, threads: TFLiteHairBackend(path, name="tflite", intra_op_threads=threads),
+    "tflite_int8": lambda path, threads: TFLiteHairBackend(path, name="tflite_int8", intra_op_threads=threads),
+}
+
+# Order tried by HAIR_MODEL_BACKEND=auto: lightest runtime first.
+AUTO_ORDER = ("onnx", "tflite_int8", "tflite", "keras")
+
+
+def model_file_fingerprint(path):
+    """Identifies the model file a backend loaded, so cached results follow model swaps."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return f"{path}:missing"
+    return f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def resolve_backend_name(requested, model_paths):
+    """The backend load_hair_backend() would try first for `requested`, or None without a model file."""
+    for name in (AUTO_ORDER if requested == "auto" else (requested,)):
+        path = model_paths.get(name)
+        if path and os.path.exists(path):
+            return name
+    return None
+
+
+def load_hair_backend(requested, model_paths, intra_op_threads=0):
+    """Return a loaded backend for `requested` (a BACKEND_FACTORIES key or "auto").
+
+    Raises FileNotFoundError when no model file exists for the request and
+    re-raises the runtime's import/load error otherwise.
+    """
+    candidates = AUTO_ORDER if requested == "auto" else (requested,)
+    last_error = None
+    for name in candidates:
+        if name not in BACKEND_FACTORIES:
+            raise ValueError(f"Unknown hair model backend '{name}'. Choose from: auto, {', '.join(BACKEND_FACTORIES)}")
+        path = model_paths.get(name)
+        if not path or not os.path.exists(path):
+            last_error = FileNotFoundError(f"Hair model not found at {path}")
+            continue
+        try:
+            backend = BACKEND_FACTORIES[name](path, intra_op_threads)
+            backend.fingerprint = model_file_fingerprint(path)
+            return backend
+        except Exception as e:
+            last_error = e
+            if requested != "auto":
+                raise
+    raise last_error or FileNotFoundError("No hair model file available")
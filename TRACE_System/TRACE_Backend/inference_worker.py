@@ -0,0 +1,508 @@
+"""Out-of-process hair-model inference.
+
+The web tier sends preprocessed image batches to dedicated inference processes
+over local sockets (multiprocessing.connection). Pixels travel through
+multiprocessing.shared_memory; only a few bytes of metadata are pickled per
+call. The model runtime's threads and allocator live in those processes, and
+if one crashes or hangs the supervisor restarts it while /predict falls back
+to DullRazor, so the API keeps answering.
+
+HAIR_INFERENCE_MODE=managed: every web process starts and supervises its own
+HAIR_INFERENCE_WORKERS processes. HAIR_INFERENCE_MODE=external: one shared pool,
+sized independently of the web workers, run from TRACE_Backend with
+    python inference_worker.py serve --workers 2
+and the same HAIR_INFERENCE_ADDRESS / HAIR_INFERENCE_AUTHKEY as the web tier.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import atexit
+import argparse
+import tempfile
+import threading
+import subprocess
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+AUTHKEY_ENV = "HAIR_INFERENCE_AUTHKEY"
+MODEL_PATHS_ENV = "HAIR_INFERENCE_MODEL_PATHS"
+DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), "trace-hair-inference.sock")
+# Errors that mean "this connection or process is gone", as opposed to a model error.
+CONNECTION_ERRORS = (OSError, EOFError, AuthenticationError)
+
+
+def worker_addresses(base, count):
+    return [f"{base}.{index}" for index in range(max(1, int(count)))]
+
+
+def authkey_from_env():
+    value = os.getenv(AUTHKEY_ENV, "")
+    if not value:
+        raise ValueError(f"{AUTHKEY_ENV} must be set for external inference workers")
+    return value.encode("utf-8")
+
+
+def attach_segment(name):
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    segment = SharedMemory(name=name)
+    # Before 3.13, attaching registers the segment with this process's resource
+    # tracker, which would unlink the client's segment when this process exits.
+    resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+# Inference process
+
+def _predict_into_segment(backend, model_lock, name, shape, dtype):
+    segment = attach_segment(name)
+    batch = None
+    try:
+        batch = np.ndarray(shape, np.dtype(dtype), buffer=segment.buf)
+        with model_lock:
+            output = np.ascontiguousarray(backend.predict(batch), dtype=np.float32)
+        if output.nbytes > segment.size:
+            return ("ok_inline", output)
+        # The input is consumed, so the reply reuses its pages.
+        np.ndarray(output.shape, output.dtype, buffer=segment.buf)[...] = output
+        return ("ok", output.shape, output.dtype.str)
+    finally:
+        batch = None  # views must be gone before the mapping can close
+        segment.close()
+
+
+def serve_connection(conn, backend, model_lock):
+    try:
+        while True:
+            message = conn.recv()
+            op = message[0]
+            if op == "ping":
+                conn.send(("ok", os.getpid()))
+            elif op == "info":
+                conn.send(("ok", {
+                    "name": backend.name,
+                    "method": backend.method,
+                    "input_size": tuple(backend.input_size),
+                    "fingerprint": getattr(backend, "fingerprint", "none"),
+                    "pid": os.getpid(),
+                }))
+            elif op == "predict":
+                try:
+                    conn.send(_predict_into_segment(backend, model_lock, *message[1:]))
+                except Exception as e:
+                    conn.send(("error", str(e)))
+            else:
+                conn.send(("error", f"Unknown request '{op}'"))
+    except CONNECTION_ERRORS:
+        pass
+    finally:
+        conn.close()
+
+
+def watch_parent(parent_pid):
+    # A managed worker must not outlive the web process that supervises it.
+    while True:
+        if os.getppid() != parent_pid:
+            os._exit(0)
+        time.sleep(1.0)
+
+
+def run_worker(address, authkey, requested, model_paths, intra_op_threads=0, parent_pid=None):
+    from hair_backends import load_hair_backend
+
+    if parent_pid:
+        threading.Thread(target=watch_parent, args=(parent_pid,), name="parent-watch", daemon=True).start()
+
+    backend = load_hair_backend(requested, model_paths, intra_op_threads)
+    model_lock = threading.Lock()
+    if os.path.exists(address):
+        os.unlink(address)  # left behind by a crashed predecessor
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    print(f"Inference worker {os.getpid()} serving {backend.name} on {address}")
+
+    while True:
+        try:
+            conn = listener.accept()
+        except CONNECTION_ERRORS as e:
+            print(f"Inference worker rejected a connection: {e}")
+            continue
+        threading.Thread(target=serve_connection, args=(conn, backend, model_lock), daemon=True).start()
+
+
+# Supervisor
+
+class InferenceSupervisor:
+    """Keeps one inference process per address alive.
+
+    Processes that exit, or fail `max_failures` health checks in a row once
+    started, are killed and respawned with exponential backoff.
+    """
+
+    def __init__(self, addresses, authkey, backend, model_paths, intra_op_threads=0, parent_watch=False,
+                 health_interval=5.0, health_timeout=10.0, startup_timeout=300.0, max_failures=3):
+        self.addresses = list(addresses)
+        self.authkey = authkey
+        self.backend = backend
+        self.model_paths = dict(model_paths)
+        self.intra_op_threads = intra_op_threads
+        self.parent_watch = parent_watch
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.startup_timeout = startup_timeout
+        self.max_failures = max_failures
+        self.restarts = 0
+        self.socket_dir = None
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def managed(cls, count, backend, model_paths, intra_op_threads=0, **kwargs):
+        """A private pool for this process, on sockets in a fresh temp directory."""
+        socket_dir = tempfile.mkdtemp(prefix="trace-inference-")
+        supervisor = cls(worker_addresses(os.path.join(socket_dir, "worker.sock"), count), os.urandom(32),
+                         backend, model_paths, intra_op_threads, parent_watch=True, **kwargs)
+        supervisor.socket_dir = socket_dir
+        return supervisor
+
+    def start(self):
+        with self._lock:
+            for address in self.addresses:
+                self._spawn(address, backoff=0.0)
+        self._thread = threading.Thread(target=self._monitor, name="inference-supervisor", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _spawn(self, address, backoff):
+        env = dict(os.environ)
+        env[AUTHKEY_ENV] = self.authkey.hex()
+        env[MODEL_PATHS_ENV] = json.dumps(self.model_paths)
+        command = [
+            sys.executable, os.path.abspath(__file__), "worker",
+            "--address", address, "--backend", self.backend, "--threads", str(self.intra_op_threads),
+        ]
+        if self.parent_watch:
+            command += ["--parent-pid", str(os.getpid())]
+        self._slots[address] = {
+            "process": subprocess.Popen(command, env=env),
+            "started": time.monotonic(),
+            "ready": False,
+            "failures": 0,
+            "backoff": backoff,
+            "restart_at": None,
+        }
+
+    def _schedule_restart(self, address, reason):
+        """Kill the process now and respawn it on a monitor pass after the backoff (lock held)."""
+        slot = self._slots[address]
+        process = slot["process"]
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        slot["backoff"] = min(60.0, slot["backoff"] * 2 or 1.0)
+        slot["restart_at"] = time.monotonic() + slot["backoff"]
+        slot["ready"] = False
+        print(f"Restarting inference worker on {address} in {slot['backoff']:.0f}s: {reason}")
+
+    def ping(self, address):
+        conn = Client(address, family="AF_UNIX", authkey=self.authkey)
+        try:
+            conn.send(("ping",))
+            if not conn.poll(self.health_timeout):
+                raise TimeoutError(f"No health-check reply within {self.health_timeout}s")
+            return conn.recv()[1]
+        finally:
+            conn.close()
+
+    def request_check(self):
+        """Ask the monitor to check every process now, e.g. after a failed call."""
+        self._wakeup.set()
+
+    def _next_wait(self):
+        """Seconds until the next health check or scheduled respawn, whichever is first."""
+        wait = self.health_interval
+        now = time.monotonic()
+        with self._lock:
+            for slot in self._slots.values():
+                if slot["restart_at"] is not None:
+                    wait = min(wait, max(0.0, slot["restart_at"] - now))
+        return wait
+
+    def _monitor(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self._next_wait())
+            self._wakeup.clear()
+            for address in self.addresses:
+                if self._stopping.is_set():
+                    return
+                self._check(address)
+
+    def _check(self, address):
+        # The lock only guards slot state: pings (up to health_timeout) and
+        # backoff waits happen outside it, so one bad worker stalls nothing else.
+        with self._lock:
+            if self._stopping.is_set():
+                return
+            slot = self._slots[address]
+            if slot["restart_at"] is not None:
+                if time.monotonic() >= slot["restart_at"]:
+                    self.restarts += 1
+                    self._spawn(address, slot["backoff"])
+                return
+            if slot["process"].poll() is not None:
+                self._schedule_restart(address, f"exited with code {slot['process'].returncode}")
+                return
+            process = slot["process"]
+
+        try:
+            self.ping(address)
+        except CONNECTION_ERRORS as e:
+            with self._lock:
+                if slot is not self._slots[address] or process is not slot["process"]:
+                    return  # respawned meanwhile
+                starting = not slot["ready"] and time.monotonic() - slot["started"] < self.startup_timeout
+                if starting:
+                    return  # still loading the model
+                slot["failures"] += 1
+                if slot["failures"] >= self.max_failures:
+                    self._schedule_restart(address, f"failed {slot['failures']} health checks ({e})")
+            return
+        with self._lock:
+            if slot is self._slots[address] and slot["restart_at"] is None:
+                slot["ready"] = True
+                slot["failures"] = 0
+                slot["backoff"] = 0.0
+
+    def stop(self):
+        with self._lock:
+            self._stopping.set()
+        self._wakeup.set()
+        for slot in list(self._slots.values()):
+            if slot["process"].poll() is None:
+                slot["process"].terminate()
+        for slot in list(self._slots.values()):
+            try:
+                slot["process"].wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                slot["process"].kill()
+        if self.socket_dir:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+    def stats(self):
+        return {
+            "workers": len(self.addresses),
+            "ready": sum(1 for slot in self._slots.values() if slot["ready"]),
+            "restarts": self.restarts,
+            "pids": [slot["process"].pid for slot in self._slots.values()],
+        }
+
+
+# Web-tier client
+
+class _Connection:
+    """One authenticated socket plus the shared-memory segment it sends batches in."""
+
+    def __init__(self, address, authkey):
+        self.conn = Client(address, family="AF_UNIX", authkey=authkey)
+        self.segment = None
+
+    def request(self, message, timeout):
+        self.conn.send(message)
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"No reply from inference worker within {timeout}s")
+        return self.conn.recv()
+
+    def predict(self, batch, timeout):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        if self.segment is None or self.segment.size < batch.nbytes:
+            self._replace_segment(batch.nbytes)
+        np.ndarray(batch.shape, batch.dtype, buffer=self.segment.buf)[...] = batch
+
+        reply = self.request(("predict", self.segment.name, batch.shape, batch.dtype.str), timeout)
+        if reply[0] == "ok":
+            return np.ndarray(reply[1], np.dtype(reply[2]), buffer=self.segment.buf).copy()
+        if reply[0] == "ok_inline":
+            return reply[1]
+        raise RuntimeError(f"Inference worker error: {reply[1]}")
+
+    def _replace_segment(self, nbytes):
+        self._release_segment()
+        self.segment = SharedMemory(create=True, size=nbytes)
+
+    def _release_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment.unlink()
+            self.segment = None
+
+    def close(self):
+        try:
+            self.conn.close()
+        finally:
+            self._release_segment()
+
+
+class RemoteHairBackend:
+    """Hair backend whose predict() runs in inference worker processes.
+
+    Holds at most one connection per worker, so concurrent callers queue for a
+    free worker. A dead or hung worker surfaces as RuntimeError, which
+    get_hair_removed_image() already turns into the DullRazor fallback.
+    """
+
+    def __init__(self, addresses, authkey, supervisor=None, timeout=30.0, start_timeout=300.0):
+        self.addresses = list(addresses)
+        self.authkey = authkey
+        self.supervisor = supervisor
+        self.timeout = timeout
+        self.calls = 0
+        self.failures = 0
+        self._idle = None
+        self._owner_pid = None
+        self._lock = threading.Lock()
+
+        info = self._handshake(start_timeout)
+        self.name = f"{info['name']}_worker"
+        self.method = info["method"]
+        self.input_size = tuple(info["input_size"])
+        self.fingerprint = info.get("fingerprint", "none")
+        atexit.register(self.close)
+
+    def _handshake(self, start_timeout):
+        """Wait for the first worker to finish loading its model and describe it."""
+        deadline = time.monotonic() + start_timeout
+        last_error = None
+        while time.monotonic() < deadline:
+            for address in self.addresses:
+                try:
+                    connection = _Connection(address, self.authkey)
+                    try:
+                        return connection.request(("info",), self.timeout)[1]
+                    finally:
+                        connection.close()
+                except CONNECTION_ERRORS as e:
+                    last_error = e
+            time.sleep(0.25)
+        raise RuntimeError(f"No inference worker became ready within {start_timeout:.0f}s: {last_error}")
+
+    def _pool(self):
+        # Sockets must not be shared with a forked child, so each process builds its own.
+        pid = os.getpid()
+        with self._lock:
+            if self._owner_pid != pid:
+                self._idle = queue.LifoQueue()
+                for address in self.addresses:
+                    self._idle.put([address, None])
+                self._owner_pid = pid
+            return self._idle
+
+    def predict(self, batch):
+        pool = self._pool()
+        self.calls += 1
+        last_error = None
+        for _attempt in range(2):
+            try:
+                slot = pool.get(timeout=self.timeout)
+            except queue.Empty:
+                raise RuntimeError(f"All inference workers busy for {self.timeout}s")
+            try:
+                if slot[1] is None:
+                    slot[1] = _Connection(slot[0], self.authkey)
+                return slot[1].predict(batch, self.timeout)
+            except CONNECTION_ERRORS as e:
+                # Reply state is unknown after a timeout or broken pipe; start over.
+                last_error = e
+                if slot[1] is not None:
+                    try:
+                        slot[1].close()
+                    except OSError:
+                        pass
+                    slot[1] = None
+                if self.supervisor is not None:
+                    self.supervisor.request_check()
+            finally:
+                pool.put(slot)
+        self.failures += 1
+        raise RuntimeError(f"Inference worker unavailable: {last_error}")
+
+    def close(self):
+        """Close this process's connections and free their shared-memory segments."""
+        with self._lock:
+            if self._owner_pid != os.getpid():
+                return
+            while True:
+                try:
+                    slot = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if slot[1] is not None:
+                    try:
+                        slot[1].close()
+                    except OSError:
+                        pass
+            self._owner_pid = None
+
+    def stats(self):
+        stats = {"calls": self.calls, "failures": self.failures, "addresses": len(self.addresses)}
+        if self.supervisor is not None:
+            stats["supervisor"] = self.supervisor.stats()
+        return stats
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Hair-model inference worker processes.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    serve = subcommands.add_parser("serve", help="run a supervised pool for HAIR_INFERENCE_MODE=external")
+    serve.add_argument("--workers", type=int, default=int(os.getenv("HAIR_INFERENCE_WORKERS", "1")))
+    serve.add_argument("--address", default=os.getenv("HAIR_INFERENCE_ADDRESS", DEFAULT_ADDRESS),
+                       help="socket path prefix; worker i listens on <address>.<i>")
+    serve.add_argument("--backend", default=os.getenv("HAIR_MODEL_BACKEND", "keras").lower())
+    serve.add_argument("--model-path", default="model/chimaera_v2_final.h5")
+    serve.add_argument("--threads", type=int, default=int(os.getenv("HAIR_INTRA_OP_THREADS", "0")))
+
+    worker = subcommands.add_parser("worker", help="one inference process (started by a supervisor)")
+    worker.add_argument("--address", required=True)
+    worker.add_argument("--backend", required=True)
+    worker.add_argument("--threads", type=int, default=0)
+    worker.add_argument("--parent-pid", type=int, default=None)
+
+    args = parser.parse_args(argv[1:])
+
+    if args.command == "worker":
+        authkey = bytes.fromhex(os.environ[AUTHKEY_ENV])
+        model_paths = json.loads(os.environ[MODEL_PATHS_ENV])
+        run_worker(args.address, authkey, args.backend, model_paths, args.threads, args.parent_pid)
+        return 0
+
+    from hair_backends import model_paths_from_env
+
+    try:
+        authkey = authkey_from_env()
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+    supervisor = InferenceSupervisor(
+        worker_addresses(args.address, args.workers), authkey, args.backend,
+        model_paths_from_env(args.model_path), args.threads
+    )
+    supervisor.start()
+    print(f"Supervising {args.workers} inference worker(s) on {args.address}.<n>; Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        supervisor.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,206 @@
+import os
+import socket
+import datetime
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+from process_identity import process_is_running, process_start_time
+
+ORPHANED_JOB_ERROR = "The server process running this job exited before it finished"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def init_pool_worker():
+    """Runs in every pool process before its first job.
+
+    Under `python app.py` a spawned process has already re-imported app.py as
+    __mp_main__ by now; app.py skips its import-time background work in any
+    multiprocessing child. This covers the first import of `app` otherwise.
+    """
+    # Pool workers only compute: no mail sender, index build or analysis writer,
+    # and models load on the first job rather than at import.
+    os.environ["EMAIL_OUTBOX"] = "false"
+    os.environ["ENSURE_INDEXES_ON_STARTUP"] = "false"
+    os.environ["ANALYSIS_WRITE_BEHIND"] = "false"
+    os.environ["MODEL_LOAD_MODE"] = "lazy"
+
+
+def process_owner():
+    pid = os.getpid()
+    return {"host": socket.gethostname(), "pid": pid, "started": process_start_time(pid)}
+
+
+class JobQueue:
+    """Bounded process pool whose job state lives in a Mongo collection.
+
+    State is kept in Mongo (not in process memory) so any web worker can
+    answer a poll for a job that another worker accepted. Jobs move from
+    queued to running when a pool process is free to start them, then to done
+    or failed. Each job records the web process that owns it, so jobs left
+    queued or running by a process that died can be failed on the next start.
+    """
+
+    def __init__(self, collection, max_workers=2, max_pending=16, start_method="spawn"):
+        self.collection = collection
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self.start_method = start_method
+        self._executor = None
+        self._owner_pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._waiting = deque()
+        self._running = 0
+
+    def _get_executor(self):
+        pid = os.getpid()
+        with self._lock:
+            if self._executor is None or self._owner_pid != pid:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=init_pool_worker
+                )
+                self._owner_pid = pid
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self._waiting = deque()
+                self._running = 0
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """Drop a pool broken by a crashed process so the next job starts a fresh one."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        print("Job Queue: a pool process died; starting a new pool for the next job")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn, args, owner_id, on_complete=None):
+        """Queue `fn(*args)` in the pool and return the new job id.
+
+        `on_complete(job_id, result)` runs in this process once the worker
+        returns, before the job is marked done, so side effects such as
+        database writes are visible by the time a poll reports success.
+        """
+        self._get_executor()
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull("Too many queued jobs, try again shortly")
+
+        job_id = ObjectId()
+        try:
+            self.collection.insert_one({
+                "_id": job_id,
+                "user_id": owner_id,
+                "status": "queued",
+                "owner": process_owner(),
+                "created_at": datetime.datetime.utcnow(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None
+            })
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._waiting.append((job_id, fn, args, on_complete))
+        self._dispatch()
+        return str(job_id)
+
+    def _dispatch(self):
+        """Start waiting jobs while a pool process is free, marking each one running."""
+        while True:
+            executor = self._get_executor()
+            with self._lock:
+                if self._running >= self.max_workers or not self._waiting:
+                    return
+                job_id, fn, args, on_complete = self._waiting.popleft()
+                self._running += 1
+
+            try:
+                self.collection.update_one(
+                    {"_id": job_id},
+                    {"$set": {"status": "running", "started_at": datetime.datetime.utcnow()}}
+                )
+                future = executor.submit(fn, *args)
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._discard_executor(executor)
+                with self._lock:
+                    self._running -= 1
+                self._slots.release()
+                self._record(job_id, {"status": "failed", "error": str(e)})
+                continue
+
+            def finished(fut, job_id=job_id, on_complete=on_complete, executor=executor):
+                self._finish(job_id, fut, on_complete, executor)
+
+            future.add_done_callback(finished)
+
+    def _finish(self, job_id, future, on_complete, executor):
+        try:
+            result = future.result()
+            if on_complete is not None:
+                result = on_complete(str(job_id), result)
+            update = {"status": "done", "result": result}
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            update = {"status": "failed", "error": "The pool process running this job exited unexpectedly"}
+        except Exception as job_error:
+            update = {"status": "failed", "error": str(job_error)}
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._running -= 1
+
+        self._record(job_id, update)
+        self._dispatch()
+
+    def _record(self, job_id, update):
+        update["finished_at"] = datetime.datetime.utcnow()
+        try:
+            self.collection.update_one({"_id": job_id}, {"$set": update})
+        except Exception as e:
+            print(f"Job Queue Error: could not record result for job {job_id}: {e}")
+
+    def fail_orphaned_jobs(self):
+        """Mark jobs still queued or running for an exited process on this host as failed.
+
+        Returns how many jobs were failed. Jobs owned by other hosts are left
+        to those hosts (or the TTL index).
+        """
+        host = socket.gethostname()
+        owners = self.collection.distinct(
+            "owner", {"status": {"$in": ["queued", "running"]}, "owner.host": host}
+        )
+        failed = 0
+        for owner in owners:
+            if process_is_running(owner["pid"], owner["started"]):
+                continue
+            failed += self.collection.update_many(
+                {"status": {"$in": ["queued", "running"]}, "owner": owner},
+                {"$set": {
+                    "status": "failed",
+                    "error": ORPHANED_JOB_ERROR,
+                    "finished_at": datetime.datetime.utcnow()
+                }}
+            ).modified_count
+        return failed
+
+    def get(self, job_id, owner_id):
+        try:
+            oid = ObjectId(job_id)
+        except (InvalidId, TypeError):
+            return None
+        return self.collection.find_one({"_id": oid, "user_id": owner_id})
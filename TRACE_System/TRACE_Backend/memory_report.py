@@ -0,0 +1,129 @@
+"""Per-process memory of a running gunicorn server, for capacity planning.
+
+Usage (from TRACE_Backend, Linux only):
+    python memory_report.py                    # master pid from gunicorn.pid
+    python memory_report.py --pid 12345
+    python memory_report.py --pidfile /run/trace/gunicorn.pid --json
+
+USS (private pages) is what each extra worker really costs; PSS splits shared
+pages among the processes mapping them, so the PSS column sums to the server's
+true footprint. Model weights loaded in the master before fork show up as
+shared, not unique, memory until a worker writes to them.
+"""
+import os
+import sys
+import json
+import argparse
+
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+
+def read_memory(pid):
+    """Field -> kB from /proc/<pid>/smaps_rollup (summed from smaps on older kernels)."""
+    totals = dict.fromkeys(FIELDS, 0)
+    for name in ("smaps_rollup", "smaps"):
+        try:
+            with open(f"/proc/{pid}/{name}") as fh:
+                for line in fh:
+                    key, _, rest = line.partition(":")
+                    if key in totals:
+                        totals[key] += int(rest.split()[0])
+            break
+        except FileNotFoundError:
+            continue
+    else:
+        raise FileNotFoundError(f"No smaps for pid {pid}; is the process running on Linux?")
+
+    totals["USS"] = totals["Private_Clean"] + totals["Private_Dirty"]
+    totals["Shared"] = totals["Shared_Clean"] + totals["Shared_Dirty"]
+    return totals
+
+
+def child_pids(pid):
+    children = []
+    task_dir = f"/proc/{pid}/task"
+    for tid in os.listdir(task_dir):
+        try:
+            with open(os.path.join(task_dir, tid, "children")) as fh:
+                children.extend(int(child) for child in fh.read().split())
+        except FileNotFoundError:
+            continue
+    return sorted(set(children))
+
+
+def process_name(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as fh:
+            return fh.read().replace(b"\0", b" ").decode(errors="replace").strip()[:60]
+    except FileNotFoundError:
+        return "?"
+
+
+def build_report(master_pid):
+    rows = [dict(read_memory(master_pid), pid=master_pid, role="master", cmd=process_name(master_pid))]
+    for pid in child_pids(master_pid):
+        try:
+            rows.append(dict(read_memory(pid), pid=pid, role="worker", cmd=process_name(pid)))
+        except FileNotFoundError:
+            continue  # worker exited while we were reading
+
+    workers = [row for row in rows if row["role"] == "worker"]
+    summary = {
+        "workers": len(workers),
+        "total_pss_mb": round(sum(row["Pss"] for row in rows) / 1024.0, 1),
+        "master_rss_mb": round(rows[0]["Rss"] / 1024.0, 1),
+    }
+    if workers:
+        summary["mean_worker_uss_mb"] = round(sum(row["USS"] for row in workers) / 1024.0 / len(workers), 1)
+        summary["max_worker_uss_mb"] = round(max(row["USS"] for row in workers) / 1024.0, 1)
+    return {"processes": rows, "summary": summary}
+
+
+def print_report(report):
+    print(f"{'pid':>8}  {'role':<7}{'RSS':>10}{'PSS':>10}{'USS':>10}{'shared':>10}  command")
+    for row in report["processes"]:
+        print(
+            f"{row['pid']:>8}  {row['role']:<7}"
+            f"{row['Rss'] / 1024.0:>8.1f}MB{row['Pss'] / 1024.0:>8.1f}MB"
+            f"{row['USS'] / 1024.0:>8.1f}MB{row['Shared'] / 1024.0:>8.1f}MB  {row['cmd']}"
+        )
+    summary = report["summary"]
+    print(f"\nServer footprint (sum of PSS): {summary['total_pss_mb']} MB across {summary['workers']} workers")
+    if summary["workers"]:
+        print(
+            f"Each additional worker costs about {summary['mean_worker_uss_mb']} MB "
+            f"(mean worker USS; max {summary['max_worker_uss_mb']} MB)"
+        )
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Report per-worker memory of a running gunicorn server.")
+    parser.add_argument("--pid", type=int, default=None, help="gunicorn master pid")
+    parser.add_argument("--pidfile", default=os.getenv("GUNICORN_PIDFILE", "gunicorn.pid"))
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv[1:])
+
+    master_pid = args.pid
+    if master_pid is None:
+        try:
+            with open(args.pidfile) as fh:
+                master_pid = int(fh.read().strip())
+        except (FileNotFoundError, ValueError):
+            print(f"Error: no master pid in {args.pidfile}; pass --pid.")
+            return 1
+
+    try:
+        report = build_report(master_pid)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return 1
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
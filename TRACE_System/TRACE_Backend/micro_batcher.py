@@ -0,0 +1,140 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class _PendingItem:
+    __slots__ = ("array", "event", "result", "error")
+
+    def __init__(self, array):
+        self.array = array
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Collect concurrent single-sample calls into one batched forward pass.
+
+    Callers block in submit() while a background thread waits up to
+    `window_ms` for up to `max_batch_size` samples with the same shape,
+    stacks them along axis 0, calls `predict_fn` once and hands each caller
+    its own row of the output.
+
+    With `dispatchers` > 1, that many threads form and run batches from the
+    same queue concurrently; only use it when `predict_fn` is safe to call
+    from several threads (e.g. it hands batches to separate processes).
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, window_ms=10, name="micro-batcher", dispatchers=1):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms) / 1000.0)
+        self.name = name
+        self.dispatchers = max(1, int(dispatchers))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._owner_pid = None
+        self.batches_run = 0
+        self.samples_run = 0
+
+    def set_dispatchers(self, count):
+        """Change how many batches may run at once; extra threads start on the next submit."""
+        self.dispatchers = max(1, int(count))
+
+    def _workers_running(self, pid):
+        return self._owner_pid == pid and sum(thread.is_alive() for thread in self._threads) >= self.dispatchers
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so a pre-forked worker starts its own.
+        pid = os.getpid()
+        if self._workers_running(pid):
+            return
+        with self._lock:
+            if self._workers_running(pid):
+                return
+            if self._owner_pid != pid:
+                self._queue = queue.Queue()
+                self._threads = []
+            self._owner_pid = pid
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.dispatchers:
+                thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-{len(self._threads)}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, array, timeout=None):
+        """Run `predict_fn` on a single sample (no batch axis) and return its output row."""
+        if self.max_batch_size == 1:
+            return np.asarray(self.predict_fn(np.expand_dims(array, axis=0)))[0]
+
+        self._ensure_worker()
+        item = _PendingItem(array)
+        self._queue.put(item)
+        if not item.event.wait(timeout):
+            raise TimeoutError(f"{self.name}: batched inference timed out")
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            batch = self._collect_batch(first)
+
+            # Only samples with identical shapes can be stacked together.
+            groups = {}
+            for item in batch:
+                groups.setdefault((item.array.shape, item.array.dtype.str), []).append(item)
+
+            for items in groups.values():
+                self._run_group(items)
+
+    def _run_group(self, items):
+        try:
+            stacked = np.stack([item.array for item in items], axis=0)
+            outputs = np.asarray(self.predict_fn(stacked))
+            if outputs.shape[0] != len(items):
+                raise ValueError(
+                    f"Batched model returned {outputs.shape[0]} outputs for {len(items)} inputs"
+                )
+            for idx, item in enumerate(items):
+                item.result = outputs[idx]
+            with self._lock:
+                self.batches_run += 1
+                self.samples_run += len(items)
+        except Exception as batch_error:
+            for item in items:
+                item.error = batch_error
+        finally:
+            for item in items:
+                item.event.set()
+
+    def stats(self):
+        return {
+            "maxBatchSize": self.max_batch_size,
+            "dispatchers": self.dispatchers,
+            "windowMs": round(self.window * 1000.0, 3),
+            "batchesRun": self.batches_run,
+            "samplesRun": self.samples_run,
+            "avgBatchSize": round(self.samples_run / self.batches_run, 3) if self.batches_run else 0.0,
+        }
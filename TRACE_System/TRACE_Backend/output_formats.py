@@ -0,0 +1,160 @@
+import json
+import uuid
+
+import cv2
+import numpy as np
+
+
+# Query-string name -> response field.
+OUTPUT_FIELDS = {
+    "processed": "processed_image",
+    "mask": "mask_image",
+    "overlay": "mask_overlay_image",
+}
+IMAGE_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", "image/png", None),
+}
+MASK_FORMATS = ("png", "bitpack", "rle")
+MASK_BITPACK_MIME = "application/vnd.trace.mask-bitpacked"
+MASK_RLE_MIME = "application/vnd.trace.mask-rle+json"
+DEFAULT_QUALITY = 95
+# Request arguments parse_output_spec() reads.
+OUTPUT_SPEC_ARGS = ("outputs", "image_format", "quality", "mask_format")
+
+
+class OutputSpec:
+    """Which hair-removal outputs a client wants and how they are encoded."""
+
+    def __init__(self, outputs=tuple(OUTPUT_FIELDS), image_format="jpeg", quality=DEFAULT_QUALITY, mask_format="png"):
+        self.outputs = tuple(name for name in OUTPUT_FIELDS if name in outputs)
+        self.image_format = image_format
+        self.quality = quality
+        self.mask_format = mask_format
+
+    @property
+    def fields(self):
+        return tuple(OUTPUT_FIELDS[name] for name in self.outputs)
+
+    def wants(self, name):
+        return name in self.outputs
+
+    def cache_token(self):
+        return f"{','.join(self.outputs)}|{self.image_format}|{self.quality}|{self.mask_format}"
+
+    def describe(self):
+        return {
+            "outputs": list(self.outputs),
+            "image_format": self.image_format,
+            "quality": self.quality,
+            "mask_format": self.mask_format,
+        }
+
+
+DEFAULT_OUTPUT_SPEC = OutputSpec()
+
+
+def parse_output_spec(args):
+    """Build an OutputSpec from request args; raises ValueError with a client-facing message."""
+    outputs = args.get("outputs")
+    if outputs:
+        names = [name.strip().lower() for name in outputs.split(",") if name.strip()]
+        unknown = [name for name in names if name not in OUTPUT_FIELDS]
+        if unknown or not names:
+            raise ValueError(f"Unknown outputs: {', '.join(unknown) or outputs}. Choose from: {', '.join(OUTPUT_FIELDS)}")
+    else:
+        names = list(OUTPUT_FIELDS)
+
+    image_format = (args.get("image_format") or "jpeg").lower()
+    if image_format == "jpg":
+        image_format = "jpeg"
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image_format '{image_format}'. Choose from: {', '.join(IMAGE_FORMATS)}")
+
+    try:
+        quality = int(args.get("quality", DEFAULT_QUALITY))
+    except (TypeError, ValueError):
+        raise ValueError("quality must be an integer between 1 and 100")
+    if not 1 <= quality <= 100:
+        raise ValueError("quality must be an integer between 1 and 100")
+    if image_format == "png":
+        quality = DEFAULT_QUALITY  # lossless; keep cache keys from splitting on an ignored value
+
+    mask_format = (args.get("mask_format") or "png").lower()
+    if mask_format not in MASK_FORMATS:
+        raise ValueError(f"Unsupported mask_format '{mask_format}'. Choose from: {', '.join(MASK_FORMATS)}")
+
+    return OutputSpec(names, image_format, quality, mask_format)
+
+
+def encode_color_image(image, spec):
+    ext, mime, quality_flag = IMAGE_FORMATS[spec.image_format]
+    params = [quality_flag, spec.quality] if quality_flag is not None else []
+    ok, encoded = cv2.imencode(ext, image, params)
+    if not ok:
+        raise RuntimeError(f"Failed to encode {spec.image_format} image")
+    return {"mime": mime, "data": encoded.tobytes()}
+
+
+def rle_counts(mask):
+    """Row-major run lengths of a binary mask, starting with a (possibly empty) run of zeros."""
+    flat = (np.asarray(mask) > 0).ravel()
+    if flat.size == 0:
+        return []
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate(([0], change, [flat.size]))
+    counts = np.diff(bounds).tolist()
+    if flat[0]:
+        counts.insert(0, 0)
+    return counts
+
+
+def encode_mask(mask, spec):
+    height, width = mask.shape[:2]
+    if spec.mask_format == "png":
+        ok, encoded = cv2.imencode(".png", mask)
+        if not ok:
+            raise RuntimeError("Failed to encode mask")
+        return {"mime": "image/png", "data": encoded.tobytes()}
+    if spec.mask_format == "bitpack":
+        # One bit per pixel, row-major, most significant bit first.
+        data = np.packbits((mask > 0).ravel()).tobytes()
+        return {"mime": MASK_BITPACK_MIME, "data": data, "size": [height, width]}
+    data = json.dumps({"size": [height, width], "counts": rle_counts(mask)}, separators=(",", ":")).encode()
+    return {"mime": MASK_RLE_MIME, "data": data, "size": [height, width]}
+
+
+def is_image_mime(mime):
+    return mime.startswith("image/")
+
+
+def build_multipart(payload, images, boundary=None):
+    """multipart/mixed body: the JSON payload first, then one binary part per output.
+
+    Returns (body_bytes, content_type).
+    """
+    boundary = boundary or uuid.uuid4().hex
+    chunks = []
+
+    def part(headers, data):
+        chunks.append(f"--{boundary}\r\n".encode())
+        for name, value in headers:
+            chunks.append(f"{name}: {value}\r\n".encode())
+        chunks.append(b"\r\n")
+        chunks.append(data)
+        chunks.append(b"\r\n")
+
+    part([("Content-Type", "application/json"), ("Content-Disposition", 'inline; name="payload"')],
+         json.dumps(payload).encode())
+    for field, image in images.items():
+        headers = [
+            ("Content-Type", image["mime"]),
+            ("Content-Disposition", f'inline; name="{field}"'),
+            ("Content-Length", str(len(image["data"]))),
+        ]
+        if image.get("size"):
+            headers.append(("X-Mask-Size", f"{image['size'][1]}x{image['size'][0]}"))  # WxH
+        part(headers, image["data"])
+    chunks.append(f"--{boundary}--\r\n".encode())
+    return b"".join(chunks), f"multipart/mixed; boundary={boundary}"
@@ -0,0 +1,92 @@
+import base64
+import datetime
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+# Newest first, with _id breaking ties between records created in the same millisecond.
+KEYSET_SORT = [("created_at", -1), ("_id", -1)]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(doc):
+    """Opaque cursor pointing just after `doc`, or None if it cannot be positioned."""
+    created_at = doc.get("created_at")
+    if not isinstance(created_at, datetime.datetime):
+        return None
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    millis = int((created_at - datetime.datetime(1970, 1, 1)).total_seconds() * 1000)
+    raw = f"{millis}:{doc['_id']}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        millis, oid = base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii").split(":", 1)
+        created_at = datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=int(millis))
+        return created_at, ObjectId(oid)
+    except (ValueError, InvalidId, UnicodeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def keyset_filter(query, cursor):
+    """Restrict `query` to records strictly after `cursor` in KEYSET_SORT order."""
+    if not cursor:
+        return dict(query)
+    created_at, oid = decode_cursor(cursor)
+    after = {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": oid}},
+    ]}
+    return {"$and": [query, after]} if query else after
+
+
+def parse_projection(fields_param, allowed_fields):
+    """Turn a comma-separated `fields` parameter into a Mongo projection.
+
+    `created_at` and `_id` are always returned because the cursor and the
+    date formatting depend on them. Returns None when no fields were requested.
+    """
+    if not fields_param:
+        return None
+    requested = {field.strip() for field in fields_param.split(",") if field.strip()}
+    unknown = requested - set(allowed_fields)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    projection = {field: 1 for field in requested}
+    projection["created_at"] = 1
+    return projection
+
+
+def fetch_page(collection, query, limit, cursor=None, projection=None):
+    """Return (records, next_cursor) for one page in KEYSET_SORT order."""
+    records = list(
+        collection.find(keyset_filter(query, cursor), projection)
+        .sort(KEYSET_SORT)
+        .limit(limit + 1)
+    )
+    return _split_page(records, limit)
+
+
+async def fetch_page_async(collection, query, limit, cursor=None, projection=None):
+    """fetch_page() for a pymongo AsyncCollection."""
+    records = await (
+        collection.find(keyset_filter(query, cursor), projection)
+        .sort(KEYSET_SORT)
+        .limit(limit + 1)
+        .to_list(None)
+    )
+    return _split_page(records, limit)
+
+
+def _split_page(records, limit):
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1])
+    return records, next_cursor
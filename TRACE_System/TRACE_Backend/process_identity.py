@@ -0,0 +1,56 @@
+import os
+
+STILL_ACTIVE = 259
+
+
+def _windows_start_time(pid):
+    import ctypes
+
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not handle:
+        return None
+    try:
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        if exit_code.value != STILL_ACTIVE:
+            return None
+        created, exited, kernel, user = (ctypes.c_ulonglong() for _ in range(4))
+        kernel32.GetProcessTimes(
+            handle, ctypes.byref(created), ctypes.byref(exited), ctypes.byref(kernel), ctypes.byref(user)
+        )
+        return created.value
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def process_start_time(pid):
+    """Start time of a running process (opaque integer), or None if it is not running.
+
+    A pid is reused once its process exits, so (pid, start time) is what
+    identifies a process across restarts. Where neither /proc nor the Windows
+    API is available only liveness is known and every running process reports 0.
+    """
+    if os.name == "nt":
+        # os.kill(pid, 0) would send CTRL_C_EVENT on Windows.
+        return _windows_start_time(pid)
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as fh:
+            stat = fh.read()
+        # Field 22 (starttime), counted after the parenthesised command name.
+        return int(stat.rsplit(b")", 1)[1].split()[19])
+    except FileNotFoundError:
+        if os.path.exists("/proc/self/stat"):
+            return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass
+    return 0
+
+
+def process_is_running(pid, start_time):
+    """True while the process that had `pid` at `start_time` has not exited."""
+    return process_start_time(pid) == start_time
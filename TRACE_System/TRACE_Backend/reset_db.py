@@ -18,6 +18,7 @@ def reset_database():
         db["admins"].drop()
         db["pending_users"].drop()
         db["password_resets"].drop()
+        db["counters"].drop()
         
         print("Success: Database has been completely reset.")
     else:
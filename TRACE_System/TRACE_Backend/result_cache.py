@@ -0,0 +1,254 @@
+import os
+import time
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+
+import bson
+
+
+# Mongo refuses documents above 16 MB; leave headroom for the envelope.
+MONGO_MAX_VALUE_BYTES = 15 * 1024 * 1024
+
+
+def make_cache_key(image_bytes, *settings):
+    """Content hash of the upload combined with every setting that changes the output."""
+    digest = hashlib.sha256(image_bytes)
+    for item in settings:
+        digest.update(b"\0")
+        digest.update(str(item).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def value_size(value):
+    size = 0
+    for image in value.get("images", {}).values():
+        size += len(image.get("data") or b"")
+    return size + 1024
+
+
+class LRUCacheTier:
+    """In-process LRU bounded by the total size of the cached image bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max(0, int(max_bytes))
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = value_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._total -= self._sizes.pop(key)
+                del self._items[key]
+            self._items[key] = value
+            self._sizes[key] = size
+            self._total += size
+            while self._total > self.max_bytes and self._items:
+                old_key, _ = self._items.popitem(last=False)
+                self._total -= self._sizes.pop(old_key)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._total, "maxBytes": self.max_bytes}
+
+
+class MongoCacheTier:
+    """Persistent tier in a Mongo collection, evicting least recently used entries by size.
+
+    The collection's total size is tracked in memory: one aggregate at first
+    use, then adjusted on every put and delete. Other processes write to the
+    same collection, so the total is recomputed every `resync_seconds`, and
+    eviction goes down to `low_watermark` of the limit to leave headroom.
+    """
+
+    def __init__(self, collection, max_bytes, resync_seconds=300.0, low_watermark=0.9):
+        self.collection = collection
+        self.max_bytes = max(0, int(max_bytes))
+        self.resync_seconds = resync_seconds
+        self.low_watermark = low_watermark
+        self._lock = threading.Lock()
+        self._total = None
+        self._synced_at = 0.0
+
+    def get(self, key):
+        doc = self.collection.find_one_and_update(
+            {"_id": key},
+            {"$set": {"last_access": datetime.datetime.utcnow()}},
+            projection={"value": 1}
+        )
+        if not doc:
+            return None
+        return doc["value"]
+
+    def put(self, key, value):
+        size = value_size(value)
+        if size > min(self.max_bytes, MONGO_MAX_VALUE_BYTES):
+            return
+        now = datetime.datetime.utcnow()
+        previous = self.collection.find_one_and_replace(
+            {"_id": key},
+            {"value": value, "size": size, "created_at": now, "last_access": now},
+            projection={"size": 1},
+            upsert=True
+        )
+        if self._adjust_total(size - (previous or {}).get("size", 0)) > self.max_bytes:
+            self._evict()
+
+    def _stored_bytes(self):
+        totals = list(self.collection.aggregate([{"$group": {"_id": None, "total": {"$sum": "$size"}}}]))
+        return totals[0]["total"] if totals else 0
+
+    def _adjust_total(self, delta):
+        with self._lock:
+            stale = self._total is None or time.monotonic() - self._synced_at > self.resync_seconds
+            if not stale:
+                self._total += delta
+                return self._total
+        total = self._stored_bytes()  # already includes this put
+        with self._lock:
+            self._total = total
+            self._synced_at = time.monotonic()
+            return total
+
+    def _evict(self):
+        target = int(self.max_bytes * self.low_watermark)
+        for doc in self.collection.find({}, {"size": 1}).sort("last_access", 1):
+            # Another process may have evicted it already; only count our own deletes.
+            if self.collection.delete_one({"_id": doc["_id"]}).deleted_count:
+                with self._lock:
+                    self._total -= doc.get("size", 0)
+                    if self._total <= target:
+                        break
+
+    def stats(self):
+        return {
+            "entries": self.collection.estimated_document_count(),
+            "bytes": self._total,
+            "maxBytes": self.max_bytes,
+        }
+
+
+class DiskCacheTier:
+    """Persistent tier as one file per key, evicting by least recent access time."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._total = sum(size for _path, size, _mtime in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.bson")
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".bson"):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fh:
+                value = bson.decode(fh.read())
+            os.utime(path, None)
+            return value
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, value):
+        payload = bson.encode(value)
+        if len(payload) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(payload)
+        with self._lock:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._total += len(payload) - previous
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda item: item[2])
+        self._total = sum(size for _path, size, _mtime in entries)
+        for path, size, _mtime in entries:
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self._total -= size
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {"bytes": self._total, "maxBytes": self.max_bytes, "directory": self.directory}
+
+
+class HairResultCache:
+    """Two-tier cache: a process-local LRU in front of an optional shared persistent tier.
+
+    Tier failures are logged and treated as misses so the cache can never
+    fail a prediction.
+    """
+
+    def __init__(self, memory_tier=None, persistent_tier=None):
+        self.memory_tier = memory_tier
+        self.persistent_tier = persistent_tier
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.memory_tier is not None or self.persistent_tier is not None
+
+    def get(self, key):
+        value = self.memory_tier.get(key) if self.memory_tier is not None else None
+        if value is None and self.persistent_tier is not None:
+            try:
+                value = self.persistent_tier.get(key)
+            except Exception as e:
+                print(f"Hair cache read error: {e}")
+                value = None
+            if value is not None and self.memory_tier is not None:
+                self.memory_tier.put(key, value)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.memory_tier is not None:
+            self.memory_tier.put(key, value)
+        if self.persistent_tier is not None:
+            try:
+                self.persistent_tier.put(key, value)
+            except Exception as e:
+                print(f"Hair cache write error: {e}")
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory": self.memory_tier.stats() if self.memory_tier is not None else None,
+            "persistent": self.persistent_tier.stats() if self.persistent_tier is not None else None
+        }
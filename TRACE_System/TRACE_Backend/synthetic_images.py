@@ -0,0 +1,40 @@
+import cv2
+import numpy as np
+
+
+def make_synthetic_dermoscopic_image(height=256, width=None, seed=0, strands=24):
+    """Deterministic skin-toned image with a pigmented lesion and dark hair strands.
+
+    Used for model warmup and for calibrating/checking converted models when
+    no real images are at hand.
+    """
+    width = width or height
+    rng = np.random.default_rng(seed)
+
+    base = np.array([120, 150, 200], dtype=np.float32) + rng.normal(0, 6, size=3)
+    image = np.empty((height, width, 3), dtype=np.float32)
+    image[:] = base
+    image += rng.normal(0, 4, size=(height, width, 1))
+
+    center = (int(width * rng.uniform(0.4, 0.6)), int(height * rng.uniform(0.4, 0.6)))
+    axes = (max(2, int(width * rng.uniform(0.15, 0.25))), max(2, int(height * rng.uniform(0.15, 0.25))))
+    lesion_color = tuple(float(c) for c in (base * 0.5))
+    cv2.ellipse(image, center, axes, float(rng.uniform(0, 180)), 0, 360, lesion_color, -1)
+    image = cv2.GaussianBlur(image, (0, 0), sigmaX=max(1.0, min(height, width) / 200.0))
+
+    thickness = max(1, min(height, width) // 256)
+    for _ in range(strands):
+        points = [(int(rng.uniform(0, width)), int(rng.uniform(0, height)))]
+        angle = rng.uniform(0, 2 * np.pi)
+        step = max(height, width) / 12.0
+        for _segment in range(6):
+            angle += rng.normal(0, 0.25)
+            x, y = points[-1]
+            points.append((int(x + step * np.cos(angle)), int(y + step * np.sin(angle))))
+        shade = float(rng.uniform(10, 40))
+        cv2.polylines(
+            image, [np.array(points, dtype=np.int32)], False,
+            (shade, shade, shade), thickness, lineType=cv2.LINE_AA
+        )
+
+    return np.clip(image, 0, 255).astype(np.uint8)
@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+import pytest
+
+from output_formats import MASK_BITPACK_MIME, MASK_RLE_MIME, OutputSpec, encode_mask, rle_counts
+
+BITPACK = OutputSpec(mask_format="bitpack")
+RLE = OutputSpec(mask_format="rle")
+
+
+# Decoders written from the documented wire format, the way a client would.
+def decode_bitpack(data, size):
+    height, width = size
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=height * width)
+    return bits.reshape(height, width).astype(bool)
+
+
+def decode_rle(data):
+    payload = json.loads(data)
+    height, width = payload["size"]
+    flat = np.zeros(height * width, dtype=bool)
+    position, value = 0, False
+    for count in payload["counts"]:
+        flat[position:position + count] = value
+        position += count
+        value = not value
+    assert position == height * width
+    return flat.reshape(height, width)
+
+
+def random_mask(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.where(rng.random((height, width)) < 0.3, 255, 0).astype(np.uint8)
+
+
+MASKS = {
+    "odd_width": random_mask(5, 13),
+    "odd_both": random_mask(7, 9, seed=1),
+    "single_row": random_mask(1, 3, seed=2),
+    "all_zero": np.zeros((6, 11), dtype=np.uint8),
+    "all_one": np.full((6, 11), 255, dtype=np.uint8),
+}
+
+
+@pytest.mark.parametrize("name", MASKS)
+def test_bitpack_round_trip(name):
+    mask = MASKS[name]
+    encoded = encode_mask(mask, BITPACK)
+    assert encoded["mime"] == MASK_BITPACK_MIME
+    assert encoded["size"] == list(mask.shape)
+    assert len(encoded["data"]) == (mask.size + 7) // 8
+    assert np.array_equal(decode_bitpack(encoded["data"], encoded["size"]), mask > 0)
+
+
+@pytest.mark.parametrize("name", MASKS)
+def test_rle_round_trip(name):
+    mask = MASKS[name]
+    encoded = encode_mask(mask, RLE)
+    assert encoded["mime"] == MASK_RLE_MIME
+    assert encoded["size"] == list(mask.shape)
+    assert np.array_equal(decode_rle(encoded["data"]), mask > 0)
+
+
+def test_bitpack_is_row_major_msb_first_with_zero_padding():
+    mask = np.array([[1, 0, 0], [0, 0, 0], [0, 0, 1]], dtype=np.uint8) * 255
+    # Bits 100 000 001 -> 10000000 1(0000000)
+    assert encode_mask(mask, BITPACK)["data"] == bytes([0b10000000, 0b10000000])
+
+
+def test_rle_counts_start_with_background():
+    assert rle_counts(np.array([[0, 0, 255], [255, 255, 0]])) == [2, 3, 1]
+    assert rle_counts(np.array([[255, 0]])) == [0, 1, 1]
+    assert rle_counts(np.zeros((2, 3))) == [6]
+    assert rle_counts(np.ones((2, 3))) == [0, 6]
+
+
+def test_rle_payload_is_compact_json():
+    data = encode_mask(np.array([[0, 255]], dtype=np.uint8), RLE)["data"]
+    assert data == b'{"size":[1,2],"counts":[1,1]}'
@@ -0,0 +1,72 @@
+import base64
+import datetime
+
+import pytest
+from bson.objectid import ObjectId
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, fetch_page, keyset_filter
+
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2024, 5, 1, 12, 30, 15, 123000)
+    oid = ObjectId()
+    assert decode_cursor(encode_cursor({"created_at": created_at, "_id": oid})) == (created_at, oid)
+
+
+def test_cursor_truncates_to_milliseconds_and_normalizes_timezones():
+    aware = datetime.datetime(2024, 5, 1, 14, 30, 15, 123456, tzinfo=datetime.timezone(datetime.timedelta(hours=2)))
+    oid = ObjectId()
+    created_at, _ = decode_cursor(encode_cursor({"created_at": aware, "_id": oid}))
+    assert created_at == datetime.datetime(2024, 5, 1, 12, 30, 15, 123000)
+
+
+def test_cursor_needs_a_datetime():
+    assert encode_cursor({"created_at": "2024-05-01", "_id": ObjectId()}) is None
+    assert encode_cursor({"_id": ObjectId()}) is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"1714566615123").decode("ascii"),
+    base64.urlsafe_b64encode(b"abc:" + str(ObjectId()).encode("ascii")).decode("ascii"),
+    base64.urlsafe_b64encode(b"1714566615123:not-an-object-id").decode("ascii"),
+    base64.urlsafe_b64encode(b"\xff\xfe:\x00").decode("ascii"),
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+    with pytest.raises(InvalidCursor):
+        keyset_filter({"user_id": "u1"}, cursor)
+
+
+def test_keyset_filter_breaks_timestamp_ties_on_id():
+    created_at = datetime.datetime(2024, 5, 1, 12, 0, 0)
+    oid = ObjectId()
+    query = keyset_filter({"user_id": "u1"}, encode_cursor({"created_at": created_at, "_id": oid}))
+    assert query == {"$and": [{"user_id": "u1"}, {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": oid}},
+    ]}]}
+
+
+def test_keyset_filter_without_cursor_copies_the_query():
+    query = {"user_id": "u1"}
+    assert keyset_filter(query, None) == query
+    assert keyset_filter(query, None) is not query
+
+
+def test_pages_walk_equal_timestamps_without_gaps_or_repeats():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.analyses
+    same_time = datetime.datetime(2024, 5, 1, 12, 0, 0)
+    ids = [collection.insert_one({"user_id": "u1", "created_at": same_time}).inserted_id for _ in range(7)]
+    collection.insert_one({"user_id": "u2", "created_at": same_time})
+
+    seen, cursor = [], None
+    while True:
+        records, cursor = fetch_page(collection, {"user_id": "u1"}, 3, cursor)
+        seen.extend(record["_id"] for record in records)
+        if cursor is None:
+            break
+
+    assert seen == sorted(ids, reverse=True)
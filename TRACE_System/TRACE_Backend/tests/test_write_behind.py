@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+
+import pytest
+from bson.objectid import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from process_identity import process_start_time
+from write_behind import DUPLICATE_KEY, REJECTED_FILE, WriteBehindBuffer, encode_document, read_segment
+
+
+class FakeCollection:
+    """insert_many() stand-in: fails while `outages` lasts, then applies `write_errors` once."""
+
+    def __init__(self, outages=0, write_errors=None):
+        self.documents = []
+        self.calls = 0
+        self.outages = outages
+        self.write_errors = write_errors or {}
+        self._lock = threading.Lock()
+
+    def insert_many(self, documents, ordered=True):
+        with self._lock:
+            self.calls += 1
+            if self.outages:
+                self.outages -= 1
+                raise AutoReconnect("connection refused")
+            errors, self.write_errors = self.write_errors, {}
+            self.documents.extend(doc for index, doc in enumerate(documents) if index not in errors)
+            if errors:
+                raise BulkWriteError({"writeErrors": [
+                    {"index": index, "code": code, "errmsg": f"error {code}"} for index, code in errors.items()
+                ]})
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def segments(spill_dir):
+    return sorted(name for name in os.listdir(spill_dir) if name != REJECTED_FILE)
+
+
+@pytest.fixture
+def make_buffer(tmp_path):
+    buffers = []
+
+    def make(collection, **kwargs):
+        kwargs.setdefault("max_delay_ms", 60000)
+        buffer = WriteBehindBuffer(collection, str(tmp_path), retry_base=0.05, retry_max=0.2, **kwargs)
+        buffers.append(buffer)
+        return buffer
+
+    yield make
+    for buffer in buffers:
+        buffer.close()
+
+
+def test_flushes_when_the_batch_is_full(make_buffer, tmp_path):
+    collection = FakeCollection()
+    buffer = make_buffer(collection, max_batch=3)
+    ids = [buffer.add({"n": n}) for n in range(3)]
+
+    assert wait_until(lambda: len(collection.documents) == 3)
+    assert [doc["_id"] for doc in collection.documents] == ids
+    assert collection.calls == 1
+    assert wait_until(lambda: segments(tmp_path) == [])
+
+
+def test_flushes_after_the_delay(make_buffer):
+    collection = FakeCollection()
+    buffer = make_buffer(collection, max_batch=100, max_delay_ms=50)
+    buffer.add({"n": 1})
+
+    assert collection.documents == []
+    assert wait_until(lambda: len(collection.documents) == 1, timeout=2.0)
+    assert buffer.stats()["pending"] == 0
+
+
+def test_keeps_the_segment_and_retries_while_mongo_is_down(make_buffer, tmp_path):
+    collection = FakeCollection(outages=2)
+    buffer = make_buffer(collection, max_batch=2)
+    buffer.add({"n": 1})
+    buffer.add({"n": 2})
+
+    assert wait_until(lambda: buffer.failures >= 1)
+    assert len(segments(tmp_path)) == 1
+    assert wait_until(lambda: len(collection.documents) == 2)
+    assert buffer.failures == 2
+    assert buffer.inserted == 2
+    assert wait_until(lambda: segments(tmp_path) == [])
+
+
+def test_skips_duplicates_and_sets_aside_rejected_documents(make_buffer, tmp_path):
+    collection = FakeCollection(write_errors={0: DUPLICATE_KEY, 2: 121})
+    buffer = make_buffer(collection, max_batch=3)
+    docs = [{"n": n} for n in range(3)]
+    for doc in docs:
+        buffer.add(doc)
+
+    assert buffer.flush(timeout=5)
+    assert [doc["n"] for doc in collection.documents] == [1]
+    assert (buffer.inserted, buffer.duplicates, buffer.rejected) == (1, 1, 1)
+    assert read_segment(os.path.join(tmp_path, REJECTED_FILE)) == [docs[2]]
+    assert segments(tmp_path) == []
+
+
+def write_orphan(spill_dir, owner, documents):
+    path = os.path.join(spill_dir, f"{owner}-1.jsonl")
+    with open(path, "w", encoding="utf-8") as fh:
+        for document in documents:
+            fh.write(encode_document(document) + "\n")
+        fh.write('{"_id": {"$oid": "torn')  # crash mid-append
+    return path
+
+
+def test_replays_the_segment_of_an_exited_process(make_buffer, tmp_path):
+    pid = os.getpid()
+    # Same pid, different start time: a crashed process whose pid was reused.
+    documents = [{"_id": ObjectId(), "n": n} for n in range(2)]
+    write_orphan(str(tmp_path), f"{pid}-{process_start_time(pid) + 1}-abc123", documents)
+    collection = FakeCollection(write_errors={0: DUPLICATE_KEY})  # the first one landed before the crash
+
+    buffer = make_buffer(collection)
+    buffer.start()
+
+    assert buffer.replayed == 2
+    assert wait_until(lambda: segments(tmp_path) == [])
+    assert collection.documents == documents[1:]
+    assert buffer.duplicates == 1
+
+
+def test_leaves_segments_of_live_buffers_alone(make_buffer, tmp_path):
+    pid = os.getpid()
+    path = write_orphan(str(tmp_path), f"{pid}-{process_start_time(pid)}-abc123", [{"_id": ObjectId()}])
+
+    buffer = make_buffer(FakeCollection())
+    buffer.start()
+
+    assert buffer.replayed == 0
+    assert os.path.exists(path)
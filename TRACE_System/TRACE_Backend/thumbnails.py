@@ -0,0 +1,150 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+THUMBNAIL_MIME = "image/jpeg"
+THUMBNAIL_QUALITY = 80
+# IMREAD_REDUCED_* decode JPEGs at 1/2, 1/4 or 1/8 scale straight from the DCT,
+# which is far cheaper than decoding a full photo only to shrink it.
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def parse_thumbnail_sizes(text):
+    """'64,128,256' -> (64, 128, 256); ignores blanks and non-positive values."""
+    sizes = {int(part) for part in text.split(",") if part.strip() and int(part) > 0}
+    return tuple(sorted(sizes))
+
+
+def fit_within(image, max_side):
+    height, width = image.shape[:2]
+    scale = max_side / float(max(height, width))
+    if scale >= 1.0:
+        return image
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def encode_thumbnail(image, quality=THUMBNAIL_QUALITY):
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("Failed to encode thumbnail")
+    return encoded.tobytes()
+
+
+def decode_for_thumbnail(data, max_side):
+    """Decode encoded image bytes at the smallest scale still >= max_side on the long edge."""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    # The 1/8 decode is cheap and, for full-size photos, usually already big enough.
+    smallest = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_COLOR_8)
+    if smallest is None:
+        return None
+    long_side = max(smallest.shape[:2]) * 8
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        if long_side // factor >= max_side:
+            return smallest if factor == 8 else cv2.imdecode(buffer, flag)
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def make_thumbnail(data, max_side, quality=THUMBNAIL_QUALITY):
+    """Encoded image bytes -> JPEG thumbnail bytes no larger than max_side, or None."""
+    image = decode_for_thumbnail(data, max_side)
+    if image is None:
+        return None
+    return encode_thumbnail(fit_within(image, max_side), quality)
+
+
+class ThumbnailCache:
+    """Bounded directory of rendered thumbnails, evicting by least recent access time.
+
+    Thumbnails are derived from content-addressed artifacts, so an evicted entry
+    is simply rendered again on the next request.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max(0, int(max_bytes))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._total = sum(size for _path, size, _mtime in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.jpg")
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def open(self, key):
+        """Return (binary stream, length) or None on a miss."""
+        path = self._path(key)
+        try:
+            stream = open(path, "rb")
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass  # evicted after we opened it; the open handle still reads fine
+        self.hits += 1
+        return stream, os.fstat(stream.fileno()).st_size
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(data)
+        with self._lock:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._total += len(data) - previous
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda item: item[2])
+        self._total = sum(size for _path, size, _mtime in entries)
+        for path, size, _mtime in entries:
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self._total -= size
+            except FileNotFoundError:
+                pass
+
+    def remove_matching(self, predicate):
+        """Delete every cached thumbnail whose key satisfies `predicate`; returns how many."""
+        removed = 0
+        with self._lock:
+            for path, size, _mtime in list(self._entries()):
+                if not predicate(os.path.basename(path)[:-len(".jpg")]):
+                    continue
+                try:
+                    os.remove(path)
+                    self._total -= size
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def stats(self):
+        return {
+            "bytes": self._total,
+            "maxBytes": self.max_bytes,
+            "directory": self.directory,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,126 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+def plan_tiles(height, width, tile_size, overlap):
+    """Yield (core, padded) boxes as (y0, y1, x0, x1) covering the image in a grid."""
+    for y0 in range(0, height, tile_size):
+        y1 = min(height, y0 + tile_size)
+        for x0 in range(0, width, tile_size):
+            x1 = min(width, x0 + tile_size)
+            padded = (max(0, y0 - overlap), min(height, y1 + overlap),
+                      max(0, x0 - overlap), min(width, x1 + overlap))
+            yield (y0, y1, x0, x1), padded
+
+
+def _ramp(length, start, stop, total, overlap):
+    """1-D feather weights for a padded span; no taper on sides touching the image border."""
+    ramp = np.ones(length, dtype=np.float32)
+    if overlap <= 0:
+        return ramp
+    edge = np.minimum(np.arange(length), np.arange(length)[::-1]).astype(np.float32)
+    taper = np.clip((edge + 1.0) / float(2 * overlap), 0.0, 1.0)
+    if start > 0:
+        ramp[:length // 2] = taper[:length // 2]
+    if stop < total:
+        ramp[length // 2:] = taper[length // 2:]
+    return ramp
+
+
+class TiledInpainter:
+    """Drop-in replacement for cv2.inpaint that splits large frames across cores.
+
+    The image is cut into a grid of tiles, each padded by `overlap` pixels of
+    context. Tiles whose padded area holds no mask pixels are skipped, the rest
+    are inpainted concurrently (OpenCV releases the GIL) and overlapping results
+    are feather-blended so no seams show. Images under `min_pixels` go straight
+    to cv2.inpaint, where the thread hand-off would cost more than it saves.
+    """
+
+    def __init__(self, tile_size=512, overlap=32, max_workers=None, min_pixels=2_000_000):
+        self.tile_size = max(64, int(tile_size))
+        self.overlap = max(0, int(overlap))
+        self.max_workers = max(1, int(max_workers or os.cpu_count() or 1))
+        self.min_pixels = int(min_pixels)
+        self._executor = None
+        self._owner_pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"calls": 0, "tiled_calls": 0, "tiles_total": 0, "tiles_skipped": 0}
+
+    def _get_executor(self):
+        # Pool threads do not survive fork(), so each worker process builds its own.
+        pid = os.getpid()
+        if self._executor is not None and self._owner_pid == pid:
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._owner_pid != pid:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inpaint")
+                self._owner_pid = pid
+            return self._executor
+
+    def _record(self, tiled, total=0, skipped=0):
+        with self._stats_lock:
+            self._stats["calls"] += 1
+            if tiled:
+                self._stats["tiled_calls"] += 1
+                self._stats["tiles_total"] += total
+                self._stats["tiles_skipped"] += skipped
+
+    def inpaint(self, image, mask, radius=3, flags=cv2.INPAINT_TELEA):
+        height, width = mask.shape[:2]
+        if self.max_workers == 1 or height * width < self.min_pixels:
+            self._record(False)
+            return cv2.inpaint(image, mask, radius, flags)
+
+        work = []
+        total = 0
+        for core, padded in plan_tiles(height, width, self.tile_size, self.overlap):
+            total += 1
+            py0, py1, px0, px1 = padded
+            if cv2.countNonZero(mask[py0:py1, px0:px1]):
+                work.append(padded)
+        self._record(True, total, total - len(work))
+
+        output = image.copy()
+        if not work:
+            return output
+
+        def run(padded):
+            py0, py1, px0, px1 = padded
+            return padded, cv2.inpaint(image[py0:py1, px0:px1], mask[py0:py1, px0:px1], radius, flags)
+
+        accum = np.zeros(image.shape, dtype=np.float32)
+        weights = np.zeros((height, width), dtype=np.float32)
+        for padded, tile in self._get_executor().map(run, work):
+            py0, py1, px0, px1 = padded
+            weight = np.outer(
+                _ramp(py1 - py0, py0, py1, height, self.overlap),
+                _ramp(px1 - px0, px0, px1, width, self.overlap)
+            )
+            if tile.ndim == 3:
+                accum[py0:py1, px0:px1] += tile.astype(np.float32) * weight[..., None]
+            else:
+                accum[py0:py1, px0:px1] += tile.astype(np.float32) * weight
+            weights[py0:py1, px0:px1] += weight
+
+        # cv2.inpaint only changes masked pixels, so only those need blending.
+        hair = (mask > 0) & (weights > 0)
+        blended = accum[hair] / (weights[hair][..., None] if accum.ndim == 3 else weights[hair])
+        output[hair] = np.clip(np.round(blended), 0, 255).astype(image.dtype)
+        return output
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "max_workers": self.max_workers,
+            "min_pixels": self.min_pixels,
+        })
+        return stats
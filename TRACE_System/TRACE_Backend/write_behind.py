@@ -0,0 +1,329 @@
+import os
+import re
+import time
+import uuid
+import atexit
+import itertools
+import threading
+
+from bson import json_util
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+
+from process_identity import process_is_running, process_start_time
+
+DUPLICATE_KEY = 11000
+# <pid>-<process start time>-<buffer token>-<number>.jsonl
+SEGMENT_PATTERN = re.compile(r"^(\d+)-(\d+)-([0-9a-f]+)-(\d+)\.jsonl$")
+REJECTED_FILE = "rejected.jsonl"
+# Shared by every buffer in the process so segment names never collide.
+_segment_numbers = itertools.count(1)
+
+
+def encode_document(document):
+    # Canonical extended JSON keeps ObjectIds, datetimes and number types intact.
+    return json_util.dumps(document, json_options=json_util.CANONICAL_JSON_OPTIONS)
+
+
+def read_segment(path):
+    documents = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                documents.append(json_util.loads(line))
+            except ValueError:
+                # A torn last line from a crash mid-write; the request never got a response.
+                print(f"Write-behind: skipping unreadable line in {path}")
+    return documents
+
+
+class WriteBehindBuffer:
+    """Buffer inserts in memory and write them with insert_many from a background thread.
+
+    Every document is first appended to a local spill file, so add() costs a
+    file append instead of a MongoDB round trip. The buffer is flushed once it
+    holds `max_batch` documents or its oldest document is `max_delay_ms` old.
+    Each flushed batch is its own spill segment, deleted only after MongoDB
+    accepted it; segments left by a crashed or stopped process are claimed
+    and written by the next process to start. Segment names carry the owner's
+    pid, process start time and a per-buffer token, so a restarted process that
+    reuses a crashed one's pid still recognises its files as orphans. Ids are
+    assigned client-side, so a replayed document that already landed is
+    skipped as a duplicate key.
+    """
+
+    def __init__(self, collection, spill_dir, max_batch=64, max_delay_ms=250, fsync=False,
+                 on_insert=None, retry_base=1.0, retry_max=60.0, name="write-behind"):
+        self.collection = collection
+        self.spill_dir = spill_dir
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay = max(0.0, float(max_delay_ms) / 1000.0)
+        self.fsync = fsync
+        self.on_insert = on_insert
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.name = name
+        self._cond = threading.Condition()
+        self._thread = None
+        self._owner_pid = None
+        self._owner = None
+        self._reset_state()
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.failures = 0
+        self.replayed = 0
+        self.last_error = None
+        atexit.register(self.close)
+
+    def _reset_state(self):
+        self._buffer = []
+        self._oldest = None
+        self._file = None
+        self._path = None
+        self._sealed = []
+        self._attempts = 0
+        self._retry_at = 0.0
+        self._closing = False
+
+    def start(self):
+        """Start this process's flusher and claim spill segments of processes that have exited."""
+        # Threads do not survive fork(), so each worker process runs its own flusher;
+        # documents inherited from the parent are still covered by the parent's segment.
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._owner_pid == pid:
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive() and self._owner_pid == pid:
+                return
+            if self._owner_pid != pid:
+                self._reset_state()
+                self._owner = f"{pid}-{process_start_time(pid)}-{uuid.uuid4().hex[:12]}"
+            self._owner_pid = pid
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._claim_orphans()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def is_running(self):
+        """True once start() ran in this process and the flusher is alive."""
+        return self._owner_pid == os.getpid() and self._thread is not None and self._thread.is_alive()
+
+    def _next_path(self):
+        return os.path.join(self.spill_dir, f"{self._owner}-{next(_segment_numbers)}.jsonl")
+
+    def _open_segment(self):
+        # Exclusive create: a segment file is only ever written by the buffer that named it.
+        while True:
+            path = self._next_path()
+            try:
+                return path, open(path, "x", encoding="utf-8")
+            except FileExistsError:
+                continue
+
+    def _is_orphan(self, match):
+        pid, start_time, token = int(match.group(1)), int(match.group(2)), match.group(3)
+        if f"{pid}-{start_time}-{token}" == self._owner:
+            return False
+        # Segments of other buffers in live processes are still being written.
+        return not process_is_running(pid, start_time)
+
+    def _claim_orphans(self):
+        for entry in sorted(os.listdir(self.spill_dir)):
+            match = SEGMENT_PATTERN.match(entry)
+            if match is None or not self._is_orphan(match):
+                continue
+            claimed = self._next_path()
+            try:
+                # The rename is atomic, so only one starting process claims each segment.
+                os.rename(os.path.join(self.spill_dir, entry), claimed)
+            except OSError:
+                continue
+            documents = read_segment(claimed)
+            if documents:
+                self._sealed.append((claimed, documents))
+                self.replayed += len(documents)
+                print(f"Write-behind: replaying {len(documents)} documents from {entry}")
+            else:
+                os.remove(claimed)
+
+    def add(self, document):
+        """Queue one document and return its (client-assigned) _id."""
+        document.setdefault("_id", ObjectId())
+        line = encode_document(document) + "\n"
+        self.start()
+        with self._cond:
+            if self._file is None:
+                self._path, self._file = self._open_segment()
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._buffer.append(document)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._cond.notify()  # starts the max_delay clock
+            elif len(self._buffer) >= self.max_batch:
+                self._cond.notify()
+        return document["_id"]
+
+    def _seal(self):
+        """Close the current segment and hand its documents to the flusher (lock held)."""
+        if not self._buffer:
+            return
+        self._file.close()
+        self._sealed.append((self._path, self._buffer))
+        self._buffer = []
+        self._oldest = None
+        self._file = None
+        self._path = None
+
+    def _seal_due(self, now):
+        return bool(self._buffer) and (
+            self._closing or len(self._buffer) >= self.max_batch or now - self._oldest >= self.max_delay
+        )
+
+    def _write_due(self, now):
+        return bool(self._sealed) and (self._closing or now >= self._retry_at)
+
+    def _next_wakeup(self, now):
+        """Seconds until the buffer is due or a retry may run; None when idle (lock held)."""
+        waits = []
+        if self._buffer:
+            waits.append(self._oldest + self.max_delay - now)
+        if self._sealed:
+            waits.append(self._retry_at - now)
+        return max(0.0, min(waits)) if waits else None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    # Keep sealing while MongoDB is down so each segment stays one batch.
+                    if self._seal_due(now):
+                        self._seal()
+                    if self._write_due(now):
+                        break
+                    if self._closing and not self._sealed:
+                        return
+                    self._cond.wait(self._next_wakeup(now))
+                segments = list(self._sealed)
+
+            written = self._write_segments(segments)
+            with self._cond:
+                del self._sealed[:written]
+                if written < len(segments):
+                    self._attempts += 1
+                    delay = min(self.retry_max, self.retry_base * (2 ** (self._attempts - 1)))
+                    self._retry_at = time.monotonic() + delay
+                    if self._closing:
+                        self._cond.notify_all()
+                        return  # the rest stays in the spill files for the next start
+                else:
+                    self._attempts = 0
+                self._cond.notify_all()
+
+    def _write_segments(self, segments):
+        """Insert sealed segments in order; returns how many were fully handled."""
+        for index, (path, documents) in enumerate(segments):
+            try:
+                inserted, rejected = self._insert(documents)
+            except Exception as e:
+                # MongoDB unreachable or timed out: keep the segment and retry with backoff.
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"Write-behind insert failed ({len(documents)} documents kept in {path}): {e}")
+                return index
+
+            if rejected:
+                self._keep_rejected(rejected)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.inserted += len(inserted)
+            if inserted and self.on_insert is not None:
+                try:
+                    self.on_insert(inserted)
+                except Exception as e:
+                    print(f"Write-behind on_insert error: {e}")
+        return len(segments)
+
+    def _insert(self, documents):
+        """insert_many(ordered=False); returns (newly inserted, permanently rejected) documents."""
+        try:
+            self.collection.insert_many(documents, ordered=False)
+            return documents, []
+        except BulkWriteError as e:
+            errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+            inserted = [doc for index, doc in enumerate(documents) if index not in errors]
+            rejected = []
+            for index, error in errors.items():
+                if error.get("code") == DUPLICATE_KEY:
+                    self.duplicates += 1  # already written before a crash or a retried batch
+                else:
+                    rejected.append(documents[index])
+                    self.last_error = error.get("errmsg", str(error))
+            return inserted, rejected
+
+    def _keep_rejected(self, documents):
+        self.rejected += len(documents)
+        path = os.path.join(self.spill_dir, REJECTED_FILE)
+        print(f"Write-behind: {len(documents)} documents rejected by MongoDB, saved to {path}")
+        with open(path, "a", encoding="utf-8") as fh:
+            for document in documents:
+                fh.write(encode_document(document) + "\n")
+
+    def flush(self, timeout=None):
+        """Write everything buffered now; returns True once nothing is pending."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self._owner_pid != os.getpid():
+                return not self._buffer and not self._sealed
+            self._seal()
+            self._retry_at = 0.0
+            self._cond.notify_all()
+            while self._sealed and self._thread is not None and self._thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return not self._sealed
+
+    def close(self, timeout=5.0):
+        """Flush and stop the flusher; anything unwritten stays in the spill files."""
+        with self._cond:
+            if self._owner_pid != os.getpid() or self._thread is None:
+                return
+            self._closing = True
+            self._retry_at = 0.0
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        with self._cond:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._buffer) + sum(len(documents) for _path, documents in self._sealed)
+            buffer_age_ms = None
+            if self._oldest is not None:
+                buffer_age_ms = round((time.monotonic() - self._oldest) * 1000.0, 1)
+        return {
+            "pending": pending,
+            "bufferAgeMs": buffer_age_ms,
+            "maxBatch": self.max_batch,
+            "maxDelayMs": round(self.max_delay * 1000.0),
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "replayed": self.replayed,
+            "lastError": self.last_error,
+            "spillDir": self.spill_dir,
+        }
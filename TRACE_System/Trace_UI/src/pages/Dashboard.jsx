@@ -1,4 +1,4 @@
-import React, { useEffect, useMemo, useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { Link } from 'react-router-dom';
 import { UploadCloud, Activity, Clock, AlertCircle, ArrowRight, Scissors, ShieldAlert } from 'lucide-react';
 import DashboardLayout from '../components/DashboardLayout';
@@ -6,7 +6,7 @@ import DashboardLayout from '../components/DashboardLayout';
 const Dashboard = () => {
   const [userName, setUserName] = useState('Loading...');
   const [userRole, setUserRole] = useState('User');
-  const [history, setHistory] = useState([]);
+  const [summary, setSummary] = useState({ totalScans: 0, preprocessed: 0, flagged: 0, pending: 0, recent: [] });
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState('');
 
@@ -30,7 +30,7 @@ const Dashboard = () => {
           return;
         }
 
-        const response = await fetch('http://127.0.0.1:5000/api/history', {
+        const response = await fetch('http://127.0.0.1:5000/api/history/summary?recent=6', {
           headers: { Authorization: `Bearer ${token}` }
         });
 
@@ -40,9 +40,14 @@ const Dashboard = () => {
         }
 
         const data = await response.json();
-        const list = Array.isArray(data) ? data : [];
-        const sorted = [...list].sort((a, b) => toEpoch(b) - toEpoch(a));
-        setHistory(sorted);
+        const recent = Array.isArray(data?.recent) ? data.recent : [];
+        setSummary({
+          totalScans: data?.totalScans ?? 0,
+          preprocessed: data?.preprocessed ?? 0,
+          flagged: data?.flagged ?? 0,
+          pending: data?.pending ?? 0,
+          recent: [...recent].sort((a, b) => toEpoch(b) - toEpoch(a))
+        });
       } catch (fetchError) {
         console.error('Failed to fetch dashboard data:', fetchError);
         setError(fetchError.message || 'Failed to fetch dashboard data.');
@@ -54,15 +59,8 @@ const Dashboard = () => {
     fetchDashboardData();
   }, []);
 
-  const stats = useMemo(() => {
-    const totalScans = history.length;
-    const preprocessed = history.filter((item) => (item?.status || '').toLowerCase() === 'hair_processed_only').length;
-    const flagged = history.filter((item) => item?.result === 'Malignant (Cancerous)').length;
-    const pending = history.filter((item) => (item?.status || '').toLowerCase() === 'pending').length;
-    return { totalScans, preprocessed, flagged, pending };
-  }, [history]);
-
-  const recentScans = useMemo(() => history.slice(0, 6), [history]);
+  const stats = summary;
+  const recentScans = summary.recent;
 
   const statusPill = (item) => {
     const status = (item?.status || '').toLowerCase();
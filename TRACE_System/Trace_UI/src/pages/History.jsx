@@ -32,23 +32,41 @@ const History = () => {
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
   const [error, setError] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [summary, setSummary] = useState(null);
+
+  const fetchHistoryPage = async (cursor = null) => {
+    const token = localStorage.getItem('token');
+    if (!token) {
+      setHistory([]);
+      setError('Please login to view history.');
+      return;
+    }
+
+    const headers = { Authorization: `Bearer ${token}` };
+    const res = await axios.get('http://127.0.0.1:5000/api/history', {
+      headers,
+      params: cursor ? { cursor } : {}
+    });
+    if (!cursor) {
+      // Totals come from the server so they cover records that are not loaded yet.
+      axios.get('http://127.0.0.1:5000/api/history/summary', { headers, params: { recent: 1 } })
+        .then((summaryRes) => setSummary(summaryRes.data || null))
+        .catch((err) => console.error('Failed to fetch history summary:', err));
+    }
+    const list = Array.isArray(res.data) ? res.data : [];
+    setHistory((prev) => {
+      const merged = cursor ? [...prev, ...list] : list;
+      return [...merged].sort((a, b) => toEpoch(b) - toEpoch(a));
+    });
+    setNextCursor(res.headers?.['x-next-cursor'] || null);
+  };
 
   useEffect(() => {
     const fetchHistory = async () => {
       try {
-        const token = localStorage.getItem('token');
-        if (!token) {
-          setHistory([]);
-          setError('Please login to view history.');
-          return;
-        }
-
-        const res = await axios.get('http://127.0.0.1:5000/api/history', {
-          headers: { Authorization: `Bearer ${token}` }
-        });
-        const list = Array.isArray(res.data) ? res.data : [];
-        const sorted = [...list].sort((a, b) => toEpoch(b) - toEpoch(a));
-        setHistory(sorted);
+        await fetchHistoryPage();
       } catch (err) {
         console.error('Failed to fetch history:', err);
         setHistory([]);
@@ -61,6 +79,19 @@ const History = () => {
     fetchHistory();
   }, []);
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      await fetchHistoryPage(nextCursor);
+    } catch (err) {
+      console.error('Failed to fetch more history:', err);
+      setError(err?.response?.data?.error || 'Unable to load more history records.');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const filteredHistory = useMemo(() => {
     const q = searchTerm.trim().toLowerCase();
     if (!q) return history;
@@ -77,9 +108,9 @@ const History = () => {
     });
   }, [history, searchTerm]);
 
-  const total = history.length;
-  const flagged = history.filter((item) => item?.result === 'Malignant (Cancerous)').length;
-  const preprocessed = history.filter((item) => (item?.status || '').toLowerCase() === 'hair_processed_only').length;
+  const total = summary?.totalScans ?? history.length;
+  const flagged = summary?.flagged ?? history.filter((item) => item?.result === 'Malignant (Cancerous)').length;
+  const preprocessed = summary?.preprocessed ?? history.filter((item) => (item?.status || '').toLowerCase() === 'hair_processed_only').length;
 
   const downloadRecord = (item) => {
     const blob = new Blob([JSON.stringify(item, null, 2)], { type: 'application/json' });
@@ -131,6 +162,7 @@ const History = () => {
             <table className="w-full text-left min-w-[760px]">
               <thead className="bg-slate-50 border-b border-slate-200 text-slate-500 text-xs font-bold uppercase tracking-wider">
                 <tr>
+                  <th className="px-6 py-4 whitespace-nowrap">Preview</th>
                   <th className="px-6 py-4 whitespace-nowrap">Date Scanned</th>
                   <th className="px-6 py-4 whitespace-nowrap">Diagnosis</th>
                   <th className="px-6 py-4 whitespace-nowrap">Result</th>
@@ -142,7 +174,7 @@ const History = () => {
               <tbody className="divide-y divide-slate-50">
                 {loading ? (
                   <tr>
-                    <td colSpan="6" className="px-6 py-12 text-center text-slate-400">
+                    <td colSpan="7" className="px-6 py-12 text-center text-slate-400">
                       <div className="flex justify-center items-center gap-2">
                         <span className="w-4 h-4 border-2 border-slate-300 border-t-blue-500 rounded-full animate-spin"></span>
                         Loading records...
@@ -151,7 +183,7 @@ const History = () => {
                   </tr>
                 ) : filteredHistory.length === 0 ? (
                   <tr>
-                    <td colSpan="6" className="px-6 py-12 text-center">
+                    <td colSpan="7" className="px-6 py-12 text-center">
                       <div className="flex flex-col items-center justify-center text-slate-400">
                         <div className="w-12 h-12 bg-slate-50 rounded-full flex items-center justify-center mb-3">
                           <AlertCircle size={24} />
@@ -166,6 +198,9 @@ const History = () => {
                     const meta = statusMeta(item);
                     return (
                       <tr key={item._id} className="hover:bg-slate-50/80 transition-colors">
+                        <td className="px-6 py-3">
+                          <Thumbnail item={item} />
+                        </td>
                         <td className="px-6 py-4 text-sm text-slate-600 whitespace-nowrap">
                           <span className="inline-flex items-center gap-2">
                             <Calendar size={16} className="text-slate-400" />
@@ -203,12 +238,41 @@ const History = () => {
               </tbody>
             </table>
           </div>
+          {nextCursor && !loading && (
+            <div className="px-6 py-4 border-t border-slate-100 flex justify-center">
+              <button
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="text-sm font-semibold text-blue-600 hover:underline disabled:text-slate-400 disabled:no-underline"
+              >
+                {loadingMore ? 'Loading...' : 'Load more'}
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </DashboardLayout>
   );
 };
 
+// Server-rendered thumbnails are a few KB each, so long lists stay light.
+const Thumbnail = ({ item }) => {
+  const src = item?.thumbnails?.processed || item?.thumbnails?.original || item?.thumbnails?.overlay;
+  if (!src) {
+    return <div className="w-12 h-12 rounded-lg bg-slate-100 border border-slate-200" />;
+  }
+  return (
+    <img
+      src={src}
+      alt="Scan preview"
+      loading="lazy"
+      width={48}
+      height={48}
+      className="w-12 h-12 rounded-lg object-cover border border-slate-200 bg-slate-100"
+    />
+  );
+};
+
 const SummaryCard = ({ icon, label, value }) => (
   <div className="bg-white border border-slate-200 rounded-xl p-4 shadow-sm">
     <div className="flex items-center gap-2 text-slate-500 mb-1">